@@ -0,0 +1,233 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import argparse
+import contextlib
+import datetime
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# scenario name -> config overrides
+scenarios = {
+    'sequential': {
+        'pipeline': {'enable': False},
+        'prefetch': {'enable': False}
+    },
+    'prefetch': {
+        'pipeline': {'enable': False},
+        'prefetch': {'enable': True}
+    },
+    'pipeline': {
+        'pipeline': {'enable': True}
+    },
+    'batched': {
+        'pipeline': {'enable': True},
+        'layout_extraction': {'batch_size': 4},
+        'line_ocr': {'batch_lines': 256, 'max_pages_in_flight': 4}
+    },
+    'dump': {
+        'pipeline': {'enable': True},
+        'dump': True
+    },
+    'dump_sampled': {
+        'pipeline': {'enable': True},
+        'dump': True,
+        'dump_output': {'every': 10, 'max_image_size': 800}
+    }
+}
+
+_MB = 1024 * 1024
+
+
+def run_scenario(scenario_name, params, conn):
+    """
+    スタブの推論処理を利用したOcrInferrerで1つのシナリオを実行し、計測結果を送信します。
+    プロセスのRSSの最大値をシナリオごとに計測するため、シナリオごとの子プロセスで実行されます。
+    """
+    from cli.core import utils
+    from cli.core.memory import get_peak_rss, get_rss
+
+    from .stub_procs import StubOcrInferrer, default_latency_ms
+
+    output_root = os.path.join(params['work_dir'], 'output_' + scenario_name)
+    cfg = utils.parse_cfg({
+        'input_root': params['input_root'],
+        'output_root': output_root,
+        'config_file': params['config_file'],
+        'proc_range': '0..3',
+        'save_image': False,
+        'save_xml': True,
+        'dump': False,
+        'input_structure': 'i',
+        'ruby_only': False
+    })
+    for key, value in scenarios[scenario_name].items():
+        if isinstance(value, dict):
+            cfg[key].update(value)
+        else:
+            cfg[key] = value
+    cfg['metrics']['enable'] = True
+    cfg['benchmark'] = {
+        'latency_ms': {stage: latency_ms * params['latency_scale'] for stage, latency_ms in default_latency_ms.items()},
+        'line_num': params['line_num'],
+        'vertical': True
+    }
+    cfg['output_root'] = utils.mkdir_with_duplication_check(cfg['output_root'])
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        inferrer = StubOcrInferrer(cfg)
+        rss_before = get_rss()
+        start = time.time()
+        inferrer.run()
+        wall_time = time.time() - start
+
+    page_metrics_list = []
+    with open(os.path.join(cfg['output_root'], cfg['metrics']['file_name']), 'r', encoding='utf-8') as f:
+        for line in f:
+            page_metrics_list.append(json.loads(line))
+    page_num = len(page_metrics_list)
+    stage_times = {}
+    for page_metrics in page_metrics_list:
+        for stage, stage_time in page_metrics['stage_times'].items():
+            stage_times[stage] = stage_times.get(stage, 0.0) + stage_time
+    simulated_times = {proc.proc_name: proc.simulated_time for proc in inferrer.proc_list}
+    # stage time not spent in the simulated model inference is orchestration overhead
+    stage_overhead_ms = {stage: (stage_time - simulated_times.get(stage, 0.0)) * 1000 / max(page_num, 1)
+                         for stage, stage_time in stage_times.items()}
+    written_bytes = sum(os.path.getsize(path) for path in glob.glob(os.path.join(cfg['output_root'], '**', '*'),
+                                                                    recursive=True) if os.path.isfile(path))
+    conn.send({
+        'page_num': page_num,
+        'wall_time': wall_time,
+        'pages_per_sec': page_num / wall_time if wall_time > 0 else 0.0,
+        'simulated_time': sum(simulated_times.values()),
+        'overhead_ms_per_page': sum(stage_overhead_ms.values()),
+        'stage_overhead_ms_per_page': stage_overhead_ms,
+        'queue_wait_ms_per_page': sum(page_metrics['queue_wait'] for page_metrics in page_metrics_list) * 1000 / max(page_num, 1),
+        'peak_rss_mb': get_peak_rss() / _MB,
+        'rss_increase_mb': (get_rss() - rss_before) / _MB,
+        'written_mb': written_bytes / _MB
+    })
+    conn.close()
+
+
+def get_git_revision():
+    """
+    作業ディレクトリのgitのコミットハッシュを返します。未コミットの変更がある場合は末尾に'-dirty'を付加します。
+    """
+    try:
+        rev = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return rev + '-dirty' if status != '' else rev
+
+
+def print_result(result, baseline=None):
+    """
+    シナリオごとの計測結果を表示します。比較対象の結果が指定された場合は、変化率を合わせて表示します。
+    """
+    columns = ['pages_per_sec', 'overhead_ms_per_page', 'peak_rss_mb', 'rss_increase_mb', 'written_mb']
+    print('{0:<12}'.format('scenario') + ''.join('{0:>24}'.format(column) for column in columns))
+    for scenario_name, scenario_result in result['scenarios'].items():
+        line = '{0:<12}'.format(scenario_name)
+        for column in columns:
+            value_str = '{0:.2f}'.format(scenario_result[column])
+            baseline_result = (baseline or {}).get('scenarios', {}).get(scenario_name)
+            if baseline_result is not None and baseline_result[column] != 0:
+                value_str += ' ({0:+.1f}%)'.format((scenario_result[column] / baseline_result[column] - 1) * 100)
+            line += '{0:>24}'.format(value_str)
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark of OcrInferrer orchestration with stub inference processes.')
+    parser.add_argument('-s', '--scenario', action='append', choices=list(scenarios.keys()),
+                        help='scenario to run (default: all scenarios)')
+    parser.add_argument('--books', type=int, default=2, help='number of books')
+    parser.add_argument('--pages', type=int, default=20, help='number of page images per book')
+    parser.add_argument('--width', type=int, default=1200, help='width of single page images')
+    parser.add_argument('--height', type=int, default=1600, help='height of page images')
+    parser.add_argument('--lines', type=int, default=40, help='number of LINE elements per page')
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help='scale of the simulated inference latency (0 measures orchestration only)')
+    parser.add_argument('--config-file', default='config.yml', help='config yml file of inference')
+    parser.add_argument('--work-dir', default=None, help='directory of synthetic input and output (default: temporary)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='result json path (default: benchmarks/results/<git revision>.json)')
+    parser.add_argument('--compare', default=None, help='result json of another commit to compare with')
+    args = parser.parse_args()
+
+    from .synthetic import create_input_root
+
+    work_dir = args.work_dir if args.work_dir is not None else tempfile.mkdtemp(prefix='ndlocr_bench_')
+    input_root = os.path.join(work_dir, 'input')
+    create_input_root(input_root, args.books, args.pages, args.width, args.height)
+    params = {
+        'books': args.books,
+        'pages': args.pages,
+        'width': args.width,
+        'height': args.height,
+        'line_num': args.lines,
+        'latency_scale': args.latency_scale,
+        'config_file': args.config_file,
+        'work_dir': work_dir,
+        'input_root': input_root
+    }
+
+    result = {
+        'revision': get_git_revision(),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'params': {key: value for key, value in params.items() if key not in ['work_dir', 'input_root']},
+        'scenarios': {}
+    }
+    # each scenario runs in a new process so that the peak RSS is not shared between scenarios
+    mp_context = multiprocessing.get_context('spawn')
+    try:
+        for scenario_name in (args.scenario or list(scenarios.keys())):
+            for output_dir in glob.glob(os.path.join(work_dir, 'output_' + scenario_name + '*')):
+                shutil.rmtree(output_dir)
+            parent_conn, child_conn = mp_context.Pipe(duplex=False)
+            process = mp_context.Process(target=run_scenario, args=(scenario_name, params, child_conn))
+            process.start()
+            child_conn.close()
+            try:
+                result['scenarios'][scenario_name] = parent_conn.recv()
+            except EOFError:
+                print('[ERROR] Scenario {0} failed'.format(scenario_name), file=sys.stderr)
+            process.join()
+    finally:
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output_path = args.output
+    if output_path is None:
+        output_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results', result['revision'] + '.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+
+    baseline = None
+    if args.compare is not None:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print('compared with : {0} ({1})'.format(args.compare, baseline.get('revision')))
+    print_result(result, baseline)
+    print('result saved : {0}'.format(output_path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import copy
+import functools
+import threading
+import time
+
+from cli import procs
+from cli.core.inference import OcrInferrer
+from cli.procs.base_proc import BaseInferenceProcess
+
+from .synthetic import create_layout_xml, create_line_string
+
+# default latency (ms) of the model inference of each stage, which is simulated with sleep
+# line_ocr latency is per line, the others are per input data
+default_latency_ms = {
+    'page_sep': 30.0,
+    'page_deskew': 40.0,
+    'layer_ext': 80.0,
+    'line_ocr': 2.0,
+    'line_order': 5.0,
+    'ruby_read': 2.0,
+    'line_attribute': 3.0
+}
+
+
+def _sleep_ms(latency_ms):
+    if latency_ms > 0:
+        time.sleep(latency_ms / 1000)
+
+
+class _StubInit:
+    """
+    推論処理のクラスに、モデルを読み込まずに初期化するコンストラクタを追加するためのクラスです。
+    推論処理のクラスと多重継承し、サブモジュールの推論関数をスタブに置き換えます。
+    サブモジュール以外の処理(入力データのコピー、XMLの変換など)は元の推論処理のクラスのものが実行されます。
+    """
+    proc_type = ''
+
+    def __init__(self, cfg, pid, latency_ms):
+        BaseInferenceProcess.__init__(self, cfg, pid, self.proc_type)
+        self.latency_ms = latency_ms
+        self.simulated_time = 0.0
+        self._setup()
+
+    def _setup(self):
+        pass
+
+    def _simulate(self, latency_ms):
+        self.simulated_time += latency_ms / 1000
+        _sleep_ms(latency_ms)
+
+
+class StubPageSeparation(_StubInit, procs.PageSeparation):
+    """
+    横長の画像を左右2ページに分割するノド元分割のスタブです。
+    """
+    proc_type = '_page_sep'
+
+    def _setup(self):
+        self._detector = None
+        self._run_submodule_inference = self._divide
+
+    def _divide(self, img, detector, log=None):
+        self._simulate(self.latency_ms)
+        height, width = img.shape[:2]
+        if width > height:
+            return [img[:, :width // 2].copy(), img[:, width // 2:].copy()]
+        return [img.copy()]
+
+
+class StubPageDeskew(_StubInit, procs.PageDeskewProcess):
+    """
+    入力画像と同じサイズの新しい画像を返す傾き補正のスタブです。
+    """
+    proc_type = '_page_deskew'
+
+    def _setup(self):
+        self._run_submodule_inference = self._deskew
+
+    def _deskew(self, img):
+        self._simulate(self.latency_ms)
+        return img.copy()
+
+
+class StubLayoutExtraction(_StubInit, procs.LayoutExtractionProcess):
+    """
+    合成したレイアウトのXML(lxml)を返すレイアウト抽出のスタブです。
+    """
+    proc_type = '_layer_ext'
+
+    def _setup(self):
+        self._inferencer_lock = threading.Lock()
+        self._run_submodule_inference = self._inference
+        self._run_submodule_batch_inference = self._batch_inference
+        batch_size = self.cfg['layout_extraction']['batch_size']
+        if batch_size > 1:
+            self.max_batch_pages = batch_size
+            self.max_batch_cost = batch_size
+
+    def _inference(self, img, img_path, score_thr, dump):
+        self._simulate(self.latency_ms)
+        return self._create_output(img, img_path, dump)
+
+    def _batch_inference(self, imgs, img_paths, score_thr, dump):
+        # batched inference is assumed to take the latency of one page
+        self._simulate(self.latency_ms)
+        return [self._create_output(img, img_path, dump) for img, img_path in zip(imgs, img_paths)]
+
+    def _create_output(self, img, img_path, dump):
+        height, width = img.shape[:2]
+        seed = sum(map(ord, img_path))
+        xml = create_layout_xml(img_path, width, height, self.cfg['benchmark']['line_num'], seed,
+                                vertical=self.cfg['benchmark']['vertical'])
+        return {'xml': xml, 'dump_img': img.copy() if dump else None}
+
+
+class StubLineOcr(_StubInit, procs.LineOcrProcess):
+    """
+    LINE要素に合成した文字列(STRING)を設定する文字認識のスタブです。
+    """
+    proc_type = '_line_ocr'
+
+    def _setup(self):
+        self._object_dict = {}
+        self._run_submodule_inference = self._infer
+        if self.cfg['line_ocr']['batch_lines'] > 0:
+            self.max_batch_pages = self.cfg['line_ocr']['max_pages_in_flight']
+            self.max_batch_cost = self.cfg['line_ocr']['batch_lines']
+
+    def _infer(self, object_dict, input_data):
+        output_data = copy.copy(input_data)
+        output_data['xml'] = copy.deepcopy(input_data['xml'])
+        line_num = 0
+        for line_idx, line in enumerate(output_data['xml'].iter('LINE')):
+            length = max(int(line.attrib['WIDTH']), int(line.attrib['HEIGHT'])) // 40 + 1
+            line.attrib['STRING'] = create_line_string(line_idx, length)
+            line_num += 1
+        self._simulate(self.latency_ms * line_num)
+        return output_data
+
+
+class StubLineOrder(_StubInit, procs.LineOrderProcess):
+    """
+    LINE要素に読み順(ORDER)を設定する読み順推定のスタブです。
+    """
+    proc_type = '_line_order'
+
+    def _setup(self):
+        self._run_submodule_inference = self._infer
+
+    def _infer(self, input_data):
+        self._simulate(self.latency_ms)
+        output_data = copy.copy(input_data)
+        output_data['xml'] = copy.deepcopy(input_data['xml'])
+        for line_idx, line in enumerate(output_data['xml'].iter('LINE')):
+            line.attrib['ORDER'] = str(line_idx)
+        return output_data
+
+
+class StubRubyReading(_StubInit, procs.RubyReadingProcess):
+    """
+    ルビのテキスト(ruby_txt)を設定するルビ推定のスタブです。
+    """
+    proc_type = '_ruby_read'
+
+    def _setup(self):
+        self._run_submodule_inference = self._infer
+
+    def _infer(self, input_data):
+        self._simulate(self.latency_ms)
+        output_data = copy.copy(input_data)
+        output_data['ruby_txt'] = ''.join(line.attrib.get('STRING', '')[:2] for line in input_data['xml'].iter('LINE'))
+        return output_data
+
+
+class StubLineAttribute(_StubInit, procs.LineAttributeProcess):
+    """
+    LINE要素にタイトル・著者の判定結果(TITLE, AUTHOR)を設定するタイトル・著者推定のスタブです。
+    """
+    proc_type = '_line_attribute'
+
+    def _setup(self):
+        self._object_dict = {}
+        self._run_submodule_inference = self._infer
+
+    def _infer(self, object_dict, input_data):
+        self._simulate(self.latency_ms)
+        output_data = copy.copy(input_data)
+        output_data['xml'] = copy.deepcopy(input_data['xml'])
+        for line in output_data['xml'].iter('LINE'):
+            line.attrib['TITLE'] = 'FALSE'
+            line.attrib['AUTHOR'] = 'FALSE'
+        return output_data
+
+
+class StubOcrInferrer(OcrInferrer):
+    """
+    推論処理をスタブに置き換えたOcrInferrerです。
+    推論処理の選択、ページの読み込み、結果の保存などはOcrInferrerの処理がそのまま実行されます。
+    """
+
+    def _create_proc_list(self, cfg):
+        latency_ms = cfg['benchmark']['latency_ms']
+        full_stub_list = [StubPageSeparation, StubPageDeskew, StubLayoutExtraction, StubLineOcr]
+        proc_specs = [(full_stub_list[i], i) for i in range(cfg['proc_range']['start'], cfg['proc_range']['end'] + 1)]
+        if cfg['proc_range']['end'] > 2:
+            if cfg['line_order']:
+                proc_specs.append((StubLineOrder, 'ex1'))
+                if cfg['ruby_read']:
+                    proc_specs.append((StubRubyReading, 'ex2'))
+            if cfg['line_attribute']['add_title_author']:
+                proc_specs.append((StubLineAttribute, 'ex3'))
+
+        # the latency is bound in advance, since _load_procs creates each proc with (cfg, proc_id)
+        return self._load_procs(cfg, [(functools.partial(proc_class, latency_ms=latency_ms[proc_class.proc_type[1:]]), proc_id)
+                                      for proc_class, proc_id in proc_specs])
+
+    def get_simulated_time(self):
+        """
+        スタブで模擬した推論処理の時間(秒)の合計を返します。
+        """
+        return sum(proc.simulated_time for proc in self.proc_list)
+
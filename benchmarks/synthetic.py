@@ -0,0 +1,137 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import os
+
+import cv2
+import numpy as np
+from lxml import etree
+
+# characters used for synthetic recognition results
+_CHARS = 'いろはにほへとちりぬるをわかよたれそつねならむうゐのおくやまけふこえてあさきゆめみしゑひもせす国立図書館資料'
+
+
+def create_page_image(width, height, seed):
+    """
+    文字行のような縞模様を含む合成ページ画像を作成します。
+
+    Parameters
+    ----------
+    width : int
+        画像の幅です。
+    height : int
+        画像の高さです。
+    seed : int
+        画像の内容を決める乱数のシードです。
+
+    Returns
+    -------
+    img : numpy.ndarray
+        BGRの合成ページ画像です。
+    """
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 235, dtype=np.uint8)
+    line_width = max(8, width // 60)
+    for x in range(line_width * 2, width - line_width * 2, line_width * 2):
+        top = int(rng.integers(height // 20, height // 5))
+        bottom = int(rng.integers(height * 3 // 4, height - height // 20))
+        img[top:bottom, x:x + line_width] = int(rng.integers(20, 80))
+    return img
+
+
+def create_layout_xml(img_file_name, width, height, line_num, seed, vertical=True):
+    """
+    レイアウト抽出の出力と同じ構造(OCRDATASET/PAGE/TEXTBLOCK/LINE, BLOCK)の合成XMLを作成します。
+
+    Parameters
+    ----------
+    img_file_name : str
+        PAGE要素のIMAGENAMEです。
+    width : int
+        ページ画像の幅です。
+    height : int
+        ページ画像の高さです。
+    line_num : int
+        LINE要素の数です。
+    seed : int
+        行の配置を決める乱数のシードです。
+    vertical : bool
+        縦書きの行を作成するかどうかのフラグです。
+
+    Returns
+    -------
+    root : lxml.etree._Element
+        OCRDATASET要素です。
+    """
+    rng = np.random.default_rng(seed)
+    root = etree.Element('OCRDATASET')
+    page = etree.SubElement(root, 'PAGE', IMAGENAME=img_file_name, WIDTH=str(width), HEIGHT=str(height))
+    block = etree.SubElement(page, 'TEXTBLOCK', CONF='0.850')
+    points = []
+    for line_idx in range(line_num):
+        if vertical:
+            line_w, line_h = max(8, width // 60), int(rng.integers(height // 8, height * 3 // 4))
+            x, y = max(0, width - (line_idx + 2) * line_w * 2 % width), height // 10
+        else:
+            line_w, line_h = int(rng.integers(width // 8, width * 3 // 4)), max(8, height // 60)
+            x, y = width // 10, (line_idx + 2) * line_h * 2 % height
+        line_type = 'キャプション' if line_idx % 10 == 9 else '本文'
+        etree.SubElement(block, 'LINE', TYPE=line_type, X=str(x), Y=str(y), WIDTH=str(line_w), HEIGHT=str(line_h),
+                         CONF='{0:.3f}'.format(rng.uniform(0.5, 1.0)))
+        points.append('{0},{1}'.format(x, y))
+    shape = etree.SubElement(block, 'SHAPE')
+    etree.SubElement(shape, 'POLYGON', POINTS=','.join(points))
+    etree.SubElement(page, 'BLOCK', TYPE='図版', X=str(width // 4), Y=str(height // 4),
+                     WIDTH=str(width // 4), HEIGHT=str(height // 4), CONF='0.998')
+    etree.SubElement(page, 'BLOCK', TYPE='ノンブル', X=str(width // 2), Y=str(height - height // 20),
+                     WIDTH=str(width // 30), HEIGHT=str(height // 60), CONF='0.999')
+    return root
+
+
+def create_line_string(line_idx, length):
+    """
+    文字認識結果として利用する合成文字列を作成します。
+    """
+    return ''.join(_CHARS[(line_idx * 7 + i) % len(_CHARS)] for i in range(length))
+
+
+def create_input_root(input_root, book_num, page_num, width, height, spread_ratio=0.5):
+    """
+    推論処理のintermediate_output形式(-s i)の入力ディレクトリとして、合成ページ画像を含む書籍ディレクトリを作成します。
+    作成済みの場合は作成しません。
+
+    Parameters
+    ----------
+    input_root : str
+        入力ディレクトリのパスです。
+    book_num : int
+        書籍の数です。
+    page_num : int
+        書籍ごとのページ画像の数です。
+    width : int
+        見開きでないページ画像の幅です。見開きのページ画像は2倍の幅になります。
+    height : int
+        ページ画像の高さです。
+    spread_ratio : float
+        ページ画像のうち見開き(ノド元分割で2ページに分割される)画像の割合です。
+
+    Returns
+    -------
+    input_dirs : list
+        書籍ディレクトリのパスのリストです。
+    """
+    input_dirs = []
+    for book_idx in range(book_num):
+        img_dir = os.path.join(input_root, 'BOOK{0:04d}'.format(book_idx), 'img')
+        input_dirs.append(os.path.dirname(img_dir))
+        if os.path.isdir(img_dir) and len(os.listdir(img_dir)) == page_num:
+            continue
+        os.makedirs(img_dir, exist_ok=True)
+        for page_idx in range(page_num):
+            is_spread = (page_idx * spread_ratio) % 1 + spread_ratio >= 1
+            img = create_page_image(width * 2 if is_spread else width, height, book_idx * page_num + page_idx)
+            cv2.imwrite(os.path.join(img_dir, 'R{0:07d}.jpg'.format(page_idx + 1)), img)
+    return input_dirs
@@ -4,7 +4,22 @@
 # https://creativecommons.org/licenses/by/4.0/
 
 
-from .inference import OcrInferrer
-from .evaluate import OcrResultEvaluator
+import importlib
 
-__all__ = ['OcrInferrer', 'OcrResultEvaluator']
+# classes are imported on first access, so that each subcommand loads only the modules it uses
+_lazy_attributes = {
+    'OcrInferrer': '.inference',
+    'OcrResultEvaluator': '.evaluate',
+    'ShardResultMerger': '.merge',
+    'OcrServer': '.server',
+    'HotFolderWatcher': '.watcher',
+    'PageBundleExporter': '.export'
+}
+
+__all__ = ['OcrInferrer', 'OcrResultEvaluator', 'ShardResultMerger', 'OcrServer', 'HotFolderWatcher', 'PageBundleExporter']
+
+
+def __getattr__(name):
+    if name in _lazy_attributes.keys():
+        return getattr(importlib.import_module(_lazy_attributes[name], __name__), name)
+    raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
@@ -0,0 +1,169 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import json
+import os
+import threading
+
+# keys of the page text saved in the bundle
+_TEXT_KEYS = ['main_txt', 'cap_txt', 'ruby_txt', 'lines']
+
+
+class PageBundleWriter:
+    """
+    1書籍分のページごとの推論結果のテキストを、ページごとのテキストファイルの代わりに
+    出力ディレクトリ内の1つのJSON Lines形式のファイル(バンドル)に追記します。
+    バンドルの1行は1ページ(入力画像1枚)分で、入力画像ファイル名(page)、本文＋キャプション(main_txt)、
+    キャプション(cap_txt)、ルビ(ruby_txt)のテキストと、行ごとの位置・確信度など(lines)を保持します。
+    複数のスレッドから追記できます。
+
+    Attributes
+    ----------
+    output_dir : str
+        推論結果を保存するディレクトリのパスです。
+    path : str
+        バンドルファイルのパスです。
+    """
+
+    file_name = 'pages.jsonl'
+
+    def __init__(self, output_dir):
+        """
+        Parameters
+        ----------
+        output_dir : str
+            推論結果を保存するディレクトリのパスです。
+        """
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, self.file_name)
+        self._lock = threading.Lock()
+        self._fp = None
+
+    def write_page(self, page_name, page_txt):
+        """
+        1ページ分のテキストを追記します。失敗した場合は例外を送出します。
+
+        Parameters
+        ----------
+        page_name : str
+            入力画像ファイル名です。
+        page_txt : dict
+            1ページ分のテキスト(main_txt, cap_txt, ruby_txt)と、行ごとのデータ(lines)を保持する辞書型データ。
+            それ以外の項目は保存されません。
+
+        Returns
+        -------
+        written_bytes : int
+            追記した1ページ分の行のバイト数です。
+        """
+        record = {'page': page_name}
+        for key in _TEXT_KEYS:
+            record[key] = page_txt.get(key)
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        written_bytes = len(line.encode('utf-8'))
+        with self._lock:
+            # the bundle of the previous run is continued while resuming
+            if self._fp is None:
+                self._fp = open(self.path, 'a', encoding='utf-8')
+                # a line broken by killing the previous run must not be joined with the next line
+                if self._fp.tell() > 0 and not _ends_with_newline(self.path):
+                    self._fp.write('\n')
+            self._fp.write(line)
+            self._fp.flush()
+        return written_bytes
+
+    def close(self):
+        """
+        バンドルファイルを閉じます。追記待ちのページがある場合は、事前に完了を待つ必要があります。
+        """
+        with self._lock:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+
+
+def _ends_with_newline(path):
+    with open(path, 'rb') as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) == b'\n'
+
+
+class PageBundleReader:
+    """
+    PageBundleWriterで保存したバンドルファイルを読み込みます。
+    読み込み時にページごとの行の位置の索引を作成し、ページのデータは参照時にその行のみを読み込みます。
+    同じページの記録が複数ある場合(再開時に再度処理されたページなど)は、最後の記録を有効とします。
+
+    Attributes
+    ----------
+    path : str
+        バンドルファイルのパスです。
+    """
+
+    def __init__(self, path):
+        """
+        Parameters
+        ----------
+        path : str
+            バンドルファイルのパスです。
+        """
+        self.path = path
+        # page name -> byte offset of the line, in order of first appearance
+        self._offsets = {}
+        self._build()
+
+    def __len__(self):
+        return len(self._offsets)
+
+    def __iter__(self):
+        for page_name in self.page_names():
+            yield self.get_page(page_name)
+
+    def __contains__(self, page_name):
+        return page_name in self._offsets
+
+    def page_names(self):
+        """
+        バンドルに含まれるページの入力画像ファイル名のリストを、最初に記録された順に返します。
+        """
+        return list(self._offsets.keys())
+
+    def get_page(self, page_name):
+        """
+        1ページ分の記録を読み込みます。
+
+        Parameters
+        ----------
+        page_name : str
+            入力画像ファイル名です。
+
+        Returns
+        -------
+        [変数なし] : dict
+            ページの記録(page, main_txt, cap_txt, ruby_txt, lines)です。存在しない場合はNoneを返します。
+        """
+        offset = self._offsets.get(page_name)
+        if offset is None:
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            return json.loads(f.readline().decode('utf-8'))
+
+    def _build(self):
+        offset = 0
+        with open(self.path, 'rb') as f:
+            for line_num, line in enumerate(f, 1):
+                line_offset = offset
+                offset += len(line)
+                if line.strip() == b'':
+                    continue
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except (json.JSONDecodeError, UnicodeDecodeError):
+                    # the last line may be broken when the previous run was killed while writing
+                    print('[WARNING] Broken page bundle line is ignored : {0} (line {1})'.format(self.path, line_num))
+                    continue
+                self._offsets[record['page']] = line_offset
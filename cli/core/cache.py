@@ -0,0 +1,235 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+
+# config sections that affect inference result
+_RESULT_CFG_KEYS = ['proc_range', 'page_separation', 'page_deskew', 'layout_extraction', 'line_ocr',
+                    'line_order', 'ruby_read', 'line_attribute']
+
+# version of the cached result format, which is increased when text or xml created from the same inference result changes
+_RESULT_FORMAT_VERSION = 3
+
+# config items that change only the speed of inference, not the result
+_PERFORMANCE_CFG_KEYS = {
+    'layout_extraction': ['device', 'batch_size', 'aspect_ratio_step'],
+    'line_ocr': ['batch_lines', 'max_pages_in_flight', 'max_batch_pixels']
+}
+
+# model and dictionary files used in inference
+_MODEL_FILE_KEYS = [
+    ('page_separation', 'config_path'),
+    ('page_separation', 'weight_path'),
+    ('layout_extraction', 'config_path'),
+    ('layout_extraction', 'checkpoint_path'),
+    ('line_ocr', 'char_list'),
+    ('line_ocr', 'saved_model'),
+    ('line_attribute', 'title_model'),
+    ('line_attribute', 'author_model')
+]
+
+
+class InferenceCache:
+    """
+    入力画像の内容と推論の設定に対応するページ単位の最終的な推論結果(XML、テキスト)をディスクに保存します。
+    キャッシュのキーは入力画像ファイルのハッシュ値と、推論結果に影響する設定項目およびモデルファイルのハッシュ値から作成されます。
+    キャッシュの合計サイズが上限を超えた場合は、最後に利用された日時が古いものから削除されます。
+
+    Attributes
+    ----------
+    cache_dir : str
+        キャッシュを保存するディレクトリのパスです。
+    max_size : int
+        キャッシュの合計サイズ(byte)の上限です。
+    config_hash : str
+        推論結果に影響する設定項目とモデルファイルのハッシュ値です。
+    hit_num : int
+        キャッシュに推論結果が存在したページの数です。
+    miss_num : int
+        キャッシュに推論結果が存在しなかったページの数です。
+    """
+
+    def __init__(self, cache_dir, max_size_mb, config_hash):
+        """
+        Parameters
+        ----------
+        cache_dir : str
+            キャッシュを保存するディレクトリのパスです。
+        max_size_mb : int
+            キャッシュの合計サイズ(MB)の上限です。
+        config_hash : str
+            推論結果に影響する設定項目とモデルファイルのハッシュ値です。
+        """
+        self.cache_dir = cache_dir
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.config_hash = config_hash
+        self.hit_num = 0
+        self.miss_num = 0
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._total_size = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def get_key(self, img_bytes):
+        """
+        入力画像ファイルの内容からキャッシュのキーを作成します。
+
+        Parameters
+        ----------
+        img_bytes : bytes
+            入力画像ファイルの内容です。
+
+        Returns
+        -------
+        key : str
+            キャッシュのキーです。
+        """
+        img_hash = hashlib.sha256(img_bytes).hexdigest()
+        return hashlib.sha256((img_hash + self.config_hash).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        キャッシュから1ページ分の推論結果を取得します。
+
+        Parameters
+        ----------
+        key : str
+            キャッシュのキーです。
+
+        Returns
+        -------
+        result : dict
+            1ページ分の推論結果(xml, main_txt, cap_txt, ruby_txt)を保持する辞書型データ。
+            キャッシュに存在しない場合はNoneを返します。
+        """
+        with self._lock:
+            if key not in self._entries.keys():
+                self.miss_num += 1
+                return None
+        try:
+            with open(self._get_path(key), 'r', encoding='utf-8') as f:
+                result = json.load(f)
+            # update last access time for LRU eviction
+            access_time = time.time()
+            os.utime(self._get_path(key), (access_time, access_time))
+        except (OSError, ValueError) as err:
+            print('[WARNING] Broken cache entry is ignored : {0}'.format(err))
+            with self._lock:
+                self._remove(key)
+                self.miss_num += 1
+            return None
+        with self._lock:
+            if key in self._entries.keys():
+                self._entries[key][1] = access_time
+            self.hit_num += 1
+        return result
+
+    def put(self, key, result):
+        """
+        1ページ分の推論結果をキャッシュに保存し、合計サイズが上限を超えた場合は古いものから削除します。
+
+        Parameters
+        ----------
+        key : str
+            キャッシュのキーです。
+        result : dict
+            1ページ分の推論結果(xml, main_txt, cap_txt, ruby_txt)を保持する辞書型データ。
+        """
+        path = self._get_path(key)
+        tmp_path = path + '.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(result, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            stat = os.stat(path)
+        except OSError as err:
+            print('[ERROR] Cache save error : {0}'.format(err), file=sys.stderr)
+            return
+        with self._lock:
+            if key in self._entries.keys():
+                self._total_size -= self._entries[key][0]
+            self._entries[key] = [stat.st_size, stat.st_mtime]
+            self._total_size += stat.st_size
+            self._evict()
+
+    def _get_path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    def _load_index(self):
+        for sub_dir in os.listdir(self.cache_dir):
+            sub_dir_path = os.path.join(self.cache_dir, sub_dir)
+            if not os.path.isdir(sub_dir_path):
+                continue
+            for file_name in os.listdir(sub_dir_path):
+                stem, ext = os.path.splitext(file_name)
+                if ext != '.json':
+                    continue
+                stat = os.stat(os.path.join(sub_dir_path, file_name))
+                self._entries[stem] = [stat.st_size, stat.st_mtime]
+                self._total_size += stat.st_size
+
+    def _evict(self):
+        if self._total_size <= self.max_size:
+            return
+        for key, _ in sorted(self._entries.items(), key=lambda item: item[1][1]):
+            if self._total_size <= self.max_size:
+                break
+            self._remove(key)
+
+    def _remove(self, key):
+        if key not in self._entries.keys():
+            return
+        self._total_size -= self._entries.pop(key)[0]
+        try:
+            os.remove(self._get_path(key))
+        except OSError:
+            pass
+
+
+def create_config_hash(cfg):
+    """
+    推論結果に影響する設定項目とモデルファイルの内容からハッシュ値を作成します。
+    処理速度のみに関係する設定項目は含みません。
+
+    Parameters
+    ----------
+    cfg : dict
+        推論実行時の設定情報を保存した辞書型データ。
+
+    Returns
+    -------
+    config_hash : str
+        設定項目とモデルファイルのハッシュ値です。
+    """
+    result_cfg = {'result_format_version': _RESULT_FORMAT_VERSION}
+    for cfg_key in _RESULT_CFG_KEYS:
+        value = cfg.get(cfg_key)
+        if isinstance(value, dict):
+            value = {k: v for k, v in value.items() if k not in _PERFORMANCE_CFG_KEYS.get(cfg_key, [])}
+        result_cfg[cfg_key] = value
+
+    config_hash = hashlib.sha256(json.dumps(result_cfg, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    for section, key in _MODEL_FILE_KEYS:
+        model_path = (cfg.get(section) or {}).get(key)
+        config_hash.update(_get_file_hash(model_path).encode('utf-8'))
+    return config_hash.hexdigest()
+
+
+def _get_file_hash(file_path):
+    if file_path is None or not os.path.isfile(file_path):
+        return 'none'
+    file_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
@@ -0,0 +1,197 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import fnmatch
+import os
+import sys
+import threading
+import xml.etree.ElementTree as ET
+import zipfile
+
+# dump formats: 'zip' appends to one archive per book per proc, 'dir' saves each file in the proc directory
+DUMP_FORMATS = ['zip', 'dir']
+
+
+class DumpWriter:
+    """
+    dumpオプションが有効な場合に、各推論処理の結果(画像、XML、テキスト)を出力します。
+    出力はAsyncWriterで推論処理と並行して実行され、画像の作成・縮小・エンコードも出力スレッドで行われます。
+    formatが'zip'の場合は書籍ごと・推論処理ごとに1つのzipファイル(dump/{推論処理名}.zip)に追記し、
+    'dir'の場合は推論処理ごとのディレクトリ(dump/{推論処理名}/)に1ファイルずつ保存します。
+    書籍内のページは、入力画像の順序でevery枚ごと、またはファイル名がpagesに一致するページのみを出力できます。
+
+    Attributes
+    ----------
+    format : str
+        出力形式('zip'または'dir')です。
+    every : int
+        出力するページの間隔です。1の場合は全てのページを出力します。
+    pages : str
+        出力するページの入力画像ファイル名のパターン(glob)です。Noneの場合は全てのページが対象です。
+    max_image_size : int
+        出力する画像の長辺の最大値(pixel)です。0の場合は縮小しません。
+    image_quality : int
+        出力する画像のJPEGの品質です。
+    """
+
+    def __init__(self, dump_cfg, writer):
+        """
+        Parameters
+        ----------
+        dump_cfg : dict
+            configのdump_outputの項目です。
+        writer : AsyncWriter
+            ファイル出力を実行するライターです。
+        """
+        self.format = dump_cfg['format']
+        self.every = dump_cfg['every']
+        self.pages = dump_cfg['pages']
+        self.max_image_size = dump_cfg['max_image_size']
+        self.image_quality = dump_cfg['image_quality']
+        self._writer = writer
+        self._lock = threading.Lock()
+        # output dir -> names of input images to dump
+        self._target_pages = {}
+        # (output dir, proc name) -> (zip file, lock)
+        self._archives = {}
+
+    def start_book(self, output_dir, page_names):
+        """
+        1書籍分の出力を開始し、結果を出力するページを選択します。
+
+        Parameters
+        ----------
+        output_dir : str
+            書籍の推論結果を保存するディレクトリのパスです。
+        page_names : list
+            書籍の全ての入力画像ファイル名のリストです(入力順)。
+        """
+        if self.pages is not None:
+            page_names = [page_name for page_name in page_names if fnmatch.fnmatch(page_name, self.pages)]
+        with self._lock:
+            self._target_pages[output_dir] = frozenset(page_names[::self.every])
+
+    def is_target(self, output_dir, img_path):
+        """
+        入力画像の推論結果を出力するかどうかを返します。start_bookされていない書籍のページは全て出力します。
+        """
+        target_pages = self._target_pages.get(output_dir)
+        return target_pages is None or get_page_name(img_path) in target_pages
+
+    def get_proc_dir(self, output_dir, proc_name):
+        """
+        推論処理ごとのdumpディレクトリのパスを返します。
+        ディレクトリはformatが'dir'の場合に最初のファイルの出力時に作成されます。
+        """
+        return os.path.join(output_dir, 'dump', proc_name)
+
+    def dump_image(self, output_dir, proc_name, entry_name, create_image):
+        """
+        推論結果の画像を出力します。
+
+        Parameters
+        ----------
+        output_dir : str
+            書籍の推論結果を保存するディレクトリのパスです。
+        proc_name : str
+            推論処理の名前です。
+        entry_name : str
+            推論処理ごとのdumpディレクトリ(zipファイル)内のファイルのパスです。
+        create_image : function
+            出力する画像データ(numpy.ndarray)を作成する関数です。出力スレッドで呼び出されます。
+        """
+        self._writer.submit(self._write_entry, output_dir, proc_name, entry_name, self._encode_image, create_image)
+
+    def dump_xml(self, output_dir, proc_name, entry_name, xml_tree):
+        """
+        推論結果のXMLを出力します。xml_treeは出力が完了するまで変更してはなりません。
+        """
+        self._writer.submit(self._write_entry, output_dir, proc_name, entry_name, _encode_xml, xml_tree)
+
+    def dump_text(self, output_dir, proc_name, entry_name, txt):
+        """
+        推論結果のテキストを出力します。
+        """
+        self._writer.submit(self._write_entry, output_dir, proc_name, entry_name, _encode_text, txt)
+
+    def close_book(self, output_dir):
+        """
+        1書籍分の出力の完了を待ち、書籍のzipファイルを閉じます。
+        """
+        self._writer.flush()
+        with self._lock:
+            self._target_pages.pop(output_dir, None)
+            keys = [key for key in self._archives.keys() if key[0] == output_dir]
+            archives = [self._archives.pop(key) for key in keys]
+        for archive, _ in archives:
+            archive.close()
+
+    def close(self):
+        """
+        全ての出力の完了を待ち、全てのzipファイルを閉じます。
+        """
+        for output_dir in {key[0] for key in self._archives.keys()}:
+            self.close_book(output_dir)
+
+    def _write_entry(self, output_dir, proc_name, entry_name, encode, value):
+        data, compress_type = encode(value)
+        if self.format == 'dir':
+            entry_path = os.path.join(output_dir, 'dump', proc_name, entry_name)
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            with open(entry_path, 'wb') as f:
+                f.write(data)
+            return
+        archive, archive_lock = self._get_archive(output_dir, proc_name)
+        with archive_lock:
+            archive.writestr(entry_name, data, compress_type=compress_type)
+
+    def _get_archive(self, output_dir, proc_name):
+        with self._lock:
+            archive_entry = self._archives.get((output_dir, proc_name))
+            if archive_entry is None:
+                archive_entry = (self._open_archive(output_dir, proc_name), threading.Lock())
+                self._archives[(output_dir, proc_name)] = archive_entry
+        return archive_entry
+
+    def _open_archive(self, output_dir, proc_name):
+        archive_path = os.path.join(output_dir, 'dump', proc_name + '.zip')
+        os.makedirs(os.path.dirname(archive_path), exist_ok=True)
+        # archive of the previous run is continued while resuming
+        try:
+            return zipfile.ZipFile(archive_path, 'a', compression=zipfile.ZIP_DEFLATED)
+        except zipfile.BadZipFile:
+            print('[WARNING] Broken dump archive is overwritten : {0}'.format(archive_path), file=sys.stderr)
+            return zipfile.ZipFile(archive_path, 'w', compression=zipfile.ZIP_DEFLATED)
+
+    def _encode_image(self, create_image):
+        # cv2 is imported here so that merge command does not load it
+        import cv2
+        img = create_image()
+        height, width = img.shape[:2]
+        if self.max_image_size > 0 and max(height, width) > self.max_image_size:
+            scale = self.max_image_size / max(height, width)
+            img = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+        ret, encoded = cv2.imencode('.jpg', img, [cv2.IMWRITE_JPEG_QUALITY, self.image_quality])
+        if not ret:
+            raise OSError('Image encode error')
+        # jpeg data is stored without compression
+        return encoded.tobytes(), zipfile.ZIP_STORED
+
+
+def _encode_xml(xml_tree):
+    return ET.tostring(xml_tree.getroot(), encoding='utf-8', xml_declaration=True), zipfile.ZIP_DEFLATED
+
+
+def _encode_text(txt):
+    return txt.encode('utf-8'), zipfile.ZIP_DEFLATED
+
+
+def get_page_name(img_path):
+    """
+    入力画像のパスから、dumpするファイルの名前に利用するページ名(ファイル名)を返します。
+    ruby_onlyモードではimg_pathはXML中のページの順序です。
+    """
+    return os.path.basename(str(img_path))
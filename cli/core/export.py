@@ -0,0 +1,95 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import glob
+import os
+import sys
+
+from .bundle import PageBundleReader, PageBundleWriter
+from .writer import AsyncWriter, get_page_txt_files, write_text
+
+
+class PageBundleExporter:
+    """
+    書籍ごとのテキストのバンドル(pages.jsonl)を、ページごとのテキストファイル(txt/{画像ファイル名}_main.txtなど)に展開します。
+    展開されるファイルは、バンドルを利用せずに推論した場合に保存されるテキストファイルと同じ内容です。
+
+    Attributes
+    ----------
+    cfg : dict
+        本実行処理における設定情報です。
+    """
+
+    def __init__(self, cfg):
+        """
+        Parameters
+        ----------
+        cfg : dict
+            本実行処理における設定情報です。
+            推論結果の出力ディレクトリ(input_root)と展開先のディレクトリ(output_root)を含みます。
+            output_rootがNoneの場合は、各書籍の出力ディレクトリに展開します。
+        """
+        self.cfg = cfg
+
+    def run(self):
+        """
+        self.cfgに保存された設定に基づいた展開処理を実行します。
+        """
+        input_root = self.cfg['input_root']
+        bundle_paths = sorted(glob.glob(os.path.join(input_root, '*', PageBundleWriter.file_name)))
+        # input root may be the output directory of a single book
+        if os.path.isfile(os.path.join(input_root, PageBundleWriter.file_name)):
+            bundle_paths.insert(0, os.path.join(input_root, PageBundleWriter.file_name))
+        if len(bundle_paths) == 0:
+            print('[ERROR] No page bundle found in {0}'.format(input_root), file=sys.stderr)
+            return
+
+        writer = AsyncWriter()
+        page_num = 0
+        try:
+            for bundle_path in bundle_paths:
+                book_dir = os.path.dirname(bundle_path)
+                output_dir = book_dir
+                if self.cfg['output_root'] is not None:
+                    output_dir = os.path.join(self.cfg['output_root'], os.path.basename(os.path.abspath(book_dir)))
+                page_num += self._export_book(writer, bundle_path, output_dir)
+        finally:
+            writer.close()
+
+        print('================== EXPORT RESULT ==================')
+        print(f'Number of exported books'.ljust(45, ' ') + f': {len(bundle_paths)}')
+        print(f'Number of exported pages'.ljust(45, ' ') + f': {page_num}')
+        if len(writer.errors) > 0:
+            print(f'Number of output errors'.ljust(45, ' ') + f': {len(writer.errors)}')
+        return
+
+    def _export_book(self, writer, bundle_path, output_dir):
+        """
+        1書籍分のバンドルをテキストファイルに展開します。
+
+        Parameters
+        ----------
+        writer : AsyncWriter
+            ファイル出力を実行するライターです。
+        bundle_path : str
+            バンドルファイルのパスです。
+        output_dir : str
+            書籍の展開先のディレクトリのパスです。
+
+        Returns
+        -------
+        page_num : int
+            展開したページの数です。
+        """
+        txt_dir = os.path.join(output_dir, 'txt')
+        os.makedirs(txt_dir, exist_ok=True)
+        page_bundle = PageBundleReader(bundle_path)
+        for page_record in page_bundle:
+            for txt_name, txt in get_page_txt_files(page_record['page'], page_record['main_txt'],
+                                                    page_record['cap_txt'], page_record['ruby_txt']):
+                writer.submit(write_text, os.path.join(txt_dir, txt_name), txt)
+        print('### export : {0} ({1} pages) ###'.format(bundle_path, len(page_bundle)))
+        return len(page_bundle)
@@ -4,9 +4,13 @@
 # https://creativecommons.org/licenses/by/4.0/
 
 
+import concurrent.futures
+import contextlib
 import copy
 import cv2
+import functools
 import glob
+import json
 import os
 import pathlib
 import sys
@@ -15,7 +19,20 @@ import xml
 import xml.etree.ElementTree as ET
 
 from . import utils
+from .bundle import PageBundleWriter
+from .cache import InferenceCache, create_config_hash
+from .dump import DumpWriter
+from .line_table import LineTableWriter, is_parquet_available
+from .manifest import PageManifest
+from .memory import MemoryMonitor, get_array_size, is_out_of_memory_error
+from .metrics import PageMetricsRecorder
+from .page_index import PageXmlIndex
+from .pipeline import PagePipeline, PipelineStage
+from .prefetch import ImagePrefetcher, read_image
+from .profiler import ProcProfiler
+from .writer import AsyncWriter, StreamingXmlWriter, get_page_txt_files, write_image, write_text
 from .. import procs
+from ..procs.page_text import serialize_page_text
 
 # Add import path for submodules
 currentdir = pathlib.Path(__file__).resolve().parent
@@ -36,11 +53,18 @@ class OcrInferrer:
     Attributes
     ----------
     full_proc_list : list
-        全推論処理のリストです。
+        全推論処理のクラス名(cli.procsの属性名)のリストです。
+        クラスはproc_rangeに含まれる推論処理のみ、インスタンスの作成時に読み込まれます。
     proc_list : list
         本実行処理における推論処理のリストです。
     cfg : dict
         本実行処理における設定情報です。
+    proc_load_time : dict
+        推論処理名をキー、モデルの読み込みを含むインスタンスの作成時間(秒)を値とする辞書型データ。
+    unused_fields : dict
+        推論処理名をキー、その推論処理の後で不要になるPageRecordの項目名のタプルを値とする辞書型データ。
+    line_table_format : str
+        書籍ごとの行の表(line table)の出力形式です。表を出力しない場合はNoneです。
     """
 
     def __init__(self, cfg):
@@ -50,20 +74,24 @@ class OcrInferrer:
         cfg : dict
             本実行処理における設定情報です。
         """
-        # inference process class list in order
+        # inference process class names in order, which are resolved only for the procs in proc_range
         self.full_proc_list = [
-            procs.PageSeparation,           # 0: ノド元分割               出力：（画像：あり、XML：なし、TXT：なし）
-            procs.PageDeskewProcess,        # 1: 傾き補正                 出力：（画像：あり、XML：なし、TXT：なし）
-            procs.LayoutExtractionProcess,  # 2: レイアウト抽出           出力：（画像：あり、XML：あり、TXT：なし）
-            procs.LineOcrProcess,           # 3: 文字認識(OCR)            出力：（画像：あり、XML：あり、TXT：あり）
+            'PageSeparation',           # 0: ノド元分割               出力：（画像：あり、XML：なし、TXT：なし）
+            'PageDeskewProcess',        # 1: 傾き補正                 出力：（画像：あり、XML：なし、TXT：なし）
+            'LayoutExtractionProcess',  # 2: レイアウト抽出           出力：（画像：あり、XML：あり、TXT：なし）
+            'LineOcrProcess',           # 3: 文字認識(OCR)            出力：（画像：あり、XML：あり、TXT：あり）
         ]
+        self.proc_load_time = {}
         self.proc_list = self._create_proc_list(cfg)
         self.cfg = cfg
-        self.total_time_statistics = []
-        self.proc_time_statistics = {}
-        for proc in self.proc_list:
-            self.proc_time_statistics[proc.proc_name] = []
-        self.xml_template = '<?xml version="1.0" encoding="utf-8" standalone="yes"?>\n<OCRDATASET></OCRDATASET>'
+        self.unused_fields = self._get_unused_fields()
+        self.metrics = None
+        self.profiler = None
+        self.memory_monitor = None
+        self.dump_writer = None
+        self._reset_statistics()
+        self.cache = self._create_cache(cfg)
+        self.line_table_format = self._get_line_table_format(cfg)
 
     def run(self):
         """
@@ -72,63 +100,146 @@ class OcrInferrer:
         if len(self.cfg['input_dirs']) == 0:
             print('[ERROR] Input directory list is empty', file=sys.stderr)
             return
+        self._reset_statistics()
+
+        # file output is done in background threads
+        self.writer = AsyncWriter(self.cfg['output_writer']['num_workers'], self.cfg['output_writer']['queue_size'])
+        self.dump_writer = self._create_dump_writer()
+        self.metrics = self._create_metrics()
+        self.memory_monitor = self._create_memory_monitor()
+        if self.cfg['profile']:
+            self.profiler = ProcProfiler()
+            self.profiler.start()
+        try:
+            # input dir loop
+            for input_dir in self.cfg['input_dirs']:
+                if self.cfg['input_structure'] in ['t']:
+                    single_outputdir_data_list = self._get_single_dir_data_from_tosho_data(input_dir)
+                else:
+                    single_outputdir_data_list = self._get_single_dir_data(input_dir)
 
-        # input dir loop
-        for input_dir in self.cfg['input_dirs']:
-            if self.cfg['input_structure'] in ['t']:
-                single_outputdir_data_list = self._get_single_dir_data_from_tosho_data(input_dir)
-            else:
-                single_outputdir_data_list = self._get_single_dir_data(input_dir)
-
-            if single_outputdir_data_list is None:
-                print('[ERROR] Input data list is empty', file=sys.stderr)
-                continue
-            print(single_outputdir_data_list)
-            # do infer with input data for single output data dir
-            for single_outputdir_data in single_outputdir_data_list:
-                if single_outputdir_data is None:
+                if single_outputdir_data_list is None:
+                    print('[ERROR] Input data list is empty', file=sys.stderr)
                     continue
-                if self.cfg['ruby_only']:
-                    pred_list = self._infer_ruby_only(single_outputdir_data)
-                else:
-                    pred_list = self._infer(single_outputdir_data)
+                print(single_outputdir_data_list)
+                # do infer with input data for single output data dir
+                for single_outputdir_data in single_outputdir_data_list:
+                    if single_outputdir_data is None:
+                        continue
+                    if self.cfg['ruby_only']:
+                        self._infer_ruby_only(single_outputdir_data)
+                    else:
+                        self._infer(single_outputdir_data)
+        finally:
+            if self.dump_writer is not None:
+                self.dump_writer.close()
+            self.writer.close()
+            if self.metrics is not None:
+                # pages are recorded after their output files are saved
+                self.metrics.close()
+                self.metrics = None
+            if self.profiler is not None:
+                self.profiler.stop()
+                for saved_path in self.profiler.save(os.path.join(self.cfg['output_root'], 'profile')):
+                    print('profile saved : {0}'.format(saved_path))
+                self.profiler = None
+
+        self._print_summary()
+        self.memory_monitor = None
+        return
+
+    def _reset_statistics(self):
+        """
+        処理時間などの集計結果を初期化します。
+        同じOcrInferrerでrunやinfer_imagesを繰り返し実行する場合(watchモード、serveモードなど)に、実行ごとに集計するために利用します。
+        """
+        self.total_time_statistics = []
+        self.resumed_page_num = 0
+        self.proc_time_statistics = {}
+        if not self.cfg['ruby_only']:
+            self.proc_time_statistics['decode'] = []
+        for proc in self.proc_list:
+            self.proc_time_statistics[proc.proc_name] = []
 
-                # save inferenced xml in xml directory
-                if (self.cfg['save_xml'] or self.cfg['partial_infer']) and (self.cfg['proc_range']['end'] > 1):
-                    self._save_pred_xml(single_outputdir_data['output_dir'], [single_data['xml'] for single_data in pred_list], self.cfg['line_order'])
+    def _print_summary(self):
+        """
+        推論処理全体の処理時間やファイル出力エラーの集計結果を表示します。
+        """
         if len(self.total_time_statistics) == 0:
             print('================== NO VALID INFERENCE ==================')
         else:
             print('================== PROCESSING TIME ==================')
             for proc_name, proc_time_list in self.proc_time_statistics.items():
+                if len(proc_time_list) == 0:
+                    continue
                 proc_averaege = sum(proc_time_list) / len(proc_time_list)
                 print(f'Average processing time ({proc_name})'.ljust(45, ' ') + f': {proc_averaege:8.4f} sec / image file ')
             total_average = sum(self.total_time_statistics) / len(self.total_time_statistics)
             print(f'Average processing time (total)'.ljust(45, ' ') + f': {total_average:8.4f} sec / image file ')
+        if self.cache is not None:
+            print('================== INFERENCE CACHE ==================')
+            print(f'Number of cache hits'.ljust(45, ' ') + f': {self.cache.hit_num}')
+            print(f'Number of cache misses'.ljust(45, ' ') + f': {self.cache.miss_num}')
+        if self.resumed_page_num > 0:
+            print('================== RESUMED PAGES ==================')
+            print(f'Number of pages skipped as already completed'.ljust(45, ' ') + f': {self.resumed_page_num}')
+        if self.memory_monitor is not None:
+            self.memory_monitor.print_report()
+        if len(self.writer.errors) > 0:
+            print('================== OUTPUT ERRORS ==================')
+            print(f'Number of output errors'.ljust(45, ' ') + f': {len(self.writer.errors)}')
+            for message in self.writer.errors:
+                print(message)
         return
 
     def _infer_ruby_only(self, single_outputdir_data):
         """
         self.cfgに保存された設定に基づき、XML一つ分のデータに対するルビ推定処理を実行します。
+        推論結果のXMLはページごとにXMLファイルに追記されます。
 
         Parameters
         ----------
         single_outputdir_data : dict
             XML一つ分のデータ（基本的に1書籍分を想定）の入力データ情報。
-            入力となるXMLデータを含みます。
-
-        Returns
-        -------
-        pred_list : list
-            1ページ分の推論結果を要素に持つ推論結果のリスト。
-            各結果は辞書型で保持されています。
+            入力となるXMLデータのページ索引(PageXmlIndex)を含みます。
         """
         # single_outputdir_data dictionary include [key, value] pairs as below
-        # [key, value]: ['img', None], ['xml', xml_tree]
-        pred_list = []
-        pred_xml_dict_for_dump = {}
+        # [key, value]: ['img_list', []], ['page_index', PageXmlIndex]
+        pred_xml_writer = self._open_pred_xml(single_outputdir_data['output_dir'])
+        line_table = self._open_line_table(single_outputdir_data['output_dir'])
+        single_outputdir_data['page_bundle'] = self._open_page_bundle(single_outputdir_data['output_dir'])
+        if self.dump_writer is not None:
+            # pages are identified by the order in the xml in ruby_only mode
+            self.dump_writer.start_book(single_outputdir_data['output_dir'],
+                                        [str(page_idx) for page_idx in range(len(single_outputdir_data['page_index']))])
+        try:
+            self._infer_ruby_only_pages(single_outputdir_data, pred_xml_writer, line_table)
+        finally:
+            if self.dump_writer is not None:
+                self.dump_writer.close_book(single_outputdir_data['output_dir'])
+            if single_outputdir_data['page_bundle'] is not None:
+                self.writer.flush()
+                single_outputdir_data['page_bundle'].close()
+            if pred_xml_writer is not None:
+                pred_xml_writer.close()
+            if line_table is not None:
+                line_table.close()
+
+    def _infer_ruby_only_pages(self, single_outputdir_data, pred_xml_writer, line_table=None):
+        """
+        XML一つ分のデータの各ページに対してルビ推定処理を実行し、結果を保存します。
 
-        for page_idx, page_xml in enumerate(single_outputdir_data['xml'].findall('PAGE')):
+        Parameters
+        ----------
+        single_outputdir_data : dict
+            XML一つ分のデータ（基本的に1書籍分を想定）の入力データ情報。
+        pred_xml_writer : StreamingXmlWriter
+            推論結果のXMLを追記するライター。XMLを保存しない場合はNoneです。
+        line_table : LineTableWriter
+            推論結果の行を追加する表のライター。表を保存しない場合はNoneです。
+        """
+        page_index = single_outputdir_data['page_index']
+        for page_idx in range(len(page_index)):
             single_image_file_data = self._get_single_image_file_data(page_idx, single_outputdir_data)
             if single_image_file_data is None:
                 print('[ERROR] Failed to get single page input data.')
@@ -140,9 +251,10 @@ class OcrInferrer:
             for proc in self.proc_list:
                 start_proc = time.time()
                 single_page_output = []
-                for idx, single_data_input in enumerate(single_image_file_data):
-                    single_data_output = proc.do(idx, single_data_input)
-                    single_page_output.extend(single_data_output)
+                with self._profile(proc), self._measure_memory(proc):
+                    for idx, single_data_input in enumerate(single_image_file_data):
+                        single_data_output = proc.do(idx, single_data_input)
+                        single_page_output.extend(single_data_output)
 
                 single_image_file_data = single_page_output
                 self.proc_time_statistics[proc.proc_name].append(time.time() - start_proc)
@@ -151,136 +263,724 @@ class OcrInferrer:
             self.total_time_statistics.append(time.time() - start_page)
 
             # save inferenced result text for this page
-            sum_main_txt = ''
-            sum_cap_txt = ''
-            sum_ruby_txt = ''
-
-            # check if xml output for this image is vertical text
-            vertical_text_page = 0
-            for single_data_output in single_image_file_output:
-                if self._is_vertical_text_xml(single_data_output['xml']):
-                    vertical_text_page += 1
+            page_bundle = single_outputdir_data['page_bundle']
+            page_text = serialize_page_text(single_image_file_output, ruby_read=True, with_lines=page_bundle is not None)
+            self._save_page_txt(page_text.to_dict(), page_index.get_image_name(page_idx),
+                                single_outputdir_data['output_dir'], page_bundle)
 
-            # reverse order of page if all pages are vertical text
-            single_image_file_output_for_txt = single_image_file_output
-            if vertical_text_page >= len(single_image_file_output):
-                single_image_file_output_for_txt = list(reversed(single_image_file_output))
-
-            for single_data_output in single_image_file_output_for_txt:
-                main_txt, cap_txt = self._create_result_txt(single_data_output['xml'])
-                sum_main_txt += main_txt + '\n'
-                sum_cap_txt += sum_cap_txt + '\n'
-                sum_ruby_txt += single_data_output['ruby_txt'] + '\n'
-
-                self._save_pred_txt(sum_main_txt, sum_cap_txt, sum_ruby_txt, page_xml.attrib['IMAGENAME'], single_outputdir_data['output_dir'])
-
-            # add inference result for single image file data to pred_list, including XML data
-            pred_list.extend(single_image_file_output)
+            # append inference result xml of this page
+            if pred_xml_writer is not None:
+                for single_data_output in single_image_file_output:
+                    pred_xml_writer.write_page(single_data_output['xml'])
+            if line_table is not None:
+                for single_data_output in single_image_file_output:
+                    line_table.write_page(single_data_output['xml'])
             print('########  END PAGE INFERENCE PROCESS  ########')
 
-        return pred_list
-
     def _infer(self, single_outputdir_data):
         """
         self.cfgに保存された設定に基づき、XML一つ分のデータに対する推論処理を実行します。
+        推論結果のXMLはページごとにXMLファイルに追記され、
+        画像データなどのページごとの推論結果は保存後すぐに解放されます。
+        推論処理が完了したページはマニフェストファイルに記録され、
+        再開モードではマニフェストに記録済みのページの推論処理を省略します。
 
         Parameters
         ----------
         single_outputdir_data : dict
             XML一つ分のデータ（基本的に1書籍分を想定）の入力データ情報。
             画像ファイルパスのリスト、それらに対応するXMLデータを含みます。
-
-        Returns
-        -------
-        pred_list : list
-            1ページ分の推論結果を要素に持つ推論結果のリスト。
-            各結果は辞書型で保持されています。
         """
         # single_outputdir_data dictionary include [key, value] pairs as below
         # (xml is not always included)
         #   [key, value]: ['img', numpy.ndarray], ['xml', xml_tree]
-        pred_list = []
-        pred_xml_dict_for_dump = {}
-        if self.cfg['dump']:
-            dump_dir = os.path.join(single_outputdir_data['output_dir'], 'dump')
-            os.makedirs(dump_dir, exist_ok=True)
 
-            for proc in self.proc_list:
-                pred_xml_dict_for_dump[proc.proc_name] = []
-                proc_dump_dir = os.path.join(dump_dir, proc.proc_name)
-                os.makedirs(proc_dump_dir, exist_ok=True)
+        # process only pages in the shard of this execution
+        img_list = single_outputdir_data['img_list']
+        if self.cfg['shard'] is not None:
+            img_list = [img_path for img_path in img_list
+                        if utils.is_in_shard(os.path.basename(img_path), self.cfg['shard'])]
+            if len(img_list) == 0:
+                print('No page in shard {0}/{1} : {2}'.format(
+                    self.cfg['shard']['index'], self.cfg['shard']['count'], single_outputdir_data['output_dir']))
+                return
+            self._save_shard_info(single_outputdir_data)
+
+        if self.dump_writer is not None:
+            # pages to dump are selected from all input images of the book, so that shards and resumed runs select the same pages.
+            # the book is started after the shard check, since a shard without pages returns before closing the book
+            self.dump_writer.start_book(single_outputdir_data['output_dir'],
+                                        [os.path.basename(img_path) for img_path in single_outputdir_data['img_list']])
+
+        # skip pages completed in previous run while resuming
+        manifest = None
+        completed_pages = {}
+        if self.cfg['manifest']['enable']:
+            manifest = PageManifest(single_outputdir_data['output_dir'])
+            if self.cfg['resume']:
+                completed_pages = manifest.load_completed_pages(img_list, self._need_page_xml())
+        if len(completed_pages) > 0:
+            print('{0} / {1} pages are already completed and skipped : {2}'.format(
+                len(completed_pages), len(img_list), single_outputdir_data['output_dir']))
+            self.resumed_page_num += len(completed_pages)
+        input_img_list = [img_path for img_path in img_list if os.path.abspath(img_path) not in completed_pages]
+
+        # prefetch and decode input images in background
+        prefetcher = None
+        if self.cfg['prefetch']['enable']:
+            prefetcher = ImagePrefetcher(input_img_list,
+                                         num_workers=self.cfg['prefetch']['num_workers'],
+                                         max_pages=self.cfg['prefetch']['max_pages'],
+                                         memory_budget_mb=self.cfg['prefetch']['memory_budget_mb'],
+                                         cache=self.cache)
+            img_data_list = prefetcher
+        else:
+            img_data_list = [{'img_path': img_path} for img_path in input_img_list]
 
-        for img_path in single_outputdir_data['img_list']:
-            single_image_file_data = self._get_single_image_file_data(img_path, single_outputdir_data)
-            output_dir = single_outputdir_data['output_dir']
-            if single_image_file_data is None:
-                print('[ERROR] Failed to get single page input data for image:{0}'.format(img_path), file=sys.stderr)
+        pred_xml_writer = self._open_pred_xml(single_outputdir_data['output_dir'])
+        line_table = self._open_line_table(single_outputdir_data['output_dir'])
+        single_outputdir_data['page_bundle'] = self._open_page_bundle(single_outputdir_data['output_dir'])
+        img_idx = 0
+        try:
+            for page_task in self._run_pages(single_outputdir_data, img_data_list):
+                if page_task is None:
+                    continue
+                # xml of completed pages is written in input order together with inferred pages
+                img_idx = self._write_completed_pages(pred_xml_writer, line_table, img_list, img_idx, completed_pages,
+                                                      page_task['img_path'])
+
+                # append inference result xml of this page
+                xml_list = None
+                cache_result = page_task.get('cache_result')
+                if cache_result is not None:
+                    xml_list = cache_result['xml']
+                elif pred_xml_writer is not None or self.cache is not None or line_table is not None:
+                    xml_list = [ET.tostring(element, encoding='unicode')
+                                for single_data_output in page_task['page_data']
+                                for element in single_data_output['xml'].getroot()]
+                if pred_xml_writer is not None:
+                    for element_str in xml_list:
+                        pred_xml_writer.write_serialized_element(element_str)
+                if line_table is not None:
+                    if cache_result is not None:
+                        for element_str in xml_list:
+                            line_table.write_serialized_element(element_str)
+                    else:
+                        for single_data_output in page_task['page_data']:
+                            line_table.write_page(single_data_output['xml'])
+                if self.cache is not None and cache_result is None and page_task.get('cache_key') is not None:
+                    self.cache.put(page_task['cache_key'], dict(xml=xml_list, **page_task['result_txt']))
+                if manifest is not None:
+                    manifest.record(page_task['img_path'], page_task['outputs'],
+                                    xml_list if self._need_page_xml() else None)
+                if self.metrics is not None:
+                    self.metrics.record(self._create_page_metrics(page_task, xml_list if pred_xml_writer is not None else None),
+                                        page_task['outputs'])
+                # release image data and xml of this page
+                page_task.clear()
+            self._write_completed_pages(pred_xml_writer, line_table, img_list, img_idx, completed_pages)
+        finally:
+            if prefetcher is not None:
+                prefetcher.close()
+            if self.dump_writer is not None:
+                self.dump_writer.close_book(single_outputdir_data['output_dir'])
+            if manifest is not None or single_outputdir_data['page_bundle'] is not None:
+                # pages are recorded after their output files are saved
+                self.writer.flush()
+            if manifest is not None:
+                manifest.close()
+            if single_outputdir_data['page_bundle'] is not None:
+                single_outputdir_data['page_bundle'].close()
+            if pred_xml_writer is not None:
+                pred_xml_writer.close()
+            if line_table is not None:
+                line_table.close()
+        if self.metrics is not None:
+            # update prometheus metrics for each book, after the pages of the book are recorded
+            self.writer.flush()
+            self.metrics.flush()
+            self.metrics.write_prometheus()
+
+    def _save_shard_info(self, single_outputdir_data):
+        """
+        シャードごとの出力を結合するための情報を、出力ディレクトリのshard.jsonに保存します。
+        シャードの指定、1書籍分の全ての入力画像のファイル名(入力順)、書籍単位のXMLのファイル名を保持します。
+
+        Parameters
+        ----------
+        single_outputdir_data : dict
+            XML一つ分のデータ（基本的に1書籍分を想定）の入力データ情報。
+        """
+        output_dir = single_outputdir_data['output_dir']
+        xml_name = None
+        if self._need_pred_xml():
+            xml_name = os.path.basename(self._get_pred_xml_path(output_dir))
+        shard_info = {
+            'shard': '{0}/{1}'.format(self.cfg['shard']['index'], self.cfg['shard']['count']),
+            'img_list': [os.path.basename(img_path) for img_path in single_outputdir_data['img_list']],
+            'xml_name': xml_name,
+            'line_table_format': self.line_table_format
+        }
+        with open(os.path.join(output_dir, 'shard.json'), 'w') as fp:
+            json.dump(shard_info, fp, ensure_ascii=False, indent=4)
+
+    def _write_completed_pages(self, pred_xml_writer, line_table, img_list, img_idx, completed_pages, next_img_path=None):
+        """
+        前回の実行で推論処理が完了したページのXMLを、入力画像の順序を保って書籍単位のXMLと行の表に追記します。
+        img_idx番目の入力画像から、next_img_pathの直前の入力画像までを対象とします。
+
+        Parameters
+        ----------
+        pred_xml_writer : StreamingXmlWriter
+            推論結果のXMLを追記するライター。XMLを保存しない場合はNoneです。
+        line_table : LineTableWriter
+            推論結果の行を追加する表のライター。表を保存しない場合はNoneです。
+        img_list : list
+            1書籍分の入力画像ファイルパスのリストです。
+        img_idx : int
+            まだXMLを追記していない最初の入力画像のインデックスです。
+        completed_pages : dict
+            入力画像の絶対パスをキー、マニフェストに記録されたページの記録を値とする辞書型データ。
+        next_img_path : str
+            次に推論結果を追記する入力画像のパスです。Noneの場合は残りの全ての入力画像を対象とします。
+
+        Returns
+        -------
+        img_idx : int
+            next_img_pathの次の入力画像のインデックス。
+        """
+        while img_idx < len(img_list):
+            img_path = img_list[img_idx]
+            img_idx += 1
+            if img_path == next_img_path:
+                break
+            page_entry = completed_pages.get(os.path.abspath(img_path))
+            if page_entry is None:
                 continue
+            if pred_xml_writer is not None:
+                for element_str in page_entry['xml']:
+                    pred_xml_writer.write_serialized_element(element_str)
+            if line_table is not None:
+                for element_str in page_entry['xml']:
+                    line_table.write_serialized_element(element_str)
+        return img_idx
+
+    def _run_pages(self, single_outputdir_data, img_data_list, save_result=True):
+        """
+        1書籍分の各ページに対して、画像の読み込み、各推論処理、結果の保存を実行します。
+        configのpipelineの項目が有効な場合は各処理をステージごとに並行して実行し、
+        無効な場合は1ページずつ順に実行します。
+        一度に複数ページを処理できる推論処理では、設定された上限までページをまとめて処理します。
+
+        Parameters
+        ----------
+        single_outputdir_data : dict
+            XML一つ分のデータ（基本的に1書籍分を想定）の入力データ情報。
+        img_data_list : iterable
+            入力画像ごとの画像ファイルパスと、先読みされている場合はデコード済みの画像データを保持する辞書型データを返すイテラブル。
+        save_result : bool
+            推論結果をファイルに保存するかどうかのフラグです。
+            Falseの場合は保存の代わりに、_create_page_resultで作成した推論結果を返します。
+
+        Returns
+        -------
+        [変数なし] : generator
+            1ページ分の推論結果を保持する辞書型データを入力画像の順に返すジェネレータ。
+            入力データの取得に失敗したページはNoneとなります。
+        """
+        workers = self.cfg['pipeline']['workers'] or {}
+        stages = [PipelineStage('decode',
+                                functools.partial(self._load_page, single_outputdir_data=single_outputdir_data),
+                                workers.get('decode', 1))]
+        for proc in self.proc_list:
+            if proc.max_batch_pages > 1:
+                stages.append(PipelineStage(proc.proc_name,
+                                            functools.partial(self._run_proc_on_pages, proc),
+                                            workers.get(proc.proc_name, 1),
+                                            max_batch_size=proc.max_batch_pages,
+                                            batch_cost=functools.partial(self._get_batch_cost, proc),
+                                            max_batch_cost=proc.max_batch_cost))
+            else:
+                stages.append(PipelineStage(proc.proc_name,
+                                            functools.partial(self._run_proc_on_page, proc),
+                                            workers.get(proc.proc_name, 1)))
+        if save_result:
+            stages.append(PipelineStage('write', self._save_page_result, workers.get('write', 1)))
+        else:
+            stages.append(PipelineStage('result', self._create_page_result, workers.get('result', 1)))
+
+        pipeline = PagePipeline(stages, self.cfg['pipeline']['queue_size'], threaded=self.cfg['pipeline']['enable'])
+        return pipeline.run(img_data_list)
 
+    def _load_page(self, img_data, single_outputdir_data):
+        """
+        1ページ分の入力データを読み込み、推論処理に渡すタスクを作成します。
+        画像が先読みされていない場合はここで読み込みます。
+
+        Parameters
+        ----------
+        img_data : dict
+            入力画像データのパスと、先読みされている場合はデコード済みの画像データを保持する辞書型データです。
+        single_outputdir_data : dict
+            XML一つ分のデータ（基本的に1書籍分を想定）の入力データ情報。
+
+        Returns
+        -------
+        page_task : dict
+            1ページ分の入力データと処理時間を保持する辞書型データ。
+            推論結果がキャッシュに存在する場合は、入力データの代わりにキャッシュの推論結果を保持します。
+            入力データの取得に失敗した場合はNoneを返します。
+        """
+        img_path = img_data['img_path']
+        if 'img' not in img_data.keys():
+            img_data = read_image(img_path, self.cache)
+        self.proc_time_statistics['decode'].append(img_data['decode_time'])
+
+        # inference is skipped when the result is found in cache
+        if img_data.get('cache_result') is not None:
             print('######## START PAGE INFERENCE PROCESS ########')
-            start_page = time.time()
+            print('Inference result is found in cache : {0}'.format(img_path))
+            return {
+                'img_path': img_path,
+                'output_dir': single_outputdir_data['output_dir'],
+                'page_data': [],
+                'proc_time': 0.0,
+                'cache_result': img_data['cache_result'],
+                'page_bundle': single_outputdir_data.get('page_bundle'),
+                'img_size': None,
+                'stage_times': {'decode': img_data['decode_time']},
+                'queue_wait': 0.0,
+                'stage_end': time.time()
+            }
+
+        single_image_file_data = self._get_single_image_file_data(img_path, single_outputdir_data, img_data['img'])
+        if single_image_file_data is None:
+            print('[ERROR] Failed to get single page input data for image:{0}'.format(img_path), file=sys.stderr)
+            return None
 
-            for proc in self.proc_list:
-                start_proc = time.time()
-                single_page_output = []
-                for idx, single_data_input in enumerate(single_image_file_data):
+        print('######## START PAGE INFERENCE PROCESS ########')
+        page_task = {
+            'img_path': img_path,
+            'output_dir': single_outputdir_data['output_dir'],
+            'page_data': single_image_file_data,
+            'proc_time': 0.0,
+            'cache_key': img_data.get('cache_key'),
+            'page_bundle': single_outputdir_data.get('page_bundle'),
+            'img_size': [img_data['img'].shape[1], img_data['img'].shape[0]],
+            'stage_times': {'decode': img_data['decode_time']},
+            'queue_wait': 0.0,
+            'stage_end': time.time()
+        }
+        return page_task
+
+    def _run_proc_on_page(self, proc, page_task):
+        """
+        1ページ分のタスクに含まれる全てのデータに対して一つの推論処理を実行します。
+
+        Parameters
+        ----------
+        proc : BaseInferenceProcess
+            実行する推論処理。
+        page_task : dict
+            1ページ分の入力データと処理時間を保持する辞書型データ。
+
+        Returns
+        -------
+        page_task : dict
+            推論処理の結果で入力データを置き換えたタスク。
+        """
+        if page_task.get('cache_result') is not None:
+            return page_task
+
+        if self._is_input_over_memory_limit(page_task):
+            return self._abort_pages_by_memory(proc, [page_task])[0]
+
+        start_proc = time.time()
+        page_task['queue_wait'] += start_proc - page_task['stage_end']
+        single_page_output = []
+        try:
+            with self._profile(proc), self._measure_memory(proc):
+                for idx, single_data_input in enumerate(page_task['page_data']):
                     single_data_output = proc.do(idx, single_data_input)
                     single_page_output.extend(single_data_output)
-                # save inference result data to dump
-                if self.cfg['dump'] and 'xml' in single_image_file_data[0].keys():
-                    pred_xml_dict_for_dump[proc.proc_name].append(single_image_file_data[0]['xml'])
+        except Exception as err:
+            if self.memory_monitor is None or not is_out_of_memory_error(err):
+                raise
+            return self._abort_pages_by_memory(proc, [page_task])[0]
+        self._drop_unused_fields(proc, single_page_output)
+        page_task['page_data'] = single_page_output
+        if self.memory_monitor is not None:
+            array_size = self.memory_monitor.add_result(proc.proc_name, single_page_output)
+            if self.memory_monitor.is_over_limit(array_size):
+                return self._abort_pages_by_memory(proc, [page_task])[0]
+
+        proc_time = time.time() - start_proc
+        self.proc_time_statistics[proc.proc_name].append(proc_time)
+        page_task['proc_time'] += proc_time
+        page_task['stage_times'][proc.proc_name] = proc_time
+        page_task['stage_end'] = time.time()
+        return page_task
+
+    def _run_proc_on_pages(self, proc, page_task_list):
+        """
+        複数ページ分のタスクに含まれる全てのデータに対して、一つの推論処理をまとめて実行します。
 
-                single_image_file_data = single_page_output
-                self.proc_time_statistics[proc.proc_name].append(time.time() - start_proc)
+        Parameters
+        ----------
+        proc : BaseInferenceProcess
+            実行する推論処理。
+        page_task_list : list
+            1ページ分の入力データと処理時間を保持する辞書型データのリスト。
 
-            single_image_file_output = single_image_file_data
-            self.total_time_statistics.append(time.time() - start_page)
+        Returns
+        -------
+        page_task_list : list
+            推論処理の結果で入力データを置き換えたタスクのリスト。
+        """
+        inferred_task_list = [page_task for page_task in page_task_list if page_task.get('cache_result') is None]
+        over_limit_task_ids = set(id(page_task) for page_task in inferred_task_list if self._is_input_over_memory_limit(page_task))
+        if len(over_limit_task_ids) > 0:
+            self._abort_pages_by_memory(proc, [page_task for page_task in inferred_task_list if id(page_task) in over_limit_task_ids])
+            page_task_list = [None if id(page_task) in over_limit_task_ids else page_task for page_task in page_task_list]
+            inferred_task_list = [page_task for page_task in inferred_task_list if id(page_task) not in over_limit_task_ids]
+        if len(inferred_task_list) == 0:
+            return page_task_list
+
+        start_proc = time.time()
+        for page_task in inferred_task_list:
+            page_task['queue_wait'] += start_proc - page_task['stage_end']
+        data_idx_list = []
+        input_data_list = []
+        for page_task in inferred_task_list:
+            for idx, single_data_input in enumerate(page_task['page_data']):
+                data_idx_list.append(idx)
+                input_data_list.append(single_data_input)
+        try:
+            with self._profile(proc), self._measure_memory(proc):
+                output_list = proc.do_batch(data_idx_list, input_data_list)
+        except Exception as err:
+            if self.memory_monitor is None or not is_out_of_memory_error(err):
+                raise
+            return [None if page_task is None else self._abort_pages_by_memory(proc, [page_task])[0]
+                    for page_task in page_task_list]
+
+        # scatter inference results to each page
+        output_idx = 0
+        for page_task in inferred_task_list:
+            single_page_output = []
+            for _ in page_task['page_data']:
+                single_page_output.extend(output_list[output_idx])
+                output_idx += 1
+            self._drop_unused_fields(proc, single_page_output)
+            page_task['page_data'] = single_page_output
+        # processing time of the batch is divided equally among the pages
+        end_proc = time.time()
+        proc_time = (end_proc - start_proc) / len(inferred_task_list)
+
+        if self.memory_monitor is not None:
+            # each page is judged by the arrays of its own result
+            over_limit_task_ids = set()
+            for page_task in inferred_task_list:
+                array_size = self.memory_monitor.add_result(proc.proc_name, page_task['page_data'])
+                if self.memory_monitor.is_over_limit(array_size):
+                    over_limit_task_ids.add(id(page_task))
+            if len(over_limit_task_ids) > 0:
+                self._abort_pages_by_memory(proc, [page_task for page_task in inferred_task_list
+                                                   if id(page_task) in over_limit_task_ids])
+                page_task_list = [None if id(page_task) in over_limit_task_ids else page_task for page_task in page_task_list]
+                inferred_task_list = [page_task for page_task in inferred_task_list if id(page_task) not in over_limit_task_ids]
+
+        for page_task in inferred_task_list:
+            self.proc_time_statistics[proc.proc_name].append(proc_time)
+            page_task['proc_time'] += proc_time
+            page_task['stage_times'][proc.proc_name] = proc_time
+            page_task['stage_end'] = end_proc
+        return page_task_list
+
+    def _profile(self, proc):
+        """
+        --profileオプションが指定されている場合に、withブロック内の処理を推論処理の処理として計測するコンテキストマネージャを返します。
 
-            if self.cfg['save_image'] or self.cfg['partial_infer']:
-                # save inferenced result drawn image in pred_img directory
-                for single_data_output in single_image_file_output:
-                    # save input image while partial inference
-                    if self.cfg['partial_infer']:
-                        img_output_dir = os.path.join(output_dir, 'img')
-                        self._save_image(single_data_output['img'], single_data_output['img_file_name'], img_output_dir)
+        Parameters
+        ----------
+        proc : BaseInferenceProcess
+            実行する推論処理。
+        """
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.profile(proc.proc_name)
 
-                    pred_img = self._create_result_image(single_data_output, self.proc_list[-1].proc_name)
-                    img_output_dir = os.path.join(output_dir, 'pred_img')
-                    self._save_image(pred_img, single_data_output['img_file_name'], img_output_dir)
+    def _measure_memory(self, proc):
+        """
+        メモリ使用量の計測が有効な場合に、withブロック内の処理を推論処理の処理として計測するコンテキストマネージャを返します。
+        計測が無効な場合、withブロックにはNoneが渡されます。
 
-            # save inferenced result text for this page
-            if self.cfg['proc_range']['end'] > 2:
-                sum_main_txt = ''
-                sum_cap_txt = ''
-                sum_ruby_txt = None
-                if self.cfg['ruby_read']:
-                    sum_ruby_txt = ''
-
-                # check if xml output for this image is vertical text
-                vertical_text_page = 0
-                for single_data_output in single_image_file_output:
-                    if self._is_vertical_text_xml(single_data_output['xml']):
-                        vertical_text_page += 1
+        Parameters
+        ----------
+        proc : BaseInferenceProcess
+            実行する推論処理。
+        """
+        if self.memory_monitor is None:
+            return contextlib.nullcontext()
+        return self.memory_monitor.measure(proc.proc_name)
+
+    def _is_input_over_memory_limit(self, page_task):
+        """
+        推論処理を実行する前に、ページの入力データのnumpy配列のサイズがメモリ使用量の上限を超えているかどうかを判定します。
+        最初の推論処理の入力は読み込んだ画像のため、大きな画像は推論処理がメモリを割り当てる前に中止されます。
+
+        Parameters
+        ----------
+        page_task : dict
+            1ページ分の入力データと処理時間を保持する辞書型データ。
+
+        Returns
+        -------
+        [変数なし] : bool
+            上限を超えていればTrue, そうでなければFalseを返します。
+        """
+        if self.memory_monitor is None or self.memory_monitor.max_page_memory <= 0 or page_task.get('cache_result') is not None:
+            return False
+        return self.memory_monitor.is_over_limit(get_array_size(page_task['page_data']))
+
+    def _abort_pages_by_memory(self, proc, page_task_list):
+        """
+        メモリ使用量が上限を超えた、またはメモリ不足が発生したページの推論処理を中止し、ページのデータを解放します。
+        キャッシュの推論結果を利用するページは中止しません。
+
+        Parameters
+        ----------
+        proc : BaseInferenceProcess
+            実行した推論処理。
+        page_task_list : list
+            推論処理を実行したタスクのリスト。
+
+        Returns
+        -------
+        page_task_list : list
+            推論処理を中止したタスクをNoneに置き換えたタスクのリスト。
+        """
+        result = []
+        for page_task in page_task_list:
+            if page_task.get('cache_result') is not None:
+                result.append(page_task)
+                continue
+            print('[ERROR] Page inference is aborted by memory limit in {0} : {1}'.format(
+                proc.proc_name, page_task['img_path']), file=sys.stderr)
+            self.memory_monitor.over_limit_page_num += 1
+            page_task.clear()
+            result.append(None)
+        return result
+
+    def _get_unused_fields(self):
+        """
+        推論処理ごとに、後続の推論処理と推論結果の保存で参照されないPageRecordの項目を求めます。
+        dumpオプションが有効な場合は、各推論処理の結果を保存するため項目を削除しません。
+
+        Returns
+        -------
+        unused_fields : dict
+            推論処理名をキー、その推論処理の後で削除できる項目名のタプルを値とする辞書型データ。
+        """
+        if self.cfg['dump']:
+            return {proc.proc_name: () for proc in self.proc_list}
+
+        # images are referred in saving results only when they are saved
+        needed_fields = set(procs.PageRecord.fields) - {'img', 'dump_img'}
+        if self.cfg['save_image'] or self.cfg['partial_infer']:
+            needed_fields |= {'img', 'dump_img'}
+        unused_fields = {}
+        for proc in reversed(self.proc_list):
+            unused_fields[proc.proc_name] = tuple(field for field in procs.PageRecord.fields if field not in needed_fields)
+            if proc.input_fields is None:
+                needed_fields = set(procs.PageRecord.fields)
+            else:
+                needed_fields |= set(proc.input_fields)
+        return unused_fields
+
+    def _drop_unused_fields(self, proc, single_page_output):
+        """
+        推論処理の結果から、後続の処理で参照されない項目(画像データなど)を削除します。
+
+        Parameters
+        ----------
+        proc : BaseInferenceProcess
+            実行した推論処理。
+        single_page_output : list
+            推論処理の結果のPageRecordのリスト。
+        """
+        unused_fields = self.unused_fields.get(proc.proc_name, ())
+        if len(unused_fields) == 0:
+            return
+        for single_data_output in single_page_output:
+            single_data_output.drop(unused_fields)
 
-                # reverse order of page if it's vertical text
-                single_image_file_output_for_txt = single_image_file_output
-                if vertical_text_page >= len(single_image_file_output):
-                    single_image_file_output_for_txt = list(reversed(single_image_file_output))
+    def _get_batch_cost(self, proc, page_task):
+        """
+        1ページ分のタスクを推論処理でまとめて処理する際のコストを返します。
+
+        Parameters
+        ----------
+        proc : BaseInferenceProcess
+            実行する推論処理。
+        page_task : dict
+            1ページ分の入力データを保持する辞書型データ。
+        """
+        return sum(proc.get_batch_cost(single_data_input) for single_data_input in page_task['page_data'])
 
-                for single_data_output in single_image_file_output_for_txt:
-                    main_txt, cap_txt = self._create_result_txt(single_data_output['xml'])
-                    sum_main_txt += main_txt + '\n'
-                    sum_cap_txt += sum_cap_txt + '\n'
-                    if self.cfg['ruby_read']:
-                        sum_ruby_txt += single_data_output['ruby_txt'] + '\n'
+    def _save_page_result(self, page_task):
+        """
+        1ページ分の推論結果の画像とテキストを出力ディレクトリに保存します。
 
-                self._save_pred_txt(sum_main_txt, sum_cap_txt, sum_ruby_txt, os.path.basename(img_path), single_outputdir_data['output_dir'])
+        Parameters
+        ----------
+        page_task : dict
+            全推論処理が完了した1ページ分のタスク。
 
-            # add inference result for single image file data to pred_list, including XML data
-            pred_list.extend(single_image_file_output)
+        Returns
+        -------
+        page_task : dict
+            入力と同じタスク。
+        """
+        start_write = time.time()
+        page_task['queue_wait'] += start_write - page_task['stage_end']
+        single_image_file_output = page_task['page_data']
+        output_dir = page_task['output_dir']
+        page_task['outputs'] = []
+
+        # save text of inference result in cache
+        cache_result = page_task.get('cache_result')
+        if cache_result is not None:
+            page_task['outputs'].extend(
+                self._save_page_txt(cache_result, os.path.basename(page_task['img_path']), output_dir, page_task['page_bundle']))
+            page_task['line_num'] = sum(element_str.count('<LINE ') for element_str in cache_result['xml'])
+            page_task['stage_times']['write'] = time.time() - start_write
             print('########  END PAGE INFERENCE PROCESS  ########')
+            return page_task
+
+        self.total_time_statistics.append(page_task['proc_time'])
 
-        return pred_list
+        if self.cfg['save_image'] or self.cfg['partial_infer']:
+            # save inferenced result drawn image in pred_img directory
+            for single_data_output in single_image_file_output:
+                # save input image while partial inference
+                if self.cfg['partial_infer']:
+                    img_output_dir = os.path.join(output_dir, 'img')
+                    page_task['outputs'].append(
+                        self._save_image(single_data_output['img'], single_data_output['img_file_name'], img_output_dir))
+
+                pred_img = self._create_result_image(single_data_output, self.proc_list[-1].proc_name)
+                img_output_dir = os.path.join(output_dir, 'pred_img')
+                page_task['outputs'].append(
+                    self._save_image(pred_img, single_data_output['img_file_name'], img_output_dir))
+
+        # save inferenced result text for this page
+        if self.cfg['proc_range']['end'] > 2:
+            # line data are also cached so that cached pages can be saved in the page bundle
+            page_text = serialize_page_text(single_image_file_output, ruby_read=self.cfg['ruby_read'],
+                                            with_lines=(page_task['page_bundle'] is not None) or (self.cache is not None))
+            page_task['result_txt'] = page_text.to_dict()
+            page_task['outputs'].extend(
+                self._save_page_txt(page_task['result_txt'], os.path.basename(page_task['img_path']), output_dir,
+                                    page_task['page_bundle']))
+            page_task['line_num'] = page_text.line_num
+        else:
+            page_task['line_num'] = sum(1 for single_data_output in single_image_file_output
+                                        if single_data_output.get('xml') is not None
+                                        for _ in single_data_output['xml'].getroot().iter('LINE'))
+        page_task['stage_times']['write'] = time.time() - start_write
+        print('########  END PAGE INFERENCE PROCESS  ########')
+        return page_task
+
+    def _create_page_metrics(self, page_task, xml_list=None):
+        """
+        1ページ分のタスクから、メトリクスファイルに記録する計測値を作成します。
+
+        Parameters
+        ----------
+        page_task : dict
+            結果の保存が完了した1ページ分のタスク。
+        xml_list : list
+            書籍単位のXMLに追記したページのXMLの要素の文字列のリストです。XMLを保存しない場合はNoneです。
+
+        Returns
+        -------
+        page_metrics : dict
+            1ページ分の計測値を保持する辞書型データ。
+            書籍の出力ディレクトリ名(book)、入力画像ファイル名(page)、画像サイズ(img_size)、行数(line_num)、
+            キャッシュ利用の有無(cached)、推論処理ごとの処理時間(stage_times)、処理待ち時間(queue_wait)、
+            出力バイト数(written_bytes)を含みます。
+        """
+        return {
+            'book': os.path.basename(page_task['output_dir']),
+            'page': os.path.basename(page_task['img_path']),
+            'img_size': page_task['img_size'],
+            'line_num': page_task['line_num'],
+            'cached': page_task.get('cache_result') is not None,
+            'stage_times': page_task['stage_times'],
+            'total_time': sum(page_task['stage_times'].values()),
+            'queue_wait': page_task['queue_wait'],
+            'written_bytes': sum(len(element_str.encode('utf-8')) for element_str in xml_list) if xml_list is not None else 0
+        }
+
+    def infer_images(self, img_list):
+        """
+        入力画像ファイルのリストに対して推論処理を実行し、結果をファイルに保存せずに返します。
+        推論処理の設定はファイルへの保存を行う場合と同じで、serveモードなどから利用されます。
+
+        Parameters
+        ----------
+        img_list : list
+            入力画像ファイルパスのリストです。
+
+        Returns
+        -------
+        page_result_list : list
+            1ページ分(入力画像1枚分)の推論結果(img_path, xml, main_txt, cap_txt, ruby_txt)を保持する辞書型データのリスト。
+            xmlはページのXMLのルート要素直下の要素を文字列に変換したもののリストです。
+            推論処理に失敗したページは含まれません。
+        """
+        # statistics are not reported in serve mode, so they are reset per call to keep memory usage constant
+        self._reset_statistics()
+        single_outputdir_data = {'img_list': img_list, 'output_dir': None}
+        img_data_list = [{'img_path': img_path} for img_path in img_list]
+        page_result_list = []
+        for page_result in self._run_pages(single_outputdir_data, img_data_list, save_result=False):
+            if page_result is not None:
+                page_result_list.append(page_result)
+        return page_result_list
+
+    def _create_page_result(self, page_task):
+        """
+        1ページ分の推論結果から、ファイルに保存せずに返すための推論結果を作成します。
+        推論結果はキャッシュが有効な場合はキャッシュに保存されます。
+
+        Parameters
+        ----------
+        page_task : dict
+            全推論処理が完了した1ページ分のタスク。
+
+        Returns
+        -------
+        page_result : dict
+            1ページ分の推論結果(img_path, xml, main_txt, cap_txt, ruby_txt)を保持する辞書型データ。
+        """
+        cache_result = page_task.get('cache_result')
+        if cache_result is not None:
+            page_result = dict(cache_result)
+        else:
+            page_result = {'main_txt': '', 'cap_txt': '', 'ruby_txt': None}
+            if self.cfg['proc_range']['end'] > 2:
+                page_result.update(serialize_page_text(page_task['page_data'], ruby_read=self.cfg['ruby_read'],
+                                                       with_lines=self.cache is not None).to_dict())
+            page_result['xml'] = [ET.tostring(element, encoding='unicode')
+                                  for single_data_output in page_task['page_data'] if 'xml' in single_data_output.keys()
+                                  for element in single_data_output['xml'].getroot()]
+            if self.cache is not None and page_task.get('cache_key') is not None:
+                self.cache.put(page_task['cache_key'], page_result)
+        page_result['img_path'] = page_task['img_path']
+        print('########  END PAGE INFERENCE PROCESS  ########')
+        return page_result
 
     def _get_single_dir_data(self, input_dir):
         """
@@ -296,7 +996,7 @@ class OcrInferrer:
         # Fixme
         single_dir_data : dict
             XML一つ分のデータ（基本的に1PID分を想定）の入力データ情報です。
-            画像ファイルパスのリスト、それらに対応するXMLデータを含みます。
+            画像ファイルパスのリスト、それらに対応するXMLデータのページ索引(PageXmlIndex)を含みます。
         """
         single_dir_data = {'input_dir': os.path.abspath(input_dir)}
         single_dir_data['img_list'] = []
@@ -336,7 +1036,8 @@ class OcrInferrer:
             else:
                 input_xml = xml_file_list[0]
             try:
-                single_dir_data['xml'] = ET.parse(input_xml)
+                # pages are read from the xml file when they are processed
+                single_dir_data['page_index'] = PageXmlIndex(input_xml)
             except xml.etree.ElementTree.ParseError as err:
                 print("[ERROR] XML parse error : {0}".format(input_xml), file=sys.stderr)
                 return None
@@ -357,7 +1058,11 @@ class OcrInferrer:
             return None
 
         # output directory existence check
-        output_dir = utils.mkdir_with_duplication_check(output_dir)
+        # (existing output directory is reused to continue previous run while resuming)
+        if self.cfg['resume']:
+            os.makedirs(output_dir, exist_ok=True)
+        else:
+            output_dir = utils.mkdir_with_duplication_check(output_dir)
         single_dir_data['output_dir'] = output_dir
 
         return [single_dir_data]
@@ -408,7 +1113,7 @@ class OcrInferrer:
 
         return single_dir_data_list
 
-    def _get_single_image_file_data(self, img_path, single_dir_data):
+    def _get_single_image_file_data(self, img_path, single_dir_data, orig_img=None):
         """
         1ページ分の入力データに関する情報を整理して取得します。
 
@@ -419,57 +1124,50 @@ class OcrInferrer:
         single_dir_data : dict
             1書籍分の入力データに関する情報を保持する辞書型データです。
             xmlファイルへのパス、結果を出力するディレクトリのパスなどを含みます。
+        orig_img : numpy.ndarray
+            読み込み済みの入力画像データです。Noneの場合は画像ファイルから読み込みます。
 
         Returns
         -------
-        single_image_file_data : dict
-            1ページ分のデータの入力データ情報です。
+        single_image_file_data : list
+            1ページ分のデータの入力データ情報(PageRecord)のリストです。
             画像ファイルのパスとnumpy.ndarray形式の画像データ、その画像に対応するXMLデータを含みます。
         """
-        single_image_file_data = [{
+        single_image_file_data = [procs.PageRecord({
             'img_path': img_path,
             'img_file_name': os.path.basename(img_path) if isinstance(img_path, str) else None,
             'output_dir': single_dir_data['output_dir']
-        }]
+        })]
 
-        full_xml = None
-        if 'xml' in single_dir_data.keys():
-            full_xml = single_dir_data['xml']
+        page_index = None
+        if 'page_index' in single_dir_data.keys():
+            page_index = single_dir_data['page_index']
 
         # get img data for single page
         if isinstance(img_path, str):
-            orig_img = cv2.imread(img_path)
+            if orig_img is None:
+                orig_img = cv2.imread(img_path)
             if orig_img is None:
                 print('[ERROR] Image read error : {0}'.format(img_path), file=sys.stderr)
                 return None
             single_image_file_data[0]['img'] = orig_img
 
         # return if this proc needs only img data for input
-        if full_xml is None:
+        if page_index is None:
             return single_image_file_data
 
+        # in ruby_only mode, img_path is the index of the page in the xml
+        if self.cfg['ruby_only']:
+            page = page_index.get_page(img_path) if 0 <= img_path < len(page_index) else None
+        else:
+            page = page_index.find_page(os.path.basename(img_path))
+        if page is not None:
+            node = ET.Element('OCRDATASET')
+            node.append(page)
+            single_image_file_data[0]['xml'] = ET.ElementTree(node)
         if self.cfg['ruby_only']:
-            tmp_idx = 0
-            for page in full_xml.getroot().iter('PAGE'):
-                if tmp_idx == img_path:
-                    node = ET.fromstring(self.xml_template)
-                    node.append(page)
-                    tree = ET.ElementTree(node)
-                    single_image_file_data[0]['xml'] = tree
-                    break
-                tmp_idx += 1
             return single_image_file_data
 
-        # get xml data for single page
-        image_name = os.path.basename(img_path)
-        for page in full_xml.getroot().iter('PAGE'):
-            if page.attrib['IMAGENAME'] == image_name:
-                node = ET.fromstring(self.xml_template)
-                node.append(page)
-                tree = ET.ElementTree(node)
-                single_image_file_data[0]['xml'] = tree
-                break
-
         if 'xml' not in single_image_file_data[0].keys():
             print('[ERROR] Input PAGE data for page {} not found in XML data.'.format(img_path), file=sys.stderr)
             return None
@@ -486,54 +1184,205 @@ class OcrInferrer:
             推論実行時の設定情報を保存した辞書型データ。
         """
         if cfg['ruby_only']:
-            return [procs.RubyReadingProcess(cfg, 'ex2')]
+            return self._load_procs(cfg, [(procs.RubyReadingProcess, 'ex2')])
 
-        proc_list = []
+        proc_specs = []
         for i in range(cfg['proc_range']['start'], cfg['proc_range']['end'] + 1):
-            proc_list.append(self.full_proc_list[i](cfg, i))
+            proc_specs.append((getattr(procs, self.full_proc_list[i]), i))
         if cfg['line_order']:
             if cfg['proc_range']['end'] <= 2:
                 print('[WARNING] LineOrderProcess will be skipped(this process needs LineOcrProcess output).')
             else:
-                proc_list.append(procs.LineOrderProcess(cfg, 'ex1'))
+                proc_specs.append((procs.LineOrderProcess, 'ex1'))
         if cfg['ruby_read']:
             if cfg['proc_range']['end'] <= 2 or not cfg['line_order']:
                 print('[WARNING] RubyReadingProcess will be skipped(this process needs LineOrderProcess output).')
             else:
-                proc_list.append(procs.RubyReadingProcess(cfg, 'ex2'))
+                proc_specs.append((procs.RubyReadingProcess, 'ex2'))
         if cfg['line_attribute']['add_title_author']:
             if cfg['proc_range']['end'] <= 2:
                 print('[WARNING] LineAttributeProcess will be skipped(this process needs LineOcrProcess output).')
             else:
-                proc_list.append(procs.LineAttributeProcess(cfg, 'ex3'))
+                proc_specs.append((procs.LineAttributeProcess, 'ex3'))
+
+        return self._load_procs(cfg, proc_specs)
+
+    def _load_procs(self, cfg, proc_specs):
+        """
+        推論処理のインスタンスを作成します。
+        推論処理ごとのモデルの読み込みは互いに独立しているため、スレッドプールで並列に実行し、
+        推論処理ごとの読み込み時間を表示します。
+
+        Parameters
+        ----------
+        cfg : dict
+            推論実行時の設定情報を保存した辞書型データ。
+        proc_specs : list
+            推論処理のクラスと、実行される順序を表す数値または文字列の組のリストです。
+
+        Returns
+        -------
+        proc_list : list
+            推論処理のインスタンスのリストです。proc_specsと同じ順序で格納されます。
+        """
+        def load_proc(proc_class, proc_id):
+            start = time.time()
+            proc = proc_class(cfg, proc_id)
+            return proc, time.time() - start
+
+        num_workers = min(cfg['model_loading']['num_workers'], len(proc_specs))
+        start = time.time()
+        if num_workers <= 1:
+            load_results = [load_proc(proc_class, proc_id) for proc_class, proc_id in proc_specs]
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=num_workers,
+                                                       thread_name_prefix='model_loading') as executor:
+                futures = [executor.submit(load_proc, proc_class, proc_id) for proc_class, proc_id in proc_specs]
+                # wait for all procs before raising an error of any of them
+                concurrent.futures.wait(futures)
+                load_results = [future.result() for future in futures]
+        total_time = time.time() - start
+
+        self.proc_load_time = {proc.proc_name: load_time for proc, load_time in load_results}
+        print('================== MODEL LOADING TIME ==================')
+        for proc_name, load_time in self.proc_load_time.items():
+            print(f'Loading time ({proc_name})'.ljust(45, ' ') + f': {load_time:8.4f} sec')
+        print(f'Loading time (total, {max(num_workers, 1)} workers)'.ljust(45, ' ') + f': {total_time:8.4f} sec')
+        return [proc for proc, _ in load_results]
+
+    def _create_dump_writer(self):
+        """
+        dumpオプションが有効な場合に、各推論処理の結果を出力するライターを作成し、推論処理に設定します。
+
+        Returns
+        -------
+        dump_writer : DumpWriter
+            推論処理の結果を出力するライターです。dumpオプションが無効な場合はNoneです。
+        """
+        dump_writer = None
+        if self.cfg['dump']:
+            dump_writer = DumpWriter(self.cfg['dump_output'], self.writer)
+        for proc in self.proc_list:
+            proc.dump_writer = dump_writer
+        return dump_writer
+
+    def _create_metrics(self):
+        """
+        推論の設定情報に基づき、ページごとの計測値を記録するメトリクスファイルを作成します。
+
+        Returns
+        -------
+        metrics : PageMetricsRecorder
+            計測値を記録するPageMetricsRecorder。メトリクスの記録が無効な場合はNoneを返します。
+        """
+        if not self.cfg['metrics']['enable'] or self.cfg['ruby_only']:
+            return None
+        return PageMetricsRecorder(os.path.join(self.cfg['output_root'], self.cfg['metrics']['file_name']),
+                                   self.cfg['metrics']['prometheus_path'])
+
+    def _create_memory_monitor(self):
+        """
+        推論の設定情報に基づき、推論処理ごとのメモリ使用量を計測するMemoryMonitorを作成します。
+
+        Returns
+        -------
+        memory_monitor : MemoryMonitor
+            メモリ使用量を計測するMemoryMonitor。計測が無効で、メモリ使用量の上限も設定されていない場合はNoneを返します。
+        """
+        memory_cfg = self.cfg['memory_monitor']
+        if not memory_cfg['enable'] and memory_cfg['max_page_memory_mb'] <= 0:
+            return None
+        return MemoryMonitor(memory_cfg['tracemalloc_interval'], memory_cfg['tracemalloc_top'], memory_cfg['max_page_memory_mb'])
+
+    def _create_cache(self, cfg):
+        """
+        推論の設定情報に基づき、推論結果のキャッシュを作成します。
+        キャッシュはテキストとXMLのみを保存するため、画像を出力する設定の場合は利用できません。
+
+        Parameters
+        ----------
+        cfg : dict
+            推論実行時の設定情報を保存した辞書型データ。
 
-        return proc_list
+        Returns
+        -------
+        cache : InferenceCache
+            推論結果のキャッシュ。利用しない場合はNoneを返します。
+        """
+        if not cfg['inference_cache']['enable']:
+            return None
+        if cfg['ruby_only'] or cfg['partial_infer'] or cfg['save_image'] or cfg['dump']:
+            print('[WARNING] Inference cache is disabled because it is not supported with ruby_only, partial inference, save_image and dump.')
+            return None
+        return InferenceCache(cfg['inference_cache']['cache_dir'],
+                              cfg['inference_cache']['max_size_mb'],
+                              create_config_hash(cfg))
+
+    def _need_pred_xml(self):
+        """
+        書籍単位の推論結果のXMLファイルを保存する設定かどうかを判定します。
+
+        Returns
+        -------
+        [変数なし] : bool
+            保存する場合はTrue, そうでなければFalseを返します。
+        """
+        return (self.cfg['save_xml'] or self.cfg['partial_infer']) and (self.cfg['proc_range']['end'] > 1)
 
-    def _save_pred_xml(self, output_dir, pred_list, sorted):
+    def _need_page_xml(self):
         """
-        推論結果のXMLデータをまとめたXMLファイルを生成して保存します。
+        ページごとの推論結果のXMLをマニフェストに記録する必要があるかどうかを判定します。
+        書籍単位のXMLファイルか行の表を保存する場合は、再開時や結合時に利用するためにXMLを記録します。
+
+        Returns
+        -------
+        [変数なし] : bool
+            記録する場合はTrue, そうでなければFalseを返します。
+        """
+        return self._need_pred_xml() or self.line_table_format is not None
+
+    def _open_pred_xml(self, output_dir):
+        """
+        推論結果のXMLデータをページごとに追記するXMLファイルを開きます。
+        XMLファイルを保存しない設定の場合はNoneを返します。
 
         Parameters
         ----------
         output_dir : str
             推論結果を保存するディレクトリのパスです。
-        pred_list : list
-            1ページ分の推論結果を要素に持つ推論結果のリスト。
-            各結果は辞書型で保持されています。
-        sorted : bool
-            読み順認識が実行されたかどうかのフラグ。
+
+        Returns
+        -------
+        pred_xml_writer : StreamingXmlWriter
+            推論結果のXMLを追記するライター。
         """
-        xml_dir = os.path.join(output_dir, 'xml')
-        os.makedirs(xml_dir, exist_ok=True)
+        if not self._need_pred_xml():
+            return None
+
+        xml_path = self._get_pred_xml_path(output_dir)
+        os.makedirs(os.path.dirname(xml_path), exist_ok=True)
+        return StreamingXmlWriter(xml_path)
 
+    def _get_pred_xml_path(self, output_dir):
+        """
+        書籍単位の推論結果のXMLファイルのパスを返します。
+
+        Parameters
+        ----------
+        output_dir : str
+            推論結果を保存するディレクトリのパスです。
+
+        Returns
+        -------
+        xml_path : str
+            XMLファイルのパスです。
+        """
         # basically, output_dir is supposed to be PID, so it used as xml filename
-        if sorted:
-            xml_path = os.path.join(xml_dir, '{}.sorted.xml'.format(os.path.basename(output_dir)))
-        else:
-            xml_path = os.path.join(xml_dir, '{}.xml'.format(os.path.basename(output_dir)))
-        pred_xml = self._parse_pred_list_to_save(pred_list)
-        utils.save_xml(pred_xml, xml_path)
-        return
+        # (file name has .sorted suffix when line order process is executed)
+        xml_dir = os.path.join(output_dir, 'xml')
+        if self.cfg['line_order']:
+            return os.path.join(xml_dir, '{}.sorted.xml'.format(os.path.basename(output_dir)))
+        return os.path.join(xml_dir, '{}.xml'.format(os.path.basename(output_dir)))
 
     def _save_image(self, pred_img, orig_img_name, img_output_dir, id=''):
         """
@@ -552,6 +1401,11 @@ class OcrInferrer:
         id : str
             もともとの入力画像のファイル名に追加する処理結果ごとのidです。
             一つの入力画像から複数の画像データが出力される処理がある場合に必要になります。
+
+        Returns
+        -------
+        output : tuple
+            保存先のファイルパスと、保存処理の完了を待つためのFutureの組。
         """
         os.makedirs(img_output_dir, exist_ok=True)
         stem, ext = os.path.splitext(orig_img_name)
@@ -562,13 +1416,94 @@ class OcrInferrer:
             orig_img_name = stem + '_' + id + ext
 
         img_path = os.path.join(img_output_dir, orig_img_name)
-        try:
-            cv2.imwrite(img_path, pred_img)
-        except OSError as err:
-            print("[ERROR] Image save error: {0}".format(err), file=sys.stderr)
-            raise OSError
+        return (img_path, self.writer.submit(write_image, img_path, pred_img))
 
-        return
+    def _get_line_table_format(self, cfg):
+        """
+        configのline_tableの項目に基づき、書籍ごとの行の表の出力形式を決定します。
+        parquet形式に必要なライブラリが利用できない場合はnpy形式で出力します。
+
+        Parameters
+        ----------
+        cfg : dict
+            本実行処理における設定情報です。
+
+        Returns
+        -------
+        table_format : str
+            行の表の出力形式です。表を出力しない場合はNoneを返します。
+        """
+        if not cfg['line_table']['enable']:
+            return None
+        if cfg['proc_range']['end'] <= 1:
+            print('[WARNING] Line table is not saved because layout extraction is not executed.')
+            return None
+        table_format = cfg['line_table']['format']
+        if table_format == 'parquet' and not is_parquet_available():
+            print('[WARNING] Line table is saved in npy format because pandas with pyarrow or fastparquet is not available.')
+            table_format = 'npy'
+        return table_format
+
+    def _open_line_table(self, output_dir):
+        """
+        configのline_tableの項目が有効な場合に、1書籍分の行の表を作成するライターを作成します。
+
+        Parameters
+        ----------
+        output_dir : str
+            書籍の推論結果を保存するディレクトリのパスです。
+
+        Returns
+        -------
+        line_table : LineTableWriter
+            1書籍分の行を追加する表のライター。表を作成しない場合はNoneです。
+        """
+        if self.line_table_format is None:
+            return None
+        return LineTableWriter(output_dir, self.line_table_format)
+
+    def _open_page_bundle(self, output_dir):
+        """
+        configのpage_bundleの項目が有効な場合に、1書籍分のテキストを保存するバンドルを作成します。
+
+        Parameters
+        ----------
+        output_dir : str
+            書籍の推論結果を保存するディレクトリのパスです。
+
+        Returns
+        -------
+        page_bundle : PageBundleWriter
+            1書籍分のテキストを追記するライター。バンドルを作成しない場合はNoneです。
+        """
+        if not self.cfg['page_bundle']['enable']:
+            return None
+        return PageBundleWriter(output_dir)
+
+    def _save_page_txt(self, page_txt, orig_img_name, output_dir, page_bundle=None):
+        """
+        1ページ分の推論結果のテキストを保存します。
+        バンドルが指定された場合はバンドルに追記し、指定されない場合はテキストファイルに保存します。
+
+        Parameters
+        ----------
+        page_txt : dict
+            1ページ分のテキスト(main_txt, cap_txt, ruby_txt)と、行ごとのデータ(lines)を保持する辞書型データ。
+        orig_img_name : str
+            もともとの入力画像ファイル名。
+        output_dir : str
+            推論結果を保存するディレクトリのパス。
+        page_bundle : PageBundleWriter
+            1書籍分のテキストを追記するライター。
+
+        Returns
+        -------
+        outputs : list
+            保存先のファイルパスと、保存処理の完了を待つためのFutureの組のリスト。
+        """
+        if page_bundle is not None:
+            return [(page_bundle.path, self.writer.submit(page_bundle.write_page, orig_img_name, page_txt))]
+        return self._save_pred_txt(page_txt['main_txt'], page_txt['cap_txt'], page_txt['ruby_txt'], orig_img_name, output_dir)
 
     def _save_pred_txt(self, main_txt, cap_txt, ruby_txt, orig_img_name, output_dir):
         """
@@ -587,58 +1522,20 @@ class OcrInferrer:
             基本的にはこのファイル名と同名で保存します。
         img_output_dir : str
             画像ファイルの保存先のディレクトリパス。
+
+        Returns
+        -------
+        outputs : list
+            保存先のファイルパスと、保存処理の完了を待つためのFutureの組のリスト。
         """
         txt_dir = os.path.join(output_dir, 'txt')
         os.makedirs(txt_dir, exist_ok=True)
 
-        stem, _ = os.path.splitext(orig_img_name)
-        txt_path = os.path.join(txt_dir, stem + '_cap.txt')
-        try:
-            with open(txt_path, 'w') as f:
-                f.write(cap_txt)
-        except OSError as err:
-            print("[ERROR] Caption text save error: {0}".format(err), file=sys.stderr)
-            raise OSError
-
-        stem, _ = os.path.splitext(orig_img_name)
-        txt_path = os.path.join(txt_dir, stem + '_main.txt')
-        try:
-            with open(txt_path, 'w') as f:
-                f.write(main_txt)
-        except OSError as err:
-            print("[ERROR] Main text save error: {0}".format(err), file=sys.stderr)
-            raise OSError
-
-        if ruby_txt is not None:
-            stem, _ = os.path.splitext(orig_img_name)
-            txt_path = os.path.join(txt_dir, stem + '_ruby.txt')
-            try:
-                with open(txt_path, 'w') as f:
-                    f.write(ruby_txt)
-            except OSError as err:
-                print("[ERROR] Ruby text save error: {0}".format(err), file=sys.stderr)
-                raise OSError
-
-        return
-
-    def _parse_pred_list_to_save(self, pred_list):
-        """
-        推論結果のXMLを要素に持つリストから、ファイルに保存するための一つのXMLデータを生成します。
-
-        Parameters
-        ----------
-        pred_list : list
-            推論結果のXMLを要素に持つリスト。
-        """
-        ET.register_namespace('', 'NDLOCRDATASET')
-        node = ET.fromstring(self.xml_template)
-        for single_xml_tree in pred_list:
-            root = single_xml_tree.getroot()
-            for element in root:
-                node.append(element)
-
-        tree = ET.ElementTree(node)
-        return tree
+        outputs = []
+        for txt_name, txt in get_page_txt_files(orig_img_name, main_txt, cap_txt, ruby_txt):
+            txt_path = os.path.join(txt_dir, txt_name)
+            outputs.append((txt_path, self.writer.submit(write_text, txt_path, txt)))
+        return outputs
 
     def _create_result_image(self, result, proc_name):
         """
@@ -664,44 +1561,3 @@ class OcrInferrer:
             cv2.putText(dump_img, proc_name, (0, 50),
                         cv2.FONT_HERSHEY_PLAIN, 4, (0, 0, 0), 5, cv2.LINE_AA)
         return dump_img
-
-    def _create_result_txt(self, xml_data):
-        """
-        推論結果のxmlデータからテキストデータを生成します。
-
-        Parameters
-        ----------
-        xml_data :
-            1ページ分の推論結果を持つxmlデータ。
-        """
-        main_txt = ''
-        cap_txt = ''
-        for page_xml in xml_data.iter('PAGE'):
-            for line_xml in page_xml.iter('LINE'):
-                main_txt += line_xml.attrib['STRING']
-                main_txt += '\n'
-                if line_xml.attrib['TYPE'] == 'キャプション':
-                    cap_txt += line_xml.attrib['STRING']
-                    cap_txt += '\n'
-
-        return main_txt, cap_txt
-
-    def _is_vertical_text_xml(self, xml_data):
-        """
-        与えられたxmlデータが縦書きテキストかどうか判定します
-
-        Parameters
-        ----------
-        xml_data :
-            1ページ分の推論結果を持つxmlデータ。
-        """
-        all_line_num = 0
-        vertical_line_num = 0
-        for page_xml in xml_data.iter('PAGE'):
-            for line_xml in page_xml.iter('LINE'):
-                w = int(line_xml.attrib['WIDTH'])
-                h = int(line_xml.attrib['HEIGHT'])
-                if w < h:
-                    vertical_line_num += 1
-                all_line_num += 1
-        return (all_line_num / 2) < vertical_line_num
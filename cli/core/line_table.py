@@ -0,0 +1,292 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+# formats of the line table: 'npy' saves a numpy array file per column, 'parquet' saves a pandas DataFrame (requires pyarrow or fastparquet)
+LINE_TABLE_FORMATS = ['npy', 'parquet']
+
+# elements saved as rows of the line table
+TABLE_ELEMENT_TAGS = ['LINE', 'BLOCK']
+
+
+def is_parquet_available():
+    """
+    pandasとparquetの書き込みに必要なライブラリ(pyarrowまたはfastparquet)が利用できるかどうかを返します。
+    """
+    try:
+        import pandas
+        pandas.io.parquet.get_engine('auto')
+    except ImportError:
+        return False
+    return True
+
+
+class LineTableWriter:
+    """
+    1書籍分の推論結果のXMLのLINE要素とBLOCK要素を、1要素1行の列指向の表(line table)として保存します。
+    StreamingXmlWriterと同じようにページごとに要素を追加し、終了時に書籍の出力ディレクトリに保存します。
+    後段の処理はXMLを解析せずに、必要な列のみを読み込んで行を絞り込むことができます。
+
+    formatが'npy'の場合はlinesディレクトリに以下の配列を1配列1ファイル(<配列名>.npy)で保存します。
+    各ファイルはメモリマップで開くことができ、読み込んだ列の参照した範囲のみが読み込まれます。
+
+    - page, tag, type : 各行のページ(PAGE要素のIMAGENAME)、要素名、種別(TYPE)の番号(int32)です。
+      番号に対応する文字列はそれぞれpage_names, tag_names, type_namesの配列に保存されます。
+    - x, y, width, height, order : 位置と読み順(ORDER)です(int32、ORDERがない場合は-1)。
+    - conf : 確信度です(float32、CONFがない場合はNaN)。
+    - title, author : タイトル・著者と推定された行かどうかです(bool)。
+    - string_data, string_offsets : 文字列(STRING)をUTF-8で連結したバイト列と、各行の開始位置(行数＋1個、int64)です。
+      i行目の文字列はstring_data[string_offsets[i]:string_offsets[i+1]]です。
+
+    formatが'parquet'の場合はlines.parquetに同じ列を保存します(page, tag, type, stringは文字列の列です)。
+
+    Attributes
+    ----------
+    path : str
+        出力するファイル(formatが'npy'の場合はディレクトリ)のパスです。
+    format : str
+        出力形式('npy'または'parquet')です。
+    row_num : int
+        これまでに追加した行数です。
+    """
+
+    file_stem = 'lines'
+
+    def __init__(self, output_dir, table_format='npy'):
+        """
+        Parameters
+        ----------
+        output_dir : str
+            推論結果を保存するディレクトリのパスです。
+        table_format : str
+            出力形式('npy'または'parquet')です。
+        """
+        self.format = table_format
+        if table_format == 'parquet':
+            self.path = os.path.join(output_dir, '{0}.parquet'.format(self.file_stem))
+        else:
+            self.path = os.path.join(output_dir, self.file_stem)
+        self.row_num = 0
+        self._closed = False
+        # string -> code of categorical columns
+        self._page_codes = {}
+        self._tag_codes = {}
+        self._type_codes = {}
+        self._columns = {name: [] for name in ['page', 'tag', 'type', 'x', 'y', 'width', 'height',
+                                               'conf', 'order', 'title', 'author', 'string']}
+
+    def write_page(self, xml_tree):
+        """
+        1ページ分の推論結果のXMLから、ルート要素直下の要素に含まれる行を追加します。
+
+        Parameters
+        ----------
+        xml_tree : xml.etree.ElementTree.ElementTree
+            1ページ分の推論結果のXMLデータです。
+        """
+        for element in xml_tree.getroot():
+            self.write_element(element)
+
+    def write_element(self, element):
+        """
+        ルート要素直下の要素(PAGE要素)に含まれるLINE要素とBLOCK要素を、文書順に行として追加します。
+
+        Parameters
+        ----------
+        element : xml.etree.ElementTree.Element
+            追加する要素です。
+        """
+        page_code = _get_code(self._page_codes, element.attrib.get('IMAGENAME', ''))
+        columns = self._columns
+        for child in element.iter():
+            if child.tag not in TABLE_ELEMENT_TAGS:
+                continue
+            attrib = child.attrib
+            columns['page'].append(page_code)
+            columns['tag'].append(_get_code(self._tag_codes, child.tag))
+            columns['type'].append(_get_code(self._type_codes, attrib.get('TYPE', '')))
+            columns['x'].append(int(attrib.get('X', 0)))
+            columns['y'].append(int(attrib.get('Y', 0)))
+            columns['width'].append(int(attrib.get('WIDTH', 0)))
+            columns['height'].append(int(attrib.get('HEIGHT', 0)))
+            columns['conf'].append(float(attrib.get('CONF', 'nan')))
+            columns['order'].append(int(attrib.get('ORDER', -1)))
+            columns['title'].append(attrib.get('TITLE', '').upper() == 'TRUE')
+            columns['author'].append(attrib.get('AUTHOR', '').upper() == 'TRUE')
+            columns['string'].append(attrib.get('STRING', ''))
+            self.row_num += 1
+
+    def write_serialized_element(self, element_str):
+        """
+        文字列に変換済みのルート要素直下の要素に含まれる行を追加します。
+
+        Parameters
+        ----------
+        element_str : str
+            ElementTree.tostringで文字列に変換した要素です。
+        """
+        self.write_element(ET.fromstring(element_str))
+
+    def close(self):
+        """
+        追加した全ての行をファイルに保存します。
+        """
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self.format == 'parquet':
+                self._save_parquet()
+            else:
+                self._save_npy()
+        except (OSError, ImportError, ValueError) as err:
+            print('[ERROR] Line table save error : {0} ({1})'.format(self.path, err), file=sys.stderr)
+            return
+        print('### save line table : {0} ({1} rows) ###'.format(self.path, self.row_num))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_arrays(self):
+        # numpy is imported here so that parsing config does not load it
+        import numpy as np
+        columns = self._columns
+        return {
+            'page': np.asarray(columns['page'], dtype=np.int32),
+            'tag': np.asarray(columns['tag'], dtype=np.int32),
+            'type': np.asarray(columns['type'], dtype=np.int32),
+            'x': np.asarray(columns['x'], dtype=np.int32),
+            'y': np.asarray(columns['y'], dtype=np.int32),
+            'width': np.asarray(columns['width'], dtype=np.int32),
+            'height': np.asarray(columns['height'], dtype=np.int32),
+            'conf': np.asarray(columns['conf'], dtype=np.float32),
+            'order': np.asarray(columns['order'], dtype=np.int32),
+            'title': np.asarray(columns['title'], dtype=bool),
+            'author': np.asarray(columns['author'], dtype=bool)
+        }
+
+    def _save_npy(self):
+        import numpy as np
+        arrays = self._get_arrays()
+        encoded = [line_str.encode('utf-8') for line_str in self._columns['string']]
+        string_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(line_bytes) for line_bytes in encoded], out=string_offsets[1:])
+        arrays['string_data'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        arrays['string_offsets'] = string_offsets
+        arrays['page_names'] = np.asarray(list(self._page_codes.keys()), dtype=str)
+        arrays['tag_names'] = np.asarray(list(self._tag_codes.keys()), dtype=str)
+        arrays['type_names'] = np.asarray(list(self._type_codes.keys()), dtype=str)
+        # saved as separate files, so that each column can be memory-mapped by readers
+        os.makedirs(self.path, exist_ok=True)
+        for name, array in arrays.items():
+            np.save(os.path.join(self.path, name + '.npy'), array, allow_pickle=False)
+
+    def _save_parquet(self):
+        import pandas as pd
+        arrays = self._get_arrays()
+        for name, codes in [('page', self._page_codes), ('tag', self._tag_codes), ('type', self._type_codes)]:
+            arrays[name] = pd.Categorical.from_codes(arrays[name], categories=list(codes.keys()))
+        arrays['string'] = self._columns['string']
+        pd.DataFrame(arrays).to_parquet(self.path, index=False)
+
+
+def _get_code(codes, value):
+    code = codes.get(value)
+    if code is None:
+        code = len(codes)
+        codes[value] = code
+    return code
+
+
+class LineTableReader:
+    """
+    LineTableWriterでnpy形式で保存した表を読み込みます。
+    各列の配列は参照時にメモリマップで開かれ、文字列は行ごとに復号されます。
+
+    Attributes
+    ----------
+    path : str
+        表のディレクトリのパスです。
+    page_names : numpy.ndarray
+        page列の番号に対応するPAGE要素のIMAGENAMEの配列です。
+    tag_names : numpy.ndarray
+        tag列の番号に対応する要素名の配列です。
+    type_names : numpy.ndarray
+        type列の番号に対応するTYPEの配列です。
+    """
+
+    def __init__(self, path, mmap_mode='r'):
+        """
+        Parameters
+        ----------
+        path : str
+            表のディレクトリのパスです。
+        mmap_mode : str
+            各列のファイルを開く際のnumpy.loadのmmap_modeです。Noneの場合は列全体をメモリに読み込みます。
+        """
+        self.path = path
+        self.mmap_mode = mmap_mode
+        self._columns = {}
+        self.page_names = self.column('page_names')
+        self.tag_names = self.column('tag_names')
+        self.type_names = self.column('type_names')
+        self._string_data = None
+        self._string_offsets = None
+
+    def __len__(self):
+        return len(self.column('page'))
+
+    def column(self, name):
+        """
+        列の配列を返します。
+
+        Parameters
+        ----------
+        name : str
+            列名(page, tag, type, x, y, width, height, conf, order, title, author)です。
+
+        Returns
+        -------
+        [変数なし] : numpy.ndarray
+            列の配列です。
+        """
+        array = self._columns.get(name)
+        if array is None:
+            import numpy as np
+            array = np.load(os.path.join(self.path, name + '.npy'), mmap_mode=self.mmap_mode, allow_pickle=False)
+            self._columns[name] = array
+        return array
+
+    def get_string(self, row_idx):
+        """
+        row_idx行目の文字列(STRING)を返します。
+        """
+        if self._string_data is None:
+            self._string_data = self.column('string_data')
+            self._string_offsets = self.column('string_offsets')
+        start, end = self._string_offsets[row_idx], self._string_offsets[row_idx + 1]
+        return self._string_data[start:end].tobytes().decode('utf-8')
+
+    def close(self):
+        """
+        開いた列のファイルを閉じます。
+        メモリマップは参照が無くなった時点で解放されるため、close後は取得済みの列の配列を参照しないでください。
+        """
+        self._columns.clear()
+        self._string_data = None
+        self._string_offsets = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
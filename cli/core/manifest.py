@@ -0,0 +1,189 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import json
+import os
+import sys
+import threading
+
+
+class PageManifest:
+    """
+    1書籍分の推論処理が完了したページを、出力ディレクトリ内の追記型のマニフェストファイルに記録します。
+    マニフェストの1行は1ページ(入力画像1枚)分の記録で、入力画像のパス、サイズ、更新日時、
+    出力したファイルのリスト、および書籍単位のXMLを再構成するためのページのXMLを保持します。
+    ページの記録は、そのページの全ての出力ファイルの保存が完了してから追記されます。
+
+    Attributes
+    ----------
+    output_dir : str
+        推論結果を保存するディレクトリのパスです。
+    path : str
+        マニフェストファイルのパスです。
+    """
+
+    file_name = 'manifest.jsonl'
+
+    def __init__(self, output_dir):
+        """
+        Parameters
+        ----------
+        output_dir : str
+            推論結果を保存するディレクトリのパスです。
+        """
+        self.output_dir = output_dir
+        self.path = os.path.join(output_dir, self.file_name)
+        self._lock = threading.Lock()
+        # notified when a page waiting for its output files is recorded
+        self._recorded = threading.Condition(self._lock)
+        self._pending_page_num = 0
+        self._closed = False
+        self._fp = None
+
+    def load_completed_pages(self, img_list, need_xml):
+        """
+        マニフェストファイルから処理済みのページの記録を読み込みます。
+        入力画像のサイズや更新日時が変わっているページ、出力ファイルが存在しないページ、
+        XMLの保存が必要なのにXMLが記録されていないページは処理済みとみなしません。
+
+        Parameters
+        ----------
+        img_list : list
+            1書籍分の入力画像ファイルパスのリストです。
+        need_xml : bool
+            書籍単位のXMLを保存するかどうかのフラグです。
+
+        Returns
+        -------
+        completed_pages : dict
+            入力画像の絶対パスをキー、ページの記録を値とする辞書型データ。
+        """
+        completed_pages = {}
+        entries = self.load_entries()
+        for img_path in img_list:
+            entry = entries.get(os.path.abspath(img_path))
+            if entry is not None and self._is_valid_entry(entry, need_xml):
+                completed_pages[entry['img_path']] = entry
+        return completed_pages
+
+    def load_entries(self):
+        """
+        マニフェストファイルに記録された全てのページの記録を読み込みます。
+        同じ入力画像の記録が複数ある場合は、最後の記録を有効とします。
+
+        Returns
+        -------
+        entries : dict
+            入力画像の絶対パスをキー、ページの記録を値とする辞書型データ。
+        """
+        entries = {}
+        if not os.path.isfile(self.path):
+            return entries
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_num, line in enumerate(f, 1):
+                line = line.strip()
+                if line == '':
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line may be broken when the previous run was killed while writing
+                    print('[WARNING] Broken manifest line is ignored : {0} (line {1})'.format(self.path, line_num))
+                    continue
+                entries[entry['img_path']] = entry
+        return entries
+
+    def record(self, img_path, outputs, xml_list=None):
+        """
+        1ページ分の推論処理の完了を記録します。
+        出力ファイルの保存が完了していない場合は、全ての保存が完了した時点で記録します。
+        いずれかの保存に失敗した場合は記録しません。
+
+        Parameters
+        ----------
+        img_path : str
+            入力画像ファイルのパスです。
+        outputs : list
+            出力ファイルのパスと、その保存処理のFutureの組のリストです。
+        xml_list : list
+            ページのXMLのルート要素直下の要素を文字列に変換したもののリストです。
+        """
+        stat = os.stat(img_path)
+        entry = {
+            'img_path': os.path.abspath(img_path),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'outputs': [os.path.relpath(output_path, self.output_dir) for output_path, _ in outputs]
+        }
+        if xml_list is not None:
+            entry['xml'] = xml_list
+
+        futures = [future for _, future in outputs]
+        if len(futures) == 0:
+            self._append(entry, futures)
+            return
+        remaining = [len(futures)]
+        with self._lock:
+            self._pending_page_num += 1
+
+        def on_output_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                is_last_output = (remaining[0] == 0)
+            if is_last_output:
+                try:
+                    self._append(entry, futures)
+                finally:
+                    with self._lock:
+                        self._pending_page_num -= 1
+                        self._recorded.notify_all()
+
+        for future in futures:
+            future.add_done_callback(on_output_done)
+
+    def close(self):
+        """
+        出力ファイルの保存を待っているページの記録が完了するまで待機してから、マニフェストファイルを閉じます。
+        記録待ちのページの出力ファイルの保存は、事前に開始されている必要があります。
+        """
+        with self._lock:
+            while self._pending_page_num > 0:
+                self._recorded.wait()
+            self._closed = True
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+
+    def _append(self, entry, futures):
+        if not all(future.result() for future in futures):
+            return
+        line = json.dumps(entry, ensure_ascii=False) + '\n'
+        with self._lock:
+            if self._closed:
+                print('[ERROR] Manifest is already closed : {0}'.format(entry['img_path']), file=sys.stderr)
+                return
+            try:
+                if self._fp is None:
+                    self._fp = open(self.path, 'a', encoding='utf-8')
+                self._fp.write(line)
+                self._fp.flush()
+            except OSError as err:
+                print('[ERROR] Manifest save error : {0}'.format(err), file=sys.stderr)
+
+    def _is_valid_entry(self, entry, need_xml):
+        if need_xml and 'xml' not in entry.keys():
+            return False
+        try:
+            stat = os.stat(entry['img_path'])
+        except OSError:
+            return False
+        if stat.st_size != entry['size'] or stat.st_mtime != entry['mtime']:
+            return False
+        for output_path in entry['outputs']:
+            if not os.path.isfile(os.path.join(self.output_dir, output_path)):
+                return False
+        return True
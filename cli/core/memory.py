@@ -0,0 +1,255 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import collections.abc
+import contextlib
+import os
+import resource
+import sys
+import threading
+import tracemalloc
+
+import numpy as np
+
+_MB = 1024 * 1024
+
+# tracemalloc traces allocations of all threads, so only one proc call is traced at a time
+_tracemalloc_lock = threading.Lock()
+
+
+class MemoryMonitor:
+    """
+    推論処理ごとのメモリ使用量を計測します。
+    推論処理の呼び出しの前後のプロセスのRSS、推論結果に含まれるnumpy配列のサイズを記録し、
+    tracemalloc_intervalが指定された場合は、その回数に1回の呼び出しでtracemallocによる割り当て量の上位を記録します。
+    RSSとtracemallocはプロセス全体で計測されるため、先読みやパイプライン実行、ファイル出力のスレッドが同時に動作している場合は
+    他のページの割り当てや初回の呼び出しでの初期化の割り当ても含まれ、推論処理ごとの値は概算になります。
+    max_page_memory_mbが指定された場合は、ページが保持するnumpy配列のサイズ(ページのメモリ使用量)が
+    上限を超えたかどうかを判定します。
+
+    Attributes
+    ----------
+    tracemalloc_interval : int
+        tracemallocで計測する推論処理の呼び出しの間隔です。0の場合は計測しません。
+    tracemalloc_top : int
+        記録する割り当て量の上位の数です。
+    max_page_memory : int
+        1ページのメモリ使用量(byte)の上限です。0の場合は上限を設けません。
+    over_limit_page_num : int
+        メモリ使用量が上限を超えた、またはメモリ不足が発生したため推論処理を中止したページの数です。
+    """
+
+    def __init__(self, tracemalloc_interval=0, tracemalloc_top=5, max_page_memory_mb=0):
+        """
+        Parameters
+        ----------
+        tracemalloc_interval : int
+            tracemallocで計測する推論処理の呼び出しの間隔です。0の場合は計測しません。
+        tracemalloc_top : int
+            記録する割り当て量の上位の数です。
+        max_page_memory_mb : int
+            1ページのメモリ使用量(MB)の上限です。0の場合は上限を設けません。
+        """
+        self.tracemalloc_interval = tracemalloc_interval
+        self.tracemalloc_top = tracemalloc_top
+        self.max_page_memory = int(max_page_memory_mb * _MB)
+        self.over_limit_page_num = 0
+        self._lock = threading.Lock()
+        self._call_num = 0
+        # proc name -> statistics of the proc
+        self._proc_stats = {}
+
+    @contextlib.contextmanager
+    def measure(self, proc_name):
+        """
+        withブロック内の処理を、指定された推論処理の処理としてメモリ使用量を計測します。
+        RSSの増加量は同時に動作している他のスレッドの割り当ても含む概算のため、集計結果の表示のみに利用します。
+
+        Parameters
+        ----------
+        proc_name : str
+            推論処理名です。
+        """
+        with self._lock:
+            self._call_num += 1
+            do_trace = self.tracemalloc_interval > 0 and self._call_num % self.tracemalloc_interval == 0
+        is_tracing = do_trace and not tracemalloc.is_tracing() and _tracemalloc_lock.acquire(blocking=False)
+        if is_tracing:
+            tracemalloc.start()
+        rss_before = get_rss()
+        try:
+            yield
+        finally:
+            rss_after = get_rss()
+            traced = None
+            if is_tracing:
+                try:
+                    _, traced_peak = tracemalloc.get_traced_memory()
+                    snapshot = tracemalloc.take_snapshot()
+                    tracemalloc.stop()
+                    traced = (traced_peak, self._get_top_allocations(snapshot))
+                finally:
+                    _tracemalloc_lock.release()
+            self._update(proc_name, rss_before, rss_after, traced)
+
+    def add_result(self, proc_name, page_data):
+        """
+        推論処理の結果に含まれるnumpy配列の合計サイズを記録します。
+
+        Parameters
+        ----------
+        proc_name : str
+            推論処理名です。
+        page_data : list
+            1ページ分の推論処理の結果を保持する辞書型データのリストです。
+
+        Returns
+        -------
+        array_size : int
+            推論結果に含まれるnumpy配列の合計サイズ(byte)です。
+        """
+        array_size = get_array_size(page_data)
+        with self._lock:
+            stats = self._get_stats(proc_name)
+            stats['max_array_size'] = max(stats['max_array_size'], array_size)
+        return array_size
+
+    def is_over_limit(self, page_memory):
+        """
+        1ページのメモリ使用量が上限を超えているかどうかを判定します。
+        プロセスのRSSではなくページが保持するnumpy配列のサイズで判定するため、読み込み済みのモデルや
+        同時に処理されている他のページのメモリによってページが中止されることはありません。
+
+        Parameters
+        ----------
+        page_memory : int
+            ページの推論処理の入力または結果に含まれるnumpy配列のサイズ(byte)です。
+
+        Returns
+        -------
+        [変数なし] : bool
+            上限を超えていればTrue, そうでなければFalseを返します。
+        """
+        return self.max_page_memory > 0 and page_memory > self.max_page_memory
+
+    def print_report(self):
+        """
+        推論処理ごとのメモリ使用量の集計結果と、プロセスのRSSの最大値を表示します。
+        """
+        print('================== MEMORY USAGE ==================')
+        with self._lock:
+            proc_stats = {proc_name: dict(stats) for proc_name, stats in self._proc_stats.items()}
+        # RSS measured after each process is also considered, since ru_maxrss may be sampled less accurately
+        peak_rss = max([get_peak_rss()] + [stats['max_rss'] for stats in proc_stats.values()])
+        for proc_name, stats in proc_stats.items():
+            print(f'Peak RSS after process ({proc_name})'.ljust(45, ' ') + f': {stats["max_rss"] / _MB:10.1f} MB')
+            print(f'  Max RSS increase'.ljust(45, ' ') + f': {stats["max_rss_increase"] / _MB:10.1f} MB')
+            print(f'  Max numpy array size in result'.ljust(45, ' ') + f': {stats["max_array_size"] / _MB:10.1f} MB')
+            if stats['traced_peak'] is not None:
+                print(f'  Peak traced memory (sampled)'.ljust(45, ' ') + f': {stats["traced_peak"] / _MB:10.1f} MB')
+                for location, size in stats['top_allocations']:
+                    print(f'    {location}'.ljust(45, ' ') + f': {size / _MB:10.1f} MB')
+        print(f'Peak RSS of process'.ljust(45, ' ') + f': {peak_rss / _MB:10.1f} MB')
+        print('(RSS increase and traced memory are measured process-wide, and are approximate while other threads '
+              '(prefetch, pipeline, output writer) run concurrently or on warm-up of the first call)')
+        if self.over_limit_page_num > 0:
+            print(f'Number of pages aborted by memory limit'.ljust(45, ' ') + f': {self.over_limit_page_num}')
+
+    def _get_stats(self, proc_name):
+        if proc_name not in self._proc_stats.keys():
+            self._proc_stats[proc_name] = {
+                'max_rss': 0,
+                'max_rss_increase': 0,
+                'max_array_size': 0,
+                'traced_peak': None,
+                'top_allocations': []
+            }
+        return self._proc_stats[proc_name]
+
+    def _update(self, proc_name, rss_before, rss_after, traced):
+        with self._lock:
+            stats = self._get_stats(proc_name)
+            stats['max_rss'] = max(stats['max_rss'], rss_after)
+            stats['max_rss_increase'] = max(stats['max_rss_increase'], rss_after - rss_before)
+            # allocations of the sampled call with the largest peak are kept
+            if traced is not None and (stats['traced_peak'] is None or traced[0] > stats['traced_peak']):
+                stats['traced_peak'], stats['top_allocations'] = traced
+
+    def _get_top_allocations(self, snapshot):
+        snapshot = snapshot.filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>')
+        ])
+        top_allocations = []
+        for stat in snapshot.statistics('lineno')[:self.tracemalloc_top]:
+            frame = stat.traceback[0]
+            top_allocations.append(('{0}:{1}'.format(os.path.basename(frame.filename), frame.lineno), stat.size))
+        return top_allocations
+
+
+def get_rss():
+    """
+    現在のプロセスのRSS(byte)を返します。
+    /proc/self/statmが利用できない環境では、RSSの最大値を返します。
+    """
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return get_peak_rss()
+
+
+def get_peak_rss():
+    """
+    現在のプロセスのRSSの最大値(byte)を返します。
+    """
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    if sys.platform == 'darwin':
+        return peak_rss
+    return peak_rss * 1024
+
+
+def get_array_size(data):
+    """
+    辞書型データやリストに含まれるnumpy配列の合計サイズ(byte)を返します。
+    """
+    if isinstance(data, np.ndarray):
+        return data.nbytes
+    if isinstance(data, collections.abc.Mapping):
+        return sum(get_array_size(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return sum(get_array_size(value) for value in data)
+    return 0
+
+
+def is_out_of_memory_error(err):
+    """
+    推論処理で送出された例外が、メモリの割り当ての失敗によるものかどうかを判定します。
+    MemoryErrorのほか、PyTorch(torch.cuda.OutOfMemoryErrorを含むRuntimeError)とOpenCV(cv2.error)の
+    割り当て失敗の例外を判定します。
+
+    Parameters
+    ----------
+    err : Exception
+        推論処理で送出された例外です。
+
+    Returns
+    -------
+    [変数なし] : bool
+        メモリの割り当ての失敗であればTrue, そうでなければFalseを返します。
+    """
+    if isinstance(err, MemoryError):
+        return True
+    message = str(err).lower()
+    if isinstance(err, RuntimeError):
+        # torch.cuda.OutOfMemoryError is also a RuntimeError with this message
+        return 'out of memory' in message
+    # cv2 is not imported here, so that the monitor does not load it
+    if type(err).__module__ == 'cv2' and type(err).__name__ == 'error':
+        return 'insufficient memory' in message or 'failed to allocate' in message
+    return False
@@ -0,0 +1,151 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import glob
+import json
+import os
+import shutil
+import sys
+
+from .bundle import PageBundleReader, PageBundleWriter
+from .line_table import LineTableWriter
+from .manifest import PageManifest
+from .writer import StreamingXmlWriter
+
+
+class ShardResultMerger:
+    """
+    シャードを指定して複数の実行環境で推論した結果を、一つの出力ディレクトリに結合します。
+    各シャードの書籍ごとの出力ディレクトリにあるshard.jsonとmanifest.jsonlを元に、
+    テキストや画像のファイルをコピーし、書籍単位のXML、テキストのバンドルと行の表をページの入力順に再構成します。
+
+    Attributes
+    ----------
+    cfg : dict
+        本実行処理における設定情報です。
+    """
+
+    def __init__(self, cfg):
+        """
+        Parameters
+        ----------
+        cfg : dict
+            本実行処理における設定情報です。
+            シャードごとの出力ディレクトリのリスト(shard_roots)と結合結果の出力ディレクトリ(output_root)を含みます。
+        """
+        self.cfg = cfg
+
+    def run(self):
+        """
+        self.cfgに保存された設定に基づいた結合処理を実行します。
+        """
+        book_names = []
+        for shard_root in self.cfg['shard_roots']:
+            for shard_info_path in sorted(glob.glob(os.path.join(shard_root, '*', 'shard.json'))):
+                book_name = os.path.basename(os.path.dirname(shard_info_path))
+                if book_name not in book_names:
+                    book_names.append(book_name)
+
+        if len(book_names) == 0:
+            print('[ERROR] No shard output found in {0}'.format(self.cfg['shard_roots']), file=sys.stderr)
+            return
+
+        missing_page_num = 0
+        for book_name in book_names:
+            missing_page_num += self._merge_book(book_name)
+
+        print('================== MERGE RESULT ==================')
+        print(f'Number of merged books'.ljust(45, ' ') + f': {len(book_names)}')
+        print(f'Number of missing pages'.ljust(45, ' ') + f': {missing_page_num}')
+        return
+
+    def _merge_book(self, book_name):
+        """
+        1書籍分のシャードごとの推論結果を結合します。
+
+        Parameters
+        ----------
+        book_name : str
+            書籍の出力ディレクトリ名です。
+
+        Returns
+        -------
+        missing_page_num : int
+            いずれのシャードにも推論結果が存在しなかったページの数です。
+        """
+        shard_dirs = []
+        for shard_root in self.cfg['shard_roots']:
+            shard_dir = os.path.join(shard_root, book_name)
+            if os.path.isfile(os.path.join(shard_dir, 'shard.json')):
+                shard_dirs.append(shard_dir)
+        with open(os.path.join(shard_dirs[0], 'shard.json'), 'r') as fp:
+            shard_info = json.load(fp)
+
+        # collect completed pages of all shards
+        page_entries = {}
+        for shard_dir in shard_dirs:
+            for entry in PageManifest(shard_dir).load_entries().values():
+                page_entries[os.path.basename(entry['img_path'])] = (shard_dir, entry)
+
+        output_dir = os.path.join(self.cfg['output_root'], book_name)
+        os.makedirs(output_dir, exist_ok=True)
+
+        pred_xml_writer = None
+        if shard_info['xml_name'] is not None:
+            xml_suffix = '.sorted.xml' if shard_info['xml_name'].endswith('.sorted.xml') else '.xml'
+            xml_dir = os.path.join(output_dir, 'xml')
+            os.makedirs(xml_dir, exist_ok=True)
+            pred_xml_writer = StreamingXmlWriter(os.path.join(xml_dir, book_name + xml_suffix))
+
+        # line table is created again from xml of pages recorded in the manifest
+        line_table = None
+        if shard_info.get('line_table_format') is not None:
+            line_table = LineTableWriter(output_dir, shard_info['line_table_format'])
+
+        page_bundle = None
+        shard_bundles = {}
+        missing_img_list = []
+        try:
+            for img_name in shard_info['img_list']:
+                if img_name not in page_entries.keys():
+                    missing_img_list.append(img_name)
+                    continue
+                shard_dir, entry = page_entries[img_name]
+                for output_path in entry['outputs']:
+                    # text of pages in the bundle of each shard is appended to the merged bundle
+                    if output_path == PageBundleWriter.file_name:
+                        if shard_dir not in shard_bundles.keys():
+                            shard_bundles[shard_dir] = PageBundleReader(os.path.join(shard_dir, output_path))
+                        page_record = shard_bundles[shard_dir].get_page(img_name)
+                        if page_record is None:
+                            missing_img_list.append(img_name)
+                            continue
+                        if page_bundle is None:
+                            page_bundle = PageBundleWriter(output_dir)
+                        page_bundle.write_page(img_name, page_record)
+                        continue
+                    dst_path = os.path.join(output_dir, output_path)
+                    os.makedirs(os.path.dirname(dst_path), exist_ok=True)
+                    shutil.copy2(os.path.join(shard_dir, output_path), dst_path)
+                if pred_xml_writer is not None:
+                    for element_str in entry.get('xml', []):
+                        pred_xml_writer.write_serialized_element(element_str)
+                if line_table is not None:
+                    for element_str in entry.get('xml', []):
+                        line_table.write_serialized_element(element_str)
+        finally:
+            if pred_xml_writer is not None:
+                pred_xml_writer.close()
+            if line_table is not None:
+                line_table.close()
+            if page_bundle is not None:
+                page_bundle.close()
+
+        if len(missing_img_list) > 0:
+            print('[WARNING] {0} pages are not found in shard outputs of {1}'.format(len(missing_img_list), book_name))
+            for img_name in missing_img_list:
+                print('          {0}'.format(img_name))
+        return len(missing_img_list)
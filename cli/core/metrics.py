@@ -0,0 +1,213 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import json
+import math
+import os
+import sys
+import threading
+
+# quantiles of processing time exported to prometheus text file
+_QUANTILES = [0.5, 0.95, 0.99]
+
+
+class PageMetricsRecorder:
+    """
+    ページごとの処理時間などの計測値を、JSON Lines形式のメトリクスファイルに1ページ1行で記録します。
+    記録する項目は、ページの識別子、画像サイズ、行数、推論処理ごとの処理時間、処理待ち時間、出力バイト数です。
+    ページの記録は、そのページの全ての出力ファイルの保存が完了してから追記されます。
+    prometheus_pathが指定された場合は、処理ごとの処理時間の分位数(p50/p95/p99)などを
+    Prometheusのtextfile collector形式で出力します。
+
+    Attributes
+    ----------
+    path : str
+        メトリクスファイルのパスです。
+    prometheus_path : str
+        Prometheus形式のメトリクスを出力するファイルのパスです。Noneの場合は出力しません。
+    """
+
+    def __init__(self, path, prometheus_path=None):
+        """
+        Parameters
+        ----------
+        path : str
+            メトリクスファイルのパスです。
+        prometheus_path : str
+            Prometheus形式のメトリクスを出力するファイルのパスです。Noneの場合は出力しません。
+        """
+        self.path = path
+        self.prometheus_path = prometheus_path
+        self._lock = threading.Lock()
+        # notified when a page waiting for its output files is recorded
+        self._recorded = threading.Condition(self._lock)
+        self._pending_page_num = 0
+        self._fp = None
+        self._stage_times = {}
+        self._queue_waits = []
+        self._page_num = 0
+        self._failed_page_num = 0
+        self._written_bytes = 0
+
+    def record(self, page_metrics, outputs):
+        """
+        1ページ分の計測値を記録します。
+        出力ファイルの保存が完了していない場合は、全ての保存が完了した時点で出力バイト数を集計して記録します。
+
+        Parameters
+        ----------
+        page_metrics : dict
+            1ページ分の計測値を保持する辞書型データ。
+            推論処理名をキー、処理時間を値とする辞書型データ(stage_times)と、処理待ち時間(queue_wait)を含みます。
+            出力ファイル以外に出力したバイト数がある場合はwritten_bytesに含めます。
+        outputs : list
+            出力ファイルのパスと、その保存処理のFutureの組のリストです。
+        """
+        futures = [future for _, future in outputs]
+        if len(futures) == 0:
+            self._append(page_metrics, outputs)
+            return
+        remaining = [len(futures)]
+        with self._lock:
+            self._pending_page_num += 1
+
+        def on_output_done(_):
+            with self._lock:
+                remaining[0] -= 1
+                is_last_output = (remaining[0] == 0)
+            if is_last_output:
+                try:
+                    self._append(page_metrics, outputs)
+                finally:
+                    with self._lock:
+                        self._pending_page_num -= 1
+                        self._recorded.notify_all()
+
+        for future in futures:
+            future.add_done_callback(on_output_done)
+
+    def flush(self):
+        """
+        出力ファイルの保存を待っているページの記録が完了するまで待機します。
+        記録待ちのページの出力ファイルの保存は、事前に開始されている必要があります。
+        """
+        with self._lock:
+            while self._pending_page_num > 0:
+                self._recorded.wait()
+
+    def close(self):
+        """
+        記録待ちのページの記録の完了を待ってメトリクスファイルを閉じ、Prometheus形式のメトリクスを出力します。
+        """
+        with self._lock:
+            while self._pending_page_num > 0:
+                self._recorded.wait()
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+        self.write_prometheus()
+
+    def write_prometheus(self):
+        """
+        これまでに記録したページの処理ごとの処理時間の分位数と合計、処理待ち時間、ページ数、出力バイト数を
+        Prometheusのテキスト形式で出力します。
+        出力途中のファイルが読み込まれないよう、一時ファイルに書き込んでから置き換えます。
+        """
+        if self.prometheus_path is None:
+            return
+        with self._lock:
+            stage_times = {stage: sorted(times) for stage, times in self._stage_times.items()}
+            queue_waits = sorted(self._queue_waits)
+            page_num = self._page_num
+            failed_page_num = self._failed_page_num
+            written_bytes = self._written_bytes
+
+        lines = ['# HELP ndlocr_stage_duration_seconds Processing time of each stage per page.',
+                 '# TYPE ndlocr_stage_duration_seconds summary']
+        for stage, times in stage_times.items():
+            lines.extend(_create_summary_lines('ndlocr_stage_duration_seconds', 'stage="{0}"'.format(stage), times))
+        lines.extend(['# HELP ndlocr_page_queue_wait_seconds Time each page waited between stages.',
+                      '# TYPE ndlocr_page_queue_wait_seconds summary'])
+        lines.extend(_create_summary_lines('ndlocr_page_queue_wait_seconds', '', queue_waits))
+        lines.extend(['# HELP ndlocr_pages_total Number of recorded pages.',
+                      '# TYPE ndlocr_pages_total counter',
+                      'ndlocr_pages_total {0}'.format(page_num),
+                      '# HELP ndlocr_output_failed_pages_total Number of pages whose output failed.',
+                      '# TYPE ndlocr_output_failed_pages_total counter',
+                      'ndlocr_output_failed_pages_total {0}'.format(failed_page_num),
+                      '# HELP ndlocr_written_bytes_total Bytes of output files and xml written.',
+                      '# TYPE ndlocr_written_bytes_total counter',
+                      'ndlocr_written_bytes_total {0}'.format(written_bytes)])
+
+        tmp_path = self.prometheus_path + '.tmp'
+        try:
+            prometheus_dir = os.path.dirname(self.prometheus_path)
+            if prometheus_dir != '':
+                os.makedirs(prometheus_dir, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(lines) + '\n')
+            os.replace(tmp_path, self.prometheus_path)
+        except OSError as err:
+            print('[ERROR] Prometheus metrics save error : {0}'.format(err), file=sys.stderr)
+
+    def _append(self, page_metrics, outputs):
+        output_ok = True
+        written_bytes = page_metrics.get('written_bytes', 0)
+        for output_path, future in outputs:
+            result = future.result()
+            if not result:
+                output_ok = False
+                continue
+            # outputs appended to a file shared by pages (page bundle) return the size of the appended data
+            if not isinstance(result, bool):
+                written_bytes += result
+                continue
+            try:
+                written_bytes += os.path.getsize(output_path)
+            except OSError:
+                pass
+        page_metrics['written_bytes'] = written_bytes
+        page_metrics['output_ok'] = output_ok
+
+        line = json.dumps(page_metrics, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._page_num += 1
+            if not output_ok:
+                self._failed_page_num += 1
+            self._written_bytes += written_bytes
+            for stage, stage_time in page_metrics['stage_times'].items():
+                self._stage_times.setdefault(stage, []).append(stage_time)
+            self._queue_waits.append(page_metrics['queue_wait'])
+            try:
+                if self._fp is None:
+                    self._fp = open(self.path, 'a', encoding='utf-8')
+                self._fp.write(line)
+                self._fp.flush()
+            except OSError as err:
+                print('[ERROR] Metrics save error : {0}'.format(err), file=sys.stderr)
+
+
+def _create_summary_lines(name, label, sorted_values):
+    """
+    昇順に並べた計測値のリストから、Prometheusのsummary形式の行(分位数、合計、件数)を作成します。
+    """
+    lines = []
+    label_prefix = label + ',' if label != '' else ''
+    for quantile in _QUANTILES:
+        value = _get_percentile(sorted_values, quantile)
+        lines.append('{0}{{{1}quantile="{2}"}} {3}'.format(name, label_prefix, quantile, value))
+    label_str = '{' + label + '}' if label != '' else ''
+    lines.append('{0}_sum{1} {2}'.format(name, label_str, sum(sorted_values)))
+    lines.append('{0}_count{1} {2}'.format(name, label_str, len(sorted_values)))
+    return lines
+
+
+def _get_percentile(sorted_values, quantile):
+    # nearest-rank percentile
+    if len(sorted_values) == 0:
+        return 'NaN'
+    rank = max(1, math.ceil(quantile * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
@@ -0,0 +1,148 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import re
+import xml.etree.ElementTree as ET
+import xml.parsers.expat
+
+# size of chunks fed to the parser while building the index
+_CHUNK_SIZE = 1024 * 1024
+
+_END_TAG_PATTERN = re.compile(rb'</PAGE[\s>]')
+
+
+class PageXmlIndex:
+    """
+    書籍単位のXMLファイルに含まれるPAGE要素の位置(バイトオフセット)の索引です。
+    索引の作成時にXMLファイルを一度だけ先頭から解析し、XML全体は保持しません。
+    ページのXMLデータは、IMAGENAMEまたは文書中の順序を指定して、そのPAGE要素の範囲のみを読み込んで解析します。
+    PAGE要素が入れ子になっている場合は、外側のPAGE要素のみを索引に含めます。
+
+    Attributes
+    ----------
+    xml_path : str
+        XMLファイルのパスです。
+    """
+
+    def __init__(self, xml_path):
+        """
+        Parameters
+        ----------
+        xml_path : str
+            XMLファイルのパスです。
+
+        Raises
+        ------
+        xml.etree.ElementTree.ParseError
+            XMLファイルの解析に失敗した場合に送出されます。
+        """
+        self.xml_path = xml_path
+        self._encoding = None
+        # byte offsets (start, end) of each PAGE element
+        self._pages = []
+        self._image_names = []
+        self._name_to_idx = {}
+        self._build()
+
+    def __len__(self):
+        return len(self._pages)
+
+    def get_image_name(self, page_idx):
+        """
+        文書中でpage_idx番目のPAGE要素のIMAGENAMEを返します。
+        """
+        return self._image_names[page_idx]
+
+    def find_page(self, image_name):
+        """
+        指定されたIMAGENAMEを持つ最初のPAGE要素を読み込みます。
+
+        Parameters
+        ----------
+        image_name : str
+            PAGE要素のIMAGENAMEです。
+
+        Returns
+        -------
+        [変数なし] : xml.etree.ElementTree.Element
+            PAGE要素です。存在しない場合はNoneを返します。
+        """
+        page_idx = self._name_to_idx.get(image_name)
+        if page_idx is None:
+            return None
+        return self.get_page(page_idx)
+
+    def get_page(self, page_idx):
+        """
+        文書中でpage_idx番目のPAGE要素を読み込みます。
+
+        Parameters
+        ----------
+        page_idx : int
+            PAGE要素の文書中の順序です。
+
+        Returns
+        -------
+        [変数なし] : xml.etree.ElementTree.Element
+            PAGE要素です。
+        """
+        start, end = self._pages[page_idx]
+        with open(self.xml_path, 'rb') as f:
+            f.seek(start)
+            page_bytes = f.read(end - start)
+        if self._encoding is not None and self._encoding.lower().replace('-', '') != 'utf8':
+            page_bytes = '<?xml version="1.0" encoding="{0}"?>'.format(self._encoding).encode('ascii') + page_bytes
+        return ET.fromstring(page_bytes)
+
+    def _build(self):
+        parser = xml.parsers.expat.ParserCreate()
+        state = {'depth': 0, 'start': None, 'image_name': None}
+
+        def on_xml_decl(version, encoding, standalone):
+            self._encoding = encoding
+
+        def on_start(name, attrib):
+            if name == 'PAGE':
+                if state['depth'] == 0:
+                    state['start'] = parser.CurrentByteIndex
+                    state['image_name'] = attrib.get('IMAGENAME')
+                state['depth'] += 1
+
+        def on_end(name):
+            if name != 'PAGE':
+                return
+            state['depth'] -= 1
+            if state['depth'] > 0:
+                return
+            image_name = state['image_name']
+            if image_name is not None and image_name not in self._name_to_idx.keys():
+                self._name_to_idx[image_name] = len(self._pages)
+            self._image_names.append(image_name)
+            # the end of the element is resolved after parsing, since the end tag may span chunks
+            self._pages.append((state['start'], parser.CurrentByteIndex))
+
+        parser.XmlDeclHandler = on_xml_decl
+        parser.StartElementHandler = on_start
+        parser.EndElementHandler = on_end
+        try:
+            with open(self.xml_path, 'rb') as f:
+                while True:
+                    chunk = f.read(_CHUNK_SIZE)
+                    parser.Parse(chunk, len(chunk) == 0)
+                    if len(chunk) == 0:
+                        break
+        except (xml.parsers.expat.ExpatError, ValueError) as err:
+            # ValueError is raised for unsupported encodings
+            raise ET.ParseError(str(err)) from None
+
+        # CurrentByteIndex of the end event points to the beginning of the end tag,
+        # or to the end of the element if the element is empty
+        with open(self.xml_path, 'rb') as f:
+            for page_idx, (start, end_index) in enumerate(self._pages):
+                f.seek(end_index)
+                end_tag = f.read(64)
+                if _END_TAG_PATTERN.match(end_tag):
+                    self._pages[page_idx] = (start, end_index + end_tag.index(b'>') + 1)
@@ -0,0 +1,336 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import queue
+import sys
+import threading
+
+# sentinel object to notify the end of input
+_END_OF_INPUT = object()
+
+
+class _StageFailure:
+    """
+    ステージ内で発生した例外を後段に受け渡すためのラッパークラス。
+    """
+    def __init__(self, stage_name, error):
+        self.stage_name = stage_name
+        self.error = error
+
+
+class PipelineStage:
+    """
+    パイプライン実行における1ステージ分の処理を保持します。
+
+    Attributes
+    ----------
+    name : str
+        ステージ名です。
+    func : function
+        ページ単位のタスクを受け取り、処理後のタスクを返す関数です。
+        Noneを返した場合、そのページは以降のステージでは処理されません。
+        max_batch_sizeが2以上の場合はタスクのリストを受け取り、処理後のタスクのリストを返します。
+    num_workers : int
+        本ステージを並列に処理するワーカースレッドの数です。
+    max_batch_size : int
+        一度にfuncに渡すタスク数の上限です。
+    batch_cost : function
+        タスク一つ分のコスト(行数など)を返す関数です。
+    max_batch_cost : int
+        一度にfuncに渡すタスクのコストの合計の上限です。Noneの場合は上限を設けません。
+    """
+    def __init__(self, name, func, num_workers=1, max_batch_size=1, batch_cost=None, max_batch_cost=None):
+        """
+        Parameters
+        ----------
+        name : str
+            ステージ名です。
+        func : function
+            ページ単位のタスク(またはタスクのリスト)を処理する関数です。
+        num_workers : int
+            本ステージを並列に処理するワーカースレッドの数です。
+        max_batch_size : int
+            一度にfuncに渡すタスク数の上限です。
+        batch_cost : function
+            タスク一つ分のコストを返す関数です。
+        max_batch_cost : int
+            一度にfuncに渡すタスクのコストの合計の上限です。
+        """
+        self.name = name
+        self.func = func
+        self.num_workers = max(1, int(num_workers))
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.batch_cost = batch_cost
+        self.max_batch_cost = max_batch_cost
+
+    @property
+    def is_batched(self):
+        return self.max_batch_size > 1
+
+    def is_batch_full(self, batch):
+        """
+        タスクのリストがfuncにまとめて渡せる上限に達しているかどうかを判定します。
+
+        Parameters
+        ----------
+        batch : list
+            処理待ちのタスクのリスト。Noneを含む場合があります。
+
+        Returns
+        -------
+        [変数なし] : bool
+            上限に達していればTrue, そうでなければFalseを返します。
+        """
+        valid_tasks = [task for task in batch if task is not None]
+        if len(valid_tasks) >= self.max_batch_size:
+            return True
+        if self.max_batch_cost is not None and self.batch_cost is not None:
+            return sum(self.batch_cost(task) for task in valid_tasks) >= self.max_batch_cost
+        return False
+
+    def process(self, batch):
+        """
+        タスクのリストに本ステージの処理を実行します。
+        Noneのタスクは処理せずにそのまま返します。
+
+        Parameters
+        ----------
+        batch : list
+            処理するタスクのリスト。
+
+        Returns
+        -------
+        result : list
+            処理後のタスクのリスト。入力と同じ順序です。
+        """
+        valid_idx = [idx for idx, task in enumerate(batch) if task is not None]
+        result = list(batch)
+        if len(valid_idx) == 0:
+            return result
+        if self.is_batched:
+            output = self.func([batch[idx] for idx in valid_idx])
+        else:
+            output = [self.func(batch[idx]) for idx in valid_idx]
+        for idx, task in zip(valid_idx, output):
+            result[idx] = task
+        return result
+
+
+class PagePipeline:
+    """
+    ページ単位のタスクを複数のステージに分けて処理するパイプラインです。
+    threadedが有効な場合、各ステージはそれぞれのワーカースレッドと上限付きキューを持ち、
+    前段のステージの処理と並行して動作します。
+    無効な場合は全ステージを呼び出し元のスレッドで順に実行します。
+    いずれの場合も、出力されるタスクの順序は入力の順序と同じになります。
+
+    Attributes
+    ----------
+    stages : list
+        実行順に並んだPipelineStageのリストです。
+    queue_size : int
+        各ステージの入力キューに保持できるタスク数の上限です。
+    threaded : bool
+        ステージごとのワーカースレッドで並行に実行するかどうかのフラグです。
+    """
+    def __init__(self, stages, queue_size=4, threaded=True):
+        """
+        Parameters
+        ----------
+        stages : list
+            実行順に並んだPipelineStageのリストです。
+        queue_size : int
+            各ステージの入力キューに保持できるタスク数の上限です。
+        threaded : bool
+            ステージごとのワーカースレッドで並行に実行するかどうかのフラグです。
+        """
+        self.stages = stages
+        self.queue_size = max(1, int(queue_size))
+        self.threaded = threaded
+
+    def run(self, tasks):
+        """
+        タスクをパイプラインに投入し、処理が完了したタスクを入力順に返すジェネレータです。
+        いずれかのステージで例外が発生した場合、残りのタスクを破棄して同じ例外を送出します。
+
+        Parameters
+        ----------
+        tasks : iterable
+            ページ単位のタスクを順に返すイテラブルです。
+
+        Yields
+        ------
+        task : object
+            全ステージの処理が完了したタスク。
+            途中のステージでNoneが返されたページはNoneとなります。
+        """
+        if self.threaded:
+            return self._run_threaded(tasks)
+        return self._run_sequential(tasks)
+
+    def _run_sequential(self, tasks):
+        """
+        全ステージを呼び出し元のスレッドで順に実行します。
+        バッチ処理を行うステージでは、上限に達するまでタスクを保持してからまとめて処理します。
+        """
+        buffers = [[] for _ in self.stages]
+        for task in tasks:
+            yield from self._push(0, [task], buffers, False)
+        yield from self._push(0, [], buffers, True)
+
+    def _push(self, stage_idx, tasks, buffers, flush):
+        """
+        タスクを指定されたステージに渡し、処理が完了したタスクを後段のステージに渡します。
+        """
+        if stage_idx == len(self.stages):
+            yield from tasks
+            return
+        stage = self.stages[stage_idx]
+        buffer = buffers[stage_idx]
+        buffer.extend(tasks)
+        ready = []
+        if stage.is_batched:
+            if len(buffer) > 0 and (flush or stage.is_batch_full(buffer)):
+                ready = stage.process(buffer)
+                buffer.clear()
+        else:
+            ready = stage.process(buffer)
+            buffer.clear()
+        if len(ready) > 0 or flush:
+            yield from self._push(stage_idx + 1, ready, buffers, flush)
+
+    def _run_threaded(self, tasks):
+        """
+        各ステージをそれぞれのワーカースレッドで並行に実行します。
+        """
+        abort_event = threading.Event()
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._feed, args=(tasks, queues[0], abort_event), daemon=True)]
+        for stage_idx, stage in enumerate(self.stages):
+            remaining_workers = [stage.num_workers]
+            lock = threading.Lock()
+            for _ in range(stage.num_workers):
+                threads.append(threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[stage_idx], queues[stage_idx + 1], abort_event, remaining_workers, lock),
+                    daemon=True))
+        for thread in threads:
+            thread.start()
+
+        # restore input order of tasks
+        pending = {}
+        next_seq = 0
+        failure = None
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _END_OF_INPUT:
+                    break
+                seq, task = item
+                if isinstance(task, _StageFailure):
+                    failure = task
+                    break
+                pending[seq] = task
+                while next_seq in pending:
+                    yield pending.pop(next_seq)
+                    next_seq += 1
+        finally:
+            # stop all threads (they are already finished when all tasks are done)
+            abort_event.set()
+            for thread in threads:
+                thread.join()
+            self._drain(queues)
+
+        if failure is not None:
+            print('[ERROR] Pipeline stage {0} failed.'.format(failure.stage_name), file=sys.stderr)
+            raise failure.error
+
+    def _feed(self, tasks, output_queue, abort_event):
+        """
+        入力タスクに通し番号を付けて最初のステージのキューに投入します。
+        """
+        try:
+            for seq, task in enumerate(tasks):
+                if abort_event.is_set():
+                    break
+                self._put(output_queue, (seq, task), abort_event)
+        except Exception as err:
+            self._put(output_queue, (-1, _StageFailure('input', err)), abort_event)
+        self._put(output_queue, _END_OF_INPUT, abort_event)
+
+    def _work(self, stage, input_queue, output_queue, abort_event, remaining_workers, lock):
+        """
+        ステージのワーカースレッドの本体です。
+        入力キューからタスクを取り出して処理し、後段のキューへ受け渡します。
+        バッチ処理を行うステージでは、上限に達するか入力が終了するまでタスクを集めてからまとめて処理します。
+        """
+        batch = []
+        while True:
+            try:
+                item = input_queue.get(timeout=0.1)
+            except queue.Empty:
+                if abort_event.is_set():
+                    return
+                continue
+            if item is _END_OF_INPUT:
+                # let sibling workers know the end of input
+                self._put(input_queue, _END_OF_INPUT, abort_event)
+                break
+            if abort_event.is_set():
+                continue
+            seq, task = item
+            if task is None or isinstance(task, _StageFailure):
+                # skipped page and failure are passed through as is
+                self._put(output_queue, (seq, task), abort_event)
+                continue
+            batch.append((seq, task))
+            if stage.is_batched and not stage.is_batch_full([task for _, task in batch]):
+                continue
+            self._process_batch(stage, batch, output_queue, abort_event)
+            batch = []
+
+        if len(batch) > 0:
+            self._process_batch(stage, batch, output_queue, abort_event)
+
+        with lock:
+            remaining_workers[0] -= 1
+            is_last_worker = (remaining_workers[0] == 0)
+        if is_last_worker:
+            self._put(output_queue, _END_OF_INPUT, abort_event)
+
+    def _process_batch(self, stage, batch, output_queue, abort_event):
+        """
+        集めたタスクにステージの処理を実行し、結果を後段のキューに投入します。
+        """
+        try:
+            output = stage.process([task for _, task in batch])
+        except Exception as err:
+            output = [_StageFailure(stage.name, err)] * len(batch)
+        for (seq, _), task in zip(batch, output):
+            self._put(output_queue, (seq, task), abort_event)
+
+    def _put(self, output_queue, item, abort_event):
+        """
+        中断された場合にブロックし続けないよう、タイムアウト付きでキューに投入します。
+        """
+        while True:
+            try:
+                output_queue.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                if abort_event.is_set():
+                    return
+
+    def _drain(self, queues):
+        """
+        中断時に各キューに残ったタスクを破棄します。
+        """
+        for q in queues:
+            while True:
+                try:
+                    q.get_nowait()
+                except queue.Empty:
+                    break
@@ -0,0 +1,142 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import collections
+import concurrent.futures
+import cv2
+import numpy as np
+import time
+
+
+class ImagePrefetcher:
+    """
+    入力画像の読み込み(デコード)をスレッドプールで先行して実行します。
+    先読みする画像の数とデコード済み画像の合計サイズに上限を設けることで、
+    メモリ使用量を抑えながら推論処理と画像の読み込みを並行させます。
+
+    Attributes
+    ----------
+    img_list : list
+        読み込む画像ファイルパスのリストです。
+    max_pages : int
+        先読みする画像の数の上限です。
+    memory_budget : int
+        先読みしたデコード済み画像の合計サイズ(byte)の上限です。
+    """
+
+    def __init__(self, img_list, num_workers=2, max_pages=4, memory_budget_mb=2048, cache=None):
+        """
+        Parameters
+        ----------
+        img_list : list
+            読み込む画像ファイルパスのリストです。
+        num_workers : int
+            画像の読み込みを行うスレッドの数です。
+        max_pages : int
+            先読みする画像の数の上限です。
+        memory_budget_mb : int
+            先読みしたデコード済み画像の合計サイズ(MB)の上限です。
+        cache : InferenceCache
+            推論結果のキャッシュです。キャッシュに推論結果が存在する画像はデコードしません。
+        """
+        self.img_list = img_list
+        self.cache = cache
+        self.max_pages = max(1, int(max_pages))
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(1, int(num_workers)))
+        self._futures = collections.deque()
+        self._next_idx = 0
+        self._decoded_bytes = 0
+        self._decoded_count = 0
+
+    def __iter__(self):
+        """
+        入力画像を読み込み、ファイルパスの順に返します。
+
+        Yields
+        ------
+        img_data : dict
+            画像ファイルパス(img_path)、デコード済みの画像データ(img)、デコードにかかった時間(decode_time)を保持する辞書型データ。
+            読み込みに失敗した場合、imgはNoneとなります。
+        """
+        self._fill()
+        while len(self._futures) > 0:
+            img_data = self._futures.popleft().result()
+            if img_data['img'] is not None:
+                self._decoded_bytes += img_data['img'].nbytes
+                self._decoded_count += 1
+            self._fill()
+            yield img_data
+
+    def close(self):
+        """
+        未実行の読み込みを取り消し、スレッドプールを終了します。
+        """
+        for future in self._futures:
+            future.cancel()
+        self._futures.clear()
+        self._executor.shutdown(wait=True)
+
+    def _fill(self):
+        """
+        先読みの上限に達するまで画像の読み込みをスレッドプールに投入します。
+        デコード後のサイズは、それまでに読み込んだ画像の平均サイズで見積もります。
+        """
+        while self._next_idx < len(self.img_list) and len(self._futures) < self.max_pages:
+            if len(self._futures) > 0 and self._decoded_count > 0:
+                estimated_bytes = self._decoded_bytes / self._decoded_count
+                if estimated_bytes * (len(self._futures) + 1) > self.memory_budget:
+                    break
+            img_path = self.img_list[self._next_idx]
+            self._futures.append(self._executor.submit(read_image, img_path, self.cache))
+            self._next_idx += 1
+
+
+def read_image(img_path, cache=None):
+    """
+    画像ファイルを読み込みます。
+    キャッシュが指定された場合はファイルの内容からキャッシュを検索し、
+    推論結果が存在する場合は画像をデコードせずにキャッシュの推論結果を返します。
+
+    Parameters
+    ----------
+    img_path : str
+        読み込む画像ファイルのパスです。
+    cache : InferenceCache
+        推論結果のキャッシュです。
+
+    Returns
+    -------
+    img_data : dict
+        画像ファイルパス(img_path)、デコード済みの画像データ(img)、デコードにかかった時間(decode_time)を保持する辞書型データ。
+        キャッシュが指定された場合は、キャッシュのキー(cache_key)とキャッシュの推論結果(cache_result)も保持します。
+    """
+    start_decode = time.time()
+    if cache is None:
+        img = cv2.imread(img_path)
+        return {
+            'img_path': img_path,
+            'img': img,
+            'decode_time': time.time() - start_decode
+        }
+
+    try:
+        with open(img_path, 'rb') as f:
+            img_bytes = f.read()
+    except OSError:
+        img_bytes = b''
+    cache_key = cache.get_key(img_bytes)
+    cache_result = cache.get(cache_key) if len(img_bytes) > 0 else None
+    img = None
+    if cache_result is None and len(img_bytes) > 0:
+        img = cv2.imdecode(np.frombuffer(img_bytes, np.uint8), cv2.IMREAD_COLOR)
+    return {
+        'img_path': img_path,
+        'img': img,
+        'decode_time': time.time() - start_decode,
+        'cache_key': cache_key,
+        'cache_result': cache_result
+    }
@@ -0,0 +1,164 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import contextlib
+import cProfile
+import os
+import pstats
+import sys
+import threading
+
+
+class ProcProfiler:
+    """
+    推論処理ごとの処理時間の内訳を計測します。
+    推論処理の実行中はcProfileで関数ごとの処理時間を計測し、推論処理ごとにpstats形式のファイルに保存します。
+    また、一定間隔で実行中の推論処理のスタックを取得し、全推論処理を合わせて
+    flamegraphツールで読み込めるcollapsed stack形式のファイルに保存します。
+
+    Attributes
+    ----------
+    sample_interval : float
+        スタックを取得する間隔(秒)です。
+    """
+
+    collapsed_file_name = 'collapsed_stacks.txt'
+
+    def __init__(self, sample_interval=0.005):
+        """
+        Parameters
+        ----------
+        sample_interval : float
+            スタックを取得する間隔(秒)です。
+        """
+        self.sample_interval = sample_interval
+        self._lock = threading.Lock()
+        # cProfile.Profile is not thread safe, so a profile is created for each proc and thread
+        self._profiles = {}
+        # thread id -> (proc name, stack depth of the caller of profile())
+        self._active_threads = {}
+        self._stack_counts = {}
+        self._stop_event = threading.Event()
+        self._sampler = None
+        self._is_profile_available = True
+
+    def start(self):
+        """
+        スタックの取得を開始します。
+        """
+        self._stop_event.clear()
+        self._sampler = threading.Thread(target=self._sample, name='proc_profiler', daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        """
+        スタックの取得を終了します。
+        """
+        if self._sampler is not None:
+            self._stop_event.set()
+            self._sampler.join()
+            self._sampler = None
+
+    @contextlib.contextmanager
+    def profile(self, proc_name):
+        """
+        withブロック内の処理を、指定された推論処理の処理として計測します。
+
+        Parameters
+        ----------
+        proc_name : str
+            推論処理名です。
+        """
+        thread_id = threading.get_ident()
+        with self._lock:
+            profile = self._profiles.setdefault((proc_name, thread_id), cProfile.Profile())
+        self._active_threads[thread_id] = (proc_name, _get_stack_depth(sys._getframe(2)))
+        is_enabled = False
+        if self._is_profile_available:
+            try:
+                profile.enable()
+                is_enabled = True
+            except ValueError as err:
+                # another profiler is already active
+                print('[WARNING] cProfile is not available, only stack sampling is done : {0}'.format(err))
+                self._is_profile_available = False
+        try:
+            yield
+        finally:
+            if is_enabled:
+                profile.disable()
+            self._active_threads.pop(thread_id, None)
+
+    def save(self, output_dir):
+        """
+        推論処理ごとのpstats形式のファイル({推論処理名}.prof)と、collapsed stack形式のファイルを保存します。
+
+        Parameters
+        ----------
+        output_dir : str
+            ファイルを保存するディレクトリのパスです。
+
+        Returns
+        -------
+        saved_paths : list
+            保存したファイルのパスのリスト。
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        with self._lock:
+            proc_profiles = {}
+            for (proc_name, _), profile in self._profiles.items():
+                proc_profiles.setdefault(proc_name, []).append(profile)
+            stack_counts = dict(self._stack_counts)
+
+        saved_paths = []
+        for proc_name, profiles in proc_profiles.items():
+            profiles = [profile for profile in profiles if _has_stats(profile)]
+            if len(profiles) == 0:
+                continue
+            prof_path = os.path.join(output_dir, '{0}.prof'.format(proc_name))
+            pstats.Stats(*profiles).dump_stats(prof_path)
+            saved_paths.append(prof_path)
+
+        collapsed_path = os.path.join(output_dir, self.collapsed_file_name)
+        with open(collapsed_path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(stack_counts.items()):
+                f.write('{0} {1}\n'.format(stack, count))
+        saved_paths.append(collapsed_path)
+        return saved_paths
+
+    def _sample(self):
+        while not self._stop_event.wait(self.sample_interval):
+            active_threads = dict(self._active_threads)
+            if len(active_threads) == 0:
+                continue
+            frames = sys._current_frames()
+            for thread_id, (proc_name, caller_depth) in active_threads.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append('{0} ({1}:{2})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+                    frame = frame.f_back
+                # frames above the caller of profile() are common to all samples and omitted
+                stack.reverse()
+                stack_str = ';'.join([proc_name] + stack[caller_depth:])
+                with self._lock:
+                    self._stack_counts[stack_str] = self._stack_counts.get(stack_str, 0) + 1
+
+
+def _get_stack_depth(frame):
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+def _has_stats(profile):
+    profile.create_stats()
+    return len(profile.stats) > 0
@@ -0,0 +1,269 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import glob
+import http.server
+import json
+import os
+import socketserver
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+
+from .inference import OcrInferrer, supported_img_ext
+from .writer import create_xml_str
+
+
+class _ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class _OcrRequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    serveモードのHTTPリクエストを処理します。
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        path = urllib.parse.urlparse(self.path).path
+        if path == '/health':
+            self._send_json(200, self.server.ocr_server.get_health())
+        else:
+            self._send_json(404, {'error': 'Not found : {0}'.format(path)})
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        body, error = self._read_body()
+        if error is not None:
+            # the unread body cannot be skipped, so the connection is closed
+            self._send_json(*error, close_connection=True)
+            return
+        try:
+            if url.path == '/infer/page':
+                img_name = query.get('name', ['page.jpg'])[0]
+                status, result = self.server.ocr_server.infer_page(body, img_name)
+            elif url.path == '/infer/book':
+                status, result = self.server.ocr_server.infer_book(json.loads(body.decode('utf-8')))
+            else:
+                status, result = 404, {'error': 'Not found : {0}'.format(url.path)}
+        except ValueError as err:
+            status, result = 400, {'error': 'Invalid request : {0}'.format(err)}
+        except Exception as err:
+            print('[ERROR] Request failed : {0}'.format(err), file=sys.stderr)
+            status, result = 500, {'error': str(err)}
+        self._send_json(status, result)
+
+    def address_string(self):
+        # client address of unix domain socket is empty
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix-socket'
+
+    def _read_body(self):
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+        except ValueError:
+            return None, (400, {'error': 'Invalid Content-Length : {0}'.format(self.headers.get('Content-Length'))})
+        if content_length < 0:
+            return None, (400, {'error': 'Invalid Content-Length : {0}'.format(content_length)})
+        max_request_bytes = self.server.ocr_server.max_request_bytes
+        if max_request_bytes > 0 and content_length > max_request_bytes:
+            return None, (413, {'error': 'Request body is too large : {0} bytes (max_request_bytes: {1})'.format(
+                content_length, max_request_bytes)})
+        return self.rfile.read(content_length), None
+
+    def _send_json(self, status, result, close_connection=False):
+        body = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if close_connection:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class OcrServer:
+    """
+    推論モデルを一度だけ読み込み、HTTPまたはUnixドメインソケット経由で推論リクエストを受け付けます。
+    リクエストは複数のクライアントから同時に受け付けますが、推論処理は一つずつ順に実行します。
+
+    Attributes
+    ----------
+    cfg : dict
+        本実行処理における設定情報です。
+    inferrer : OcrInferrer
+        推論処理を実行するOcrInferrerです。
+    max_request_bytes : int
+        リクエストボディのサイズ(byte)の上限です。0の場合は上限を設けません。
+    book_root : str
+        /infer/bookで推論できるディレクトリのルートの絶対パスです。Noneの場合はサーバーから参照できる全てのディレクトリを推論できます。
+    """
+
+    def __init__(self, cfg, host='127.0.0.1', port=8080, unix_socket=None):
+        """
+        Parameters
+        ----------
+        cfg : dict
+            本実行処理における設定情報です。
+        host : str
+            HTTPサーバーのホスト名です。
+        port : int
+            HTTPサーバーのポート番号です。
+        unix_socket : str
+            Unixドメインソケットのパスです。指定された場合はhost, portの代わりに利用します。
+        """
+        self.cfg = cfg
+        self.max_request_bytes = int(cfg['serve']['max_request_bytes'])
+        self.book_root = None
+        if cfg['serve']['book_root'] is not None:
+            self.book_root = os.path.realpath(cfg['serve']['book_root'])
+        elif unix_socket is None and host not in ['127.0.0.1', 'localhost', '::1']:
+            print('[WARNING] /infer/book can read any directory readable by the server, since serve book_root is not set.')
+        self.inferrer = OcrInferrer(cfg)
+        self._infer_lock = threading.Lock()
+        self._start_time = time.time()
+        self._request_num = 0
+        if unix_socket is not None:
+            if os.path.exists(unix_socket):
+                os.remove(unix_socket)
+            self._httpd = _ThreadingUnixHTTPServer(unix_socket, _OcrRequestHandler)
+            self.address = unix_socket
+        else:
+            self._httpd = http.server.ThreadingHTTPServer((host, port), _OcrRequestHandler)
+            self.address = 'http://{0}:{1}'.format(host, port)
+        self._httpd.ocr_server = self
+
+    def serve_forever(self):
+        """
+        リクエストの受け付けを開始し、中断されるまで処理を続けます。
+        """
+        print('start serving : {0}'.format(self.address))
+        try:
+            self._httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self._httpd.server_close()
+            if isinstance(self._httpd, _ThreadingUnixHTTPServer) and os.path.exists(self.address):
+                os.remove(self.address)
+
+    def get_health(self):
+        """
+        サーバーの状態を返します。
+
+        Returns
+        -------
+        health : dict
+            サーバーの状態を保持する辞書型データ。
+        """
+        return {
+            'status': 'ok',
+            'busy': self._infer_lock.locked(),
+            'uptime': time.time() - self._start_time,
+            'request_num': self._request_num,
+            'procs': [proc.proc_name for proc in self.inferrer.proc_list]
+        }
+
+    def infer_page(self, img_bytes, img_name):
+        """
+        1ページ分の画像データに対して推論処理を実行します。
+
+        Parameters
+        ----------
+        img_bytes : bytes
+            入力画像ファイルの内容です。
+        img_name : str
+            入力画像のファイル名です。推論結果のXMLのIMAGENAMEなどに利用されます。
+
+        Returns
+        -------
+        status : int
+            HTTPステータスコードです。
+        result : dict
+            推論結果のXML(xml)とテキスト(main_txt, cap_txt, ruby_txt)を保持する辞書型データ。
+        """
+        img_name = os.path.basename(img_name)
+        if os.path.splitext(img_name)[1] not in supported_img_ext:
+            return 400, {'error': 'Image type is not supported : {0}'.format(img_name)}
+        if len(img_bytes) == 0:
+            return 400, {'error': 'Image data is empty'}
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            img_path = os.path.join(tmp_dir, img_name)
+            with open(img_path, 'wb') as f:
+                f.write(img_bytes)
+            page_result_list = self._infer_images([img_path])
+
+        if len(page_result_list) == 0:
+            return 422, {'error': 'Inference failed : {0}'.format(img_name)}
+        page_result = page_result_list[0]
+        return 200, {
+            'img_name': img_name,
+            'xml': create_xml_str(page_result['xml']),
+            'main_txt': page_result['main_txt'],
+            'cap_txt': page_result['cap_txt'],
+            'ruby_txt': page_result['ruby_txt']
+        }
+
+    def infer_book(self, request):
+        """
+        サーバーから参照できるディレクトリ内の画像ファイルに対して、1書籍分の推論処理を実行します。
+
+        Parameters
+        ----------
+        request : dict
+            入力画像ファイルを含むディレクトリのパス(input_dir)を保持する辞書型データ。
+            input_dir直下にimgディレクトリがある場合は、imgディレクトリ内の画像ファイルを入力とします。
+            book_rootが設定されている場合、相対パスはbook_rootからのパスとして扱い、book_rootの外のディレクトリは推論しません。
+
+        Returns
+        -------
+        status : int
+            HTTPステータスコードです。
+        result : dict
+            1書籍分の推論結果のXML(xml)、ページごとのテキスト(pages)、推論に失敗したページのリスト(failed)を保持する辞書型データ。
+        """
+        input_dir = request.get('input_dir') if isinstance(request, dict) else None
+        if not isinstance(input_dir, str):
+            return 400, {'error': 'Input directory must be a string : {0}'.format(input_dir)}
+        if self.book_root is not None:
+            # symbolic links are resolved, so that they cannot point outside of the root
+            input_dir = os.path.realpath(os.path.join(self.book_root, input_dir))
+            if os.path.commonpath([input_dir, self.book_root]) != self.book_root:
+                return 403, {'error': 'Input directory is outside of book_root : {0}'.format(request['input_dir'])}
+        if not os.path.isdir(input_dir):
+            return 400, {'error': 'Input directory not found : {0}'.format(input_dir)}
+        if os.path.isdir(os.path.join(input_dir, 'img')):
+            input_dir = os.path.join(input_dir, 'img')
+        img_list = []
+        for ext in supported_img_ext:
+            img_list.extend(sorted(glob.glob(os.path.join(input_dir, '*{0}'.format(ext)))))
+        if len(img_list) == 0:
+            return 400, {'error': 'No input image in {0}'.format(input_dir)}
+
+        page_result_list = self._infer_images(img_list)
+
+        inferred_img_list = [page_result['img_path'] for page_result in page_result_list]
+        return 200, {
+            'xml': create_xml_str([element_str for page_result in page_result_list for element_str in page_result['xml']]),
+            'pages': [{
+                'img_name': os.path.basename(page_result['img_path']),
+                'main_txt': page_result['main_txt'],
+                'cap_txt': page_result['cap_txt'],
+                'ruby_txt': page_result['ruby_txt']
+            } for page_result in page_result_list],
+            'failed': [os.path.basename(img_path) for img_path in img_list if img_path not in inferred_img_list]
+        }
+
+    def _infer_images(self, img_list):
+        # models are shared by all requests, so inference is done one request at a time
+        with self._infer_lock:
+            self._request_num += 1
+            return self.inferrer.infer_images(img_list)
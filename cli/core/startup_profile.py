@@ -0,0 +1,108 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import importlib._bootstrap as _bootstrap
+import sys
+import threading
+import time
+
+
+class ImportProfiler:
+    """
+    起動後に読み込まれたモジュールごとのimport処理時間を計測し、内訳を表示します。
+    python -X importtimeと同様に、各モジュールのimport処理時間のうち、
+    そのモジュールから読み込まれた他のモジュールの処理時間を除いた時間(self)と、含めた時間(cumulative)を記録します。
+
+    Attributes
+    ----------
+    start_time : float
+        プロセスの起動処理の開始時刻です。
+    records : list
+        モジュール名、importのネストの深さ、self時間、cumulative時間の組のリストです。
+    """
+
+    def __init__(self, start_time):
+        """
+        Parameters
+        ----------
+        start_time : float
+            プロセスの起動処理の開始時刻(time.perf_counter()の値)です。
+        """
+        self.start_time = start_time
+        self.records = []
+        self._profile_start_time = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._original_find_and_load = None
+
+    def start(self):
+        """
+        import処理時間の計測を開始します。
+        """
+        self._profile_start_time = time.perf_counter()
+        self._original_find_and_load = _bootstrap._find_and_load
+        original_find_and_load = self._original_find_and_load
+
+        # _find_and_load is called only for modules not yet in sys.modules,
+        # both from import statement and importlib.import_module
+        def find_and_load(name, import_):
+            stack = getattr(self._local, 'stack', None)
+            if stack is None:
+                stack = self._local.stack = []
+            start = time.perf_counter()
+            stack.append(0.0)
+            try:
+                return original_find_and_load(name, import_)
+            finally:
+                child_time = stack.pop()
+                elapsed = time.perf_counter() - start
+                if len(stack) > 0:
+                    stack[-1] += elapsed
+                with self._lock:
+                    self.records.append((name, len(stack), elapsed - child_time, elapsed))
+
+        _bootstrap._find_and_load = find_and_load
+
+    def stop(self):
+        """
+        import処理時間の計測を終了します。
+        """
+        if self._original_find_and_load is not None:
+            _bootstrap._find_and_load = self._original_find_and_load
+            self._original_find_and_load = None
+
+    def print_report(self, top_num=20):
+        """
+        計測したimport処理時間の内訳を標準エラー出力に表示します。
+
+        Parameters
+        ----------
+        top_num : int
+            表示するパッケージおよびモジュールの数です。
+        """
+        self.stop()
+        end_time = time.perf_counter()
+        with self._lock:
+            records = list(self.records)
+
+        package_times = {}
+        for name, _, self_time, _ in records:
+            package = name.split('.')[0]
+            package_times[package] = package_times.get(package, 0.0) + self_time
+        import_time = sum(self_time for _, _, self_time, _ in records)
+
+        out = sys.stderr
+        print('================== STARTUP PROFILE ==================', file=out)
+        print('Startup time before profiling'.ljust(45, ' ') + ': {0:.3f} sec'.format(self._profile_start_time - self.start_time), file=out)
+        print('Total import time after startup'.ljust(45, ' ') + ': {0:.3f} sec'.format(import_time), file=out)
+        print('Total elapsed time'.ljust(45, ' ') + ': {0:.3f} sec'.format(end_time - self.start_time), file=out)
+        print('Number of imported modules'.ljust(45, ' ') + ': {0}'.format(len(records)), file=out)
+        print('---------------- IMPORT TIME BY PACKAGE (self) ----------------', file=out)
+        for package, package_time in sorted(package_times.items(), key=lambda item: -item[1])[:top_num]:
+            print('{0}'.format(package).ljust(45, ' ') + ': {0:.3f} sec'.format(package_time), file=out)
+        print('---------------- SLOWEST IMPORTS (cumulative) ----------------', file=out)
+        for name, depth, _, cumulative_time in sorted(records, key=lambda record: -record[3])[:top_num]:
+            print('{0}{1}'.format('  ' * min(depth, 5), name).ljust(45, ' ') + ': {0:.3f} sec'.format(cumulative_time), file=out)
@@ -7,10 +7,111 @@
 import copy
 import datetime
 import glob
+import hashlib
 import os
 import sys
 import yaml
 
+from .dump import DUMP_FORMATS
+from .line_table import LINE_TABLE_FORMATS
+
+# default values of optional config items
+# these are used when the config yml file does not contain them
+optional_cfg_defaults = {
+    'layout_extraction': {
+        'batch_size': 1,
+        'aspect_ratio_step': 0.05
+    },
+    'line_ocr': {
+        'batch_lines': 0,
+        'max_pages_in_flight': 4,
+        'max_batch_pixels': 30000000
+    },
+    'prefetch': {
+        'enable': True,
+        'num_workers': 2,
+        'max_pages': 4,
+        'memory_budget_mb': 2048
+    },
+    'output_writer': {
+        'num_workers': 4,
+        'queue_size': 64
+    },
+    'pipeline': {
+        'enable': False,
+        'queue_size': 4,
+        'workers': {}
+    },
+    'manifest': {
+        'enable': False
+    },
+    'inference_cache': {
+        'enable': False,
+        'cache_dir': 'inference_cache',
+        'max_size_mb': 1024
+    },
+    'model_loading': {
+        'num_workers': 4
+    },
+    'metrics': {
+        'enable': False,
+        'file_name': 'metrics.jsonl',
+        'prometheus_path': None
+    },
+    'memory_monitor': {
+        'enable': False,
+        'tracemalloc_interval': 0,
+        'tracemalloc_top': 5,
+        'max_page_memory_mb': 0
+    },
+    'page_bundle': {
+        'enable': False
+    },
+    'line_table': {
+        'enable': False,
+        'format': 'npy'
+    },
+    'serve': {
+        'max_request_bytes': 104857600,
+        'book_root': None
+    },
+    'dump_output': {
+        'format': 'zip',
+        'every': 1,
+        'pages': None,
+        'max_image_size': 0,
+        'image_quality': 95
+    },
+    'resume': False,
+    'shard': None,
+    'profile': False
+}
+
+
+def merge_cfg_defaults(cfg, defaults):
+    """
+    設定情報に存在しない項目をデフォルト値で補完します。
+    辞書型の項目は再帰的に補完されます。
+
+    Parameters
+    ----------
+    cfg : dict
+        補完対象の設定情報が保存された辞書型データ。
+    defaults : dict
+        各項目のデフォルト値が保存された辞書型データ。
+
+    Returns
+    -------
+    cfg : dict
+        デフォルト値で補完された設定情報。
+    """
+    for key, default_value in defaults.items():
+        if key not in cfg.keys() or cfg[key] is None:
+            cfg[key] = copy.deepcopy(default_value)
+        elif isinstance(default_value, dict) and isinstance(cfg[key], dict):
+            merge_cfg_defaults(cfg[key], default_value)
+    return cfg
+
 
 def parse_cfg(cfg_dict):
     """
@@ -42,6 +143,26 @@ def parse_cfg(cfg_dict):
         return None
 
     infer_cfg.update(yml_config)
+    merge_cfg_defaults(infer_cfg, optional_cfg_defaults)
+
+    # sampling of dump given in command line overrides the config yml file
+    dump_every = infer_cfg.pop('dump_every', None)
+    dump_pages = infer_cfg.pop('dump_pages', None)
+    if dump_every is not None:
+        infer_cfg['dump_output']['every'] = dump_every
+    if dump_pages is not None:
+        infer_cfg['dump_output']['pages'] = dump_pages
+    if infer_cfg['dump_output']['format'] not in DUMP_FORMATS:
+        print('[ERROR] Value of dump_output format must be one of {0}.'.format(DUMP_FORMATS), file=sys.stderr)
+        return None
+    if int(infer_cfg['dump_output']['every']) < 1:
+        print('[ERROR] Value of dump_output every must be 1 or more.', file=sys.stderr)
+        return None
+    if (not infer_cfg['dump']) and (dump_every is not None or dump_pages is not None):
+        print('[WARNING] dump-every and dump-pages options are ignored because dump option is not specified.')
+    if infer_cfg['line_table']['format'] not in LINE_TABLE_FORMATS:
+        print('[ERROR] Value of line_table format must be one of {0}.'.format(LINE_TABLE_FORMATS), file=sys.stderr)
+        return None
 
     # save_xml will be ignored when last proc does not output xml data
     if (infer_cfg['proc_range'] != '0..3') and (infer_cfg['save_xml'] or infer_cfg['save_image']):
@@ -60,11 +181,50 @@ def parse_cfg(cfg_dict):
         'start': start,
         'end': end
     }
+
+    # parse shard of input pages processed in this execution
+    if infer_cfg['shard'] is not None:
+        if infer_cfg['ruby_only']:
+            print('[ERROR] shard option is not supported in ruby_only mode.', file=sys.stderr)
+            return None
+        infer_cfg['shard'] = parse_shard(infer_cfg['shard'])
+        if infer_cfg['shard'] is None:
+            return None
+        # manifest is needed to merge outputs of shards
+        infer_cfg['manifest']['enable'] = True
+    if infer_cfg['resume'] and not infer_cfg['manifest']['enable']:
+        # completed pages are recorded while resuming, so that the run can be resumed again
+        print('[WARNING] manifest is enabled because resume option is specified.')
+        infer_cfg['manifest']['enable'] = True
     if (start != 0) or (end != 3):
         infer_cfg['partial_infer'] = True
     else:
         infer_cfg['partial_infer'] = False
 
+    # input_dirs is not created when input data are given after startup (serve mode)
+    if infer_cfg['input_root'] is None:
+        infer_cfg['input_dirs'] = []
+        return infer_cfg
+
+    return create_input_dirs(infer_cfg)
+
+
+def create_input_dirs(infer_cfg):
+    """
+    入力ディレクトリの形式に従って、input_rootから入力データのディレクトリのリスト(input_dirs)を作成します。
+
+    Parameters
+    ----------
+    infer_cfg : dict
+        推論処理を実行するための設定情報が保存された辞書型データ。
+
+    Returns
+    -------
+    infer_cfg : dict
+        input_dirsを追加した設定情報。入力ディレクトリの形式が不正な場合はNoneを返します。
+    """
+    start = infer_cfg['proc_range']['start']
+
     # create input_dirs from input_root
     # input_dirs is list of dirs that contain img (and xml) dir
     infer_cfg['input_root'] = os.path.abspath(infer_cfg['input_root'])
@@ -168,6 +328,56 @@ def parse_cfg(cfg_dict):
     return infer_cfg
 
 
+def parse_shard(shard_str):
+    """
+    "K/N"形式で指定されたシャードをparseします。
+    Kは1からNまでの値で、入力ページをN個に分割したうちのK番目を表します。
+
+    Parameters
+    ----------
+    shard_str : str
+        "K/N"形式のシャードの指定です。
+
+    Returns
+    -------
+    shard : dict
+        シャードの番号(index)とシャードの総数(count)を保持する辞書型データ。
+        不正な指定の場合はNoneを返します。
+    """
+    try:
+        index, count = [int(value) for value in str(shard_str).split('/')]
+    except ValueError:
+        print('[ERROR] Value of shard must be "K/N" format : {0}'.format(shard_str), file=sys.stderr)
+        return None
+    if count < 1 or index < 1 or index > count:
+        print('[ERROR] Value of shard must be [K/N : 1 <= K <= N] : {0}'.format(shard_str), file=sys.stderr)
+        return None
+    return {'index': index, 'count': count}
+
+
+def is_in_shard(key, shard):
+    """
+    入力ページが指定されたシャードで処理する対象かどうかを判定します。
+    判定は実行環境に依存しないキーのハッシュ値で行うため、複数のマシンで同じ結果になります。
+
+    Parameters
+    ----------
+    key : str
+        入力ページを識別するキー(画像ファイル名など)です。
+    shard : dict
+        シャードの番号(index)とシャードの総数(count)を保持する辞書型データ。Noneの場合は全てのページが対象です。
+
+    Returns
+    -------
+    [変数なし] : bool
+        対象であればTrue, そうでなければFalseを返します。
+    """
+    if shard is None:
+        return True
+    key_hash = int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16)
+    return key_hash % shard['count'] == shard['index'] - 1
+
+
 def parse_eval_cfg(cfg_dict):
     """
     コマンドで入力された引数やオプションをevaluationの内部関数が利用しやすい形にparseします。
@@ -0,0 +1,209 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import datetime
+import json
+import os
+import socket
+import sys
+import time
+import traceback
+
+from . import utils
+from .inference import OcrInferrer
+
+
+class HotFolderWatcher:
+    """
+    入力フォルダ(INBOX)に置かれた書籍のディレクトリを順に推論処理し、結果を出力フォルダ(OUTBOX)に移動します。
+    推論モデルは起動時に一度だけ読み込み、以降の書籍は読み込み済みのモデルで続けて処理します。
+
+    INBOXに置かれたディレクトリは、内容の変化が止まってから作業用ディレクトリ(INBOX/.processing)に
+    移動(rename)することで確保するため、複数のwatchプロセスで同じINBOXを共有しても同じ書籍を重複して処理しません。
+    推論結果はOUTBOX内の作業用ディレクトリに出力し、処理が完了した時点でOUTBOXの直下に移動します。
+    処理が完了した入力ディレクトリはINBOX/.done、失敗した入力ディレクトリはINBOX/.failedに移動します。
+
+    Attributes
+    ----------
+    cfg : dict
+        本実行処理における設定情報です。
+    inbox : str
+        入力フォルダのパスです。
+    outbox : str
+        出力フォルダのパスです。
+    interval : float
+        INBOXを確認する間隔(秒)です。
+    """
+
+    def __init__(self, cfg, inbox, outbox, interval=5.0):
+        """
+        Parameters
+        ----------
+        cfg : dict
+            本実行処理における設定情報です。
+        inbox : str
+            入力フォルダのパスです。
+        outbox : str
+            出力フォルダのパスです。
+        interval : float
+            INBOXを確認する間隔(秒)です。
+        """
+        self.cfg = cfg
+        self.inbox = os.path.abspath(inbox)
+        self.outbox = os.path.abspath(outbox)
+        self.interval = interval
+        self._worker_id = '{0}_{1}'.format(socket.gethostname(), os.getpid())
+        self._processing_dir = os.path.join(self.inbox, '.processing', self._worker_id)
+        self._done_dir = os.path.join(self.inbox, '.done')
+        self._failed_dir = os.path.join(self.inbox, '.failed')
+        self._work_dir = os.path.join(self.outbox, '.work', self._worker_id)
+        for dir_path in [self._processing_dir, self._done_dir, self._failed_dir, self._work_dir]:
+            os.makedirs(dir_path, exist_ok=True)
+        # signature of inbox entries to check whether copying into inbox is finished
+        self._entry_signatures = {}
+        self._has_pending_book = False
+        self.inferrer = OcrInferrer(cfg)
+
+    def run(self, once=False):
+        """
+        INBOXの監視を開始し、中断されるまで到着した書籍を順に処理します。
+
+        Parameters
+        ----------
+        once : bool
+            Trueの場合は、INBOXに置かれている書籍を全て処理した時点で終了します。
+        """
+        print('start watching : {0} -> {1}'.format(self.inbox, self.outbox))
+        try:
+            while True:
+                book_dir = self._claim_next_book()
+                if book_dir is not None:
+                    self._process_book(book_dir)
+                    continue
+                if once and not self._has_pending_book:
+                    break
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            # remove working directories of this watcher if they are empty
+            for dir_path in [self._processing_dir, self._work_dir]:
+                try:
+                    os.rmdir(dir_path)
+                except OSError:
+                    pass
+        return
+
+    def _claim_next_book(self):
+        """
+        INBOXから処理可能な書籍のディレクトリを一つ選び、作業用ディレクトリに移動して確保します。
+
+        Returns
+        -------
+        book_dir : str
+            確保した書籍のディレクトリのパス。処理可能な書籍が無い場合はNoneを返します。
+        """
+        entry_names = sorted(name for name in os.listdir(self.inbox)
+                             if not name.startswith('.') and os.path.isdir(os.path.join(self.inbox, name)))
+        for name in list(self._entry_signatures.keys()):
+            if name not in entry_names:
+                del self._entry_signatures[name]
+
+        self._has_pending_book = False
+        for name in entry_names:
+            if not self._is_stable(name):
+                continue
+            book_dir = os.path.join(self._processing_dir, name)
+            try:
+                os.rename(os.path.join(self.inbox, name), book_dir)
+            except OSError:
+                # claimed by another watcher
+                continue
+            del self._entry_signatures[name]
+            print('claimed : {0}'.format(name))
+            return book_dir
+        return None
+
+    def _is_stable(self, name):
+        """
+        INBOXのディレクトリの内容(ファイル数、合計サイズ、最終更新日時)が、前回の確認から変化していないかを判定します。
+        コピー中のディレクトリを処理しないよう、変化が無くなってから処理対象とします。
+        """
+        file_num = 0
+        total_size = 0
+        latest_mtime = 0.0
+        for dir_path, _, file_names in os.walk(os.path.join(self.inbox, name)):
+            for file_name in file_names:
+                try:
+                    stat = os.stat(os.path.join(dir_path, file_name))
+                except OSError:
+                    continue
+                file_num += 1
+                total_size += stat.st_size
+                latest_mtime = max(latest_mtime, stat.st_mtime)
+        signature = (file_num, total_size, latest_mtime)
+        prev_signature = self._entry_signatures.get(name)
+        self._entry_signatures[name] = signature
+        if prev_signature != signature:
+            self._has_pending_book = True
+            return False
+        return file_num > 0
+
+    def _process_book(self, book_dir):
+        """
+        確保した書籍のディレクトリを推論処理し、結果をOUTBOXに移動します。
+
+        Parameters
+        ----------
+        book_dir : str
+            作業用ディレクトリに移動した書籍のディレクトリのパスです。
+        """
+        name = os.path.basename(book_dir)
+        output_root = os.path.join(self._work_dir, name)
+        try:
+            self.inferrer.cfg['input_root'] = book_dir
+            self.inferrer.cfg['output_root'] = output_root
+            if utils.create_input_dirs(self.inferrer.cfg) is None or len(self.inferrer.cfg['input_dirs']) == 0:
+                raise ValueError('Input directory structure does not match : {0}'.format(book_dir))
+            os.makedirs(output_root, exist_ok=True)
+
+            # save inference option
+            with open(os.path.join(output_root, 'opt.json'), 'w') as fp:
+                json.dump(self.inferrer.cfg, fp, ensure_ascii=False, indent=4,
+                          sort_keys=True, separators=(',', ': '))
+
+            self.inferrer.run()
+            if len(self.inferrer.writer.errors) > 0:
+                raise OSError('{0} output errors occurred'.format(len(self.inferrer.writer.errors)))
+        except Exception as err:
+            print('[ERROR] Inference failed : {0}'.format(name), file=sys.stderr)
+            traceback.print_exc()
+            failed_book_dir = self._move(book_dir, self._failed_dir)
+            with open(failed_book_dir + '.error.txt', 'w') as f:
+                f.write('{0}\n'.format(err))
+            if os.path.isdir(output_root):
+                self._move(output_root, os.path.join(self.outbox, '.failed'))
+            return
+
+        self._move(output_root, self.outbox)
+        self._move(book_dir, self._done_dir)
+        print('finished : {0}'.format(name))
+
+    def _move(self, src_path, dst_dir):
+        """
+        ディレクトリを移動します。移動先に同名のディレクトリがある場合は名前に日時を追加します。
+
+        Returns
+        -------
+        dst_path : str
+            移動後のディレクトリのパス。
+        """
+        os.makedirs(dst_dir, exist_ok=True)
+        dst_path = os.path.join(dst_dir, os.path.basename(src_path))
+        while os.path.exists(dst_path):
+            dst_path += datetime.datetime.now().strftime('_%Y%m%d%H%M%S')
+        os.rename(src_path, dst_path)
+        return dst_path
@@ -0,0 +1,281 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import concurrent.futures
+import os
+import sys
+import threading
+import xml.etree.ElementTree as ET
+
+
+class AsyncWriter:
+    """
+    推論結果のファイル出力(画像のエンコードを含む)をスレッドプールで実行します。
+    出力待ちのタスク数には上限があり、上限に達した場合は投入側が待機します。
+    出力時に発生したエラーは記録され、実行結果のサマリーで報告されます。
+
+    Attributes
+    ----------
+    num_workers : int
+        ファイル出力を行うスレッドの数です。0の場合は投入したスレッドで即座に出力します。
+    errors : list
+        ファイル出力時に発生したエラーのメッセージのリストです。
+    """
+
+    def __init__(self, num_workers=4, queue_size=64):
+        """
+        Parameters
+        ----------
+        num_workers : int
+            ファイル出力を行うスレッドの数です。0の場合は投入したスレッドで即座に出力します。
+        queue_size : int
+            出力待ちのタスク数の上限です。
+        """
+        self.num_workers = max(0, int(num_workers))
+        self.errors = []
+        self._lock = threading.Lock()
+        self._executor = None
+        self._slots = None
+        self._futures = set()
+        if self.num_workers > 0:
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.num_workers)
+            self._slots = threading.BoundedSemaphore(max(1, int(queue_size)))
+
+    def submit(self, func, *args):
+        """
+        ファイル出力を行う関数を投入します。
+
+        Parameters
+        ----------
+        func : function
+            ファイル出力を行う関数です。失敗した場合は例外を送出することを想定しています。
+            ファイルに追記する場合などは、書き込んだバイト数を返すことができます。
+        args : tuple
+            funcに渡す引数です。
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            ファイル出力の完了を待つためのFuture。出力に成功した場合はTrue(funcがバイト数を返した場合はそのバイト数)、
+            失敗した場合はFalseが結果となります。
+        """
+        if self._executor is None:
+            future = concurrent.futures.Future()
+            future.set_result(self._run(func, args))
+            return future
+        self._slots.acquire()
+        future = self._executor.submit(self._run, func, args)
+        with self._lock:
+            self._futures.add(future)
+        future.add_done_callback(self._release)
+        return future
+
+    def flush(self):
+        """
+        投入済みの全てのファイル出力が完了するまで待機します。
+        """
+        with self._lock:
+            futures = list(self._futures)
+        concurrent.futures.wait(futures)
+
+    def close(self):
+        """
+        投入済みの全てのファイル出力の完了を待ってスレッドプールを終了します。
+        """
+        self.flush()
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _run(self, func, args):
+        try:
+            written_bytes = func(*args)
+        except Exception as err:
+            message = '{0}: {1}'.format(func.__name__, err)
+            print('[ERROR] Output error : {0}'.format(message), file=sys.stderr)
+            with self._lock:
+                self.errors.append(message)
+            return False
+        return True if written_bytes is None else written_bytes
+
+    def _release(self, future):
+        with self._lock:
+            self._futures.discard(future)
+        self._slots.release()
+
+
+def write_image(img_path, img):
+    """
+    画像データをエンコードしてファイルに保存します。
+
+    Parameters
+    ----------
+    img_path : str
+        保存先のファイルパスです。
+    img : numpy.ndarray
+        保存する画像データです。
+    """
+    # cv2 is imported here so that merge command does not load it
+    import cv2
+    if not cv2.imwrite(img_path, img):
+        raise OSError('Image save error : {0}'.format(img_path))
+
+
+def write_text(txt_path, txt):
+    """
+    テキストデータをファイルに保存します。
+
+    Parameters
+    ----------
+    txt_path : str
+        保存先のファイルパスです。
+    txt : str
+        保存するテキストデータです。
+    """
+    with open(txt_path, 'w') as f:
+        f.write(txt)
+
+
+def get_page_txt_files(orig_img_name, main_txt, cap_txt, ruby_txt):
+    """
+    1ページ分の推論結果のテキストを保存するファイル名と、保存するテキストの組のリストを返します。
+
+    Parameters
+    ----------
+    orig_img_name : str
+        入力画像ファイル名です。拡張子を除いた部分がテキストファイル名に利用されます。
+    main_txt : str
+        本文＋キャプションのテキストです。
+    cap_txt : str
+        キャプションのみのテキストです。
+    ruby_txt : str
+        ルビのみのテキストです。Noneの場合はルビのテキストファイルを保存しません。
+
+    Returns
+    -------
+    txt_list : list
+        テキストファイル名とテキストの組のリストです。
+    """
+    stem, _ = os.path.splitext(orig_img_name)
+    txt_list = [(stem + '_cap.txt', cap_txt), (stem + '_main.txt', main_txt)]
+    if ruby_txt is not None:
+        txt_list.append((stem + '_ruby.txt', ruby_txt))
+    return txt_list
+
+
+def create_xml_str(element_str_list, root_tag='OCRDATASET'):
+    """
+    文字列に変換済みの要素のリストから、StreamingXmlWriterで保存した場合と同じ内容のXML文字列を作成します。
+
+    Parameters
+    ----------
+    element_str_list : list
+        ElementTree.tostringで文字列に変換したルート要素直下の要素のリストです。
+    root_tag : str
+        ルート要素のタグ名です。
+
+    Returns
+    -------
+    xml_str : str
+        XML宣言を含むXML文字列です。
+    """
+    xml_str = "<?xml version='1.0' encoding='utf-8'?>\n"
+    if len(element_str_list) == 0:
+        return xml_str + '<{0} />'.format(root_tag)
+    return xml_str + '<{0}>'.format(root_tag) + ''.join(element_str_list) + '</{0}>'.format(root_tag)
+
+
+class StreamingXmlWriter:
+    """
+    1書籍分の推論結果のXMLファイルを、ページごとに追記しながら出力します。
+    書籍の開始時にファイルを開いてルート要素の開始タグを書き込み、
+    ページの推論が完了するごとにPAGE要素を追記し、終了時にルート要素を閉じます。
+    出力されるファイルはElementTree.writeで1書籍分をまとめて保存した場合と同じ内容です。
+
+    Attributes
+    ----------
+    path : str
+        出力するXMLファイルのパスです。
+    page_num : int
+        これまでに書き込んだ要素の数です。
+    """
+
+    def __init__(self, path, root_tag='OCRDATASET'):
+        """
+        Parameters
+        ----------
+        path : str
+            出力するXMLファイルのパスです。
+        root_tag : str
+            ルート要素のタグ名です。
+        """
+        self.path = path
+        self.page_num = 0
+        self._root_tag = root_tag
+        ET.register_namespace('', 'NDLOCRDATASET')
+        try:
+            self._fp = open(path, 'w', encoding='utf-8', newline='')
+            self._fp.write("<?xml version='1.0' encoding='utf-8'?>\n")
+        except OSError as err:
+            print("[ERROR] XML save error : {0}".format(err), file=sys.stderr)
+            raise OSError
+
+    def write_page(self, xml_tree):
+        """
+        1ページ分の推論結果のXMLから、ルート要素直下の要素を追記します。
+
+        Parameters
+        ----------
+        xml_tree : xml.etree.ElementTree.ElementTree
+            1ページ分の推論結果のXMLデータです。
+        """
+        for element in xml_tree.getroot():
+            self.write_element(element)
+
+    def write_element(self, element):
+        """
+        ルート要素直下の要素を一つ追記します。
+
+        Parameters
+        ----------
+        element : xml.etree.ElementTree.Element
+            追記する要素です。
+        """
+        self.write_serialized_element(ET.tostring(element, encoding='unicode'))
+
+    def write_serialized_element(self, element_str):
+        """
+        文字列に変換済みのルート要素直下の要素を一つ追記します。
+
+        Parameters
+        ----------
+        element_str : str
+            ElementTree.tostringで文字列に変換した要素です。
+        """
+        if self.page_num == 0:
+            self._fp.write('<{0}>'.format(self._root_tag))
+        self._fp.write(element_str)
+        self.page_num += 1
+
+    def close(self):
+        """
+        ルート要素を閉じてファイルを保存します。
+        """
+        if self._fp is None:
+            return
+        if self.page_num == 0:
+            self._fp.write('<{0} />'.format(self._root_tag))
+        else:
+            self._fp.write('</{0}>'.format(self._root_tag))
+        self._fp.close()
+        self._fp = None
+        print('### save xml : {}###'.format(self.path))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -4,12 +4,24 @@
 # https://creativecommons.org/licenses/by/4.0/
 
 
-from .page_separation import PageSeparation
-from .page_deskew import PageDeskewProcess
-from .layout_extraction import LayoutExtractionProcess
-from .line_ocr import LineOcrProcess
-from .line_order import LineOrderProcess
-from .ruby_read import RubyReadingProcess
-from .line_attribute import LineAttributeProcess
-
-__all__ = ['PageSeparation', 'PageDeskewProcess', 'LayoutExtractionProcess', 'LineOcrProcess', 'LineOrderProcess', 'RubyReadingProcess', 'LineAttributeProcess']
+import importlib
+
+# proc classes are imported on first access, so that only the procs in proc_range are loaded
+_lazy_attributes = {
+    'PageSeparation': '.page_separation',
+    'PageDeskewProcess': '.page_deskew',
+    'LayoutExtractionProcess': '.layout_extraction',
+    'LineOcrProcess': '.line_ocr',
+    'LineOrderProcess': '.line_order',
+    'RubyReadingProcess': '.ruby_read',
+    'LineAttributeProcess': '.line_attribute',
+    'PageRecord': '.page_record'
+}
+
+__all__ = ['PageSeparation', 'PageDeskewProcess', 'LayoutExtractionProcess', 'LineOcrProcess', 'LineOrderProcess', 'RubyReadingProcess', 'LineAttributeProcess', 'PageRecord']
+
+
+def __getattr__(name):
+    if name in _lazy_attributes.keys():
+        return getattr(importlib.import_module(_lazy_attributes[name], __name__), name)
+    raise AttributeError('module {0!r} has no attribute {1!r}'.format(__name__, name))
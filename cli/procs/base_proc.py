@@ -5,8 +5,16 @@
 
 
 import copy
-import cv2
+import functools
 import os
+import threading
+
+from .page_record import to_page_record
+from .page_text import serialize_page_text
+
+# hydra keeps the config search path in a global instance,
+# so initialization and composition are serialized when procs are created in parallel
+_hydra_lock = threading.Lock()
 
 
 class BaseInferenceProcess:
@@ -20,7 +28,28 @@ class BaseInferenceProcess:
         [実行される順序を表す数字＋クラスごとの処理名]で構成されます。
     cfg : dict
         本推論実行における設定情報です。
+    max_batch_pages : int
+        do_batchで一度にまとめて処理する入力データ数の上限です。
+        1の場合はまとめて処理を行いません。
+    max_batch_cost : int
+        do_batchで一度にまとめて処理する入力データのコスト(get_batch_costの合計)の上限です。
+        Noneの場合は上限を設けません。
+    input_fields : tuple
+        推論処理が参照する入力データ(PageRecord)の項目名です。
+        全ての項目が設定されていない入力データはバリデーションエラーになります。
+        Noneの場合は全ての項目を参照する可能性があるものとして扱われます。
+    output_fields : tuple
+        推論処理が設定または置き換える入力データの項目名です。
+    dump_page_text : bool
+        Trueの場合、dump時に推論結果のXMLのLINE要素の文字列からページのテキストを作成して出力します。
+        文字認識結果(STRING)を持つXMLを出力する推論処理で設定されます。
+    dump_writer : DumpWriter
+        dumpフラグが有効な場合に推論処理の結果を出力するライターです。OcrInferrerによって設定されます。
     """
+    input_fields = None
+    output_fields = None
+    dump_page_text = False
+
     def __init__(self, cfg, proc_id, proc_type='_base_prep'):
         """
         Parameters
@@ -40,6 +69,9 @@ class BaseInferenceProcess:
             self.cfg = cfg
 
         self.process_dump_dir = None
+        self.dump_writer = None
+        self.max_batch_pages = 1
+        self.max_batch_cost = None
 
         return True
 
@@ -56,13 +88,17 @@ class BaseInferenceProcess:
             画像ファイル１つごとに入力データのリストが構成されます。
         input_data : dict
             推論処理を実行すつ対象の入力データ。
+            PageRecordでない場合は、PageRecordに変換してから推論処理に渡されます。
 
         Returns
         -------
-        result : dict
-            推論処理の結果を保持する辞書型データ。
+        result : list
+            推論処理の結果を保持するPageRecordのリスト。
             基本的にinput_dataと同じ構造です。
         """
+        # input data is passed to the inference process as a record which is not copied
+        input_data = to_page_record(input_data)
+
         # input data valudation check
         if not self._is_valid_input(input_data):
             raise ValueError('Input data validation error.')
@@ -71,6 +107,8 @@ class BaseInferenceProcess:
         result = self._run_process(input_data)
         if result is None:
             raise ValueError('Inference output error in {0}.'.format(self.proc_name))
+        # output of submodules may be a dict, and field types are validated in the conversion
+        result = [to_page_record(single_result) for single_result in result]
 
         # dump inference result
         if self.cfg['dump']:
@@ -78,14 +116,90 @@ class BaseInferenceProcess:
 
         return result
 
+    def do_batch(self, data_idx_list, input_data_list):
+        """
+        複数の入力データに対してまとめて推論処理を実行する際にOcrInferrerクラスから呼び出される推論実行関数。
+        処理内容はdoと同じですが、推論処理の本体は_run_batch_processで実行されます。
+
+        Parameters
+        ----------
+        data_idx_list : list
+            各入力データのインデックスのリスト。
+        input_data_list : list
+            推論処理を実行する対象の入力データのリスト。
+
+        Returns
+        -------
+        result_list : list
+            入力データごとの推論処理の結果のリスト。
+            各要素はdoの返り値と同じ構造です。
+        """
+        # input data is passed to the inference process as a record which is not copied
+        input_data_list = [to_page_record(input_data) for input_data in input_data_list]
+
+        # input data valudation check
+        for input_data in input_data_list:
+            if not self._is_valid_input(input_data):
+                raise ValueError('Input data validation error.')
+
+        # run main inference process
+        result_list = self._run_batch_process(input_data_list)
+        if (result_list is None) or (len(result_list) != len(input_data_list)) or (None in result_list):
+            raise ValueError('Inference output error in {0}.'.format(self.proc_name))
+        result_list = [[to_page_record(single_result) for single_result in result] for result in result_list]
+
+        # dump inference result
+        if self.cfg['dump']:
+            for data_idx, input_data, result in zip(data_idx_list, input_data_list, result_list):
+                self._dump_result(input_data, result, data_idx)
+
+        return result_list
+
+    def get_batch_cost(self, input_data):
+        """
+        入力データ一つをdo_batchでまとめて処理する際のコストを返します。
+        コストの定義は継承先のクラスで実装されることを想定しています。
+
+        Parameters
+        ----------
+        input_data : dict
+            推論処理を実行する対象の入力データ。
+
+        Returns
+        -------
+        [変数なし] : int
+            入力データのコスト。
+        """
+        return 1
+
+    def _run_batch_process(self, input_data_list):
+        """
+        複数の入力データに対する推論処理の本体部分。
+        継承先のクラスでまとめて処理する実装がない場合は、入力データごとに_run_processを実行します。
+
+        Parameters
+        ----------
+        input_data_list : list
+            推論処理を実行する対象の入力データのリスト。
+
+        Returns
+        -------
+        result_list : list
+            入力データごとの推論処理の結果のリスト。
+        """
+        return [self._run_process(input_data) for input_data in input_data_list]
+
     def _run_process(self, input_data):
         """
         推論処理の本体部分。
         処理内容は継承先のクラスで実装されることを想定しています。
 
+        入力データは他の推論処理と共有されるため変更せず、
+        PageRecord.replaceで推論結果の項目を置き換えた新しいデータを作成して返します。
+
         Parameters
         ----------
-        input_data : dict
+        input_data : PageRecord
             推論処理を実行する対象の入力データ。
 
         Returns
@@ -95,7 +209,7 @@ class BaseInferenceProcess:
             基本的にinput_dataと同じ構造です。
         """
         print('### Base Inference Process ###')
-        result = copy.deepcopy(input_data)
+        result = [input_data.replace()]
         return result
 
     def _is_valid_cfg(self, cfg):
@@ -121,11 +235,12 @@ class BaseInferenceProcess:
     def _is_valid_input(self, input_data):
         """
         本クラスの推論処理における入力データのバリデーション。
-        バリデーションの内容は継承先のクラスで実装されることを想定しています。
+        input_fieldsの全ての項目が設定されているかどうかを確認します。
+        項目の値の型はPageRecordに設定された時点で確認されているため、ここでは確認しません。
 
         Parameters
         ----------
-        input_data : dict
+        input_data : PageRecord
             推論処理を実行する対象の入力データ。
 
         Returns
@@ -133,12 +248,17 @@ class BaseInferenceProcess:
         [変数なし] : bool
             　入力データが正しければTrue, そうでなければFalseを返します。
         """
+        for field in (self.input_fields or ()):
+            if input_data.get(field) is None:
+                print('{0}: input {1} is not found'.format(self.proc_name, field))
+                return False
         return True
 
     def _dump_result(self, input_data, result, data_idx):
         """
-        本クラスの推論処理結果をファイルに保存します。
+        本クラスの推論処理結果をdump_writerで出力します。
         dumpフラグが有効の場合にのみ実行されます。
+        出力するページの選択、画像の作成とファイル出力はdump_writerで行われます。
 
         Parameters
         ----------
@@ -151,134 +271,30 @@ class BaseInferenceProcess:
             入力データのインデックス。
             画像ファイル１つごとに入力データのリストが構成されます。
         """
-
-        self.process_dump_dir = os.path.join(os.path.join(input_data['output_dir'], 'dump'), self.proc_name)
-
+        if self.dump_writer is None:
+            return
+        output_dir = input_data['output_dir']
+        self.process_dump_dir = self.dump_writer.get_proc_dir(output_dir, self.proc_name)
+        if not self.dump_writer.is_target(output_dir, input_data['img_path']):
+            return
+
+        # file names are the same in both dump formats
+        page_name = os.path.basename(str(input_data['img_path']))
         for i, single_result in enumerate(result):
+            dump_name = page_name.split('.')[0] + '_' + str(data_idx) + '_' + str(i)
             if 'img' in single_result.keys() and single_result['img'] is not None:
-                dump_img_name = os.path.basename(input_data['img_path']).split('.')[0] + '_' + str(data_idx) + '_' + str(i) + '.jpg'
-                self._dump_img_result(single_result, input_data['output_dir'], dump_img_name)
+                self.dump_writer.dump_image(output_dir, self.proc_name, 'pred_img/' + dump_name + '.jpg',
+                                            functools.partial(self._create_result_image, single_result))
             if 'xml' in single_result.keys() and single_result['xml'] is not None:
-                dump_xml_name = os.path.basename(input_data['img_path']).split('.')[0] + '_' + str(data_idx) + '_' + str(i) + '.xml'
-                self._dump_xml_result(single_result, input_data['output_dir'], dump_xml_name)
-            if 'txt' in single_result.keys() and single_result['txt'] is not None:
-                dump_txt_name = os.path.basename(input_data['img_path']).split('.')[0] + '_' + str(data_idx) + '_' + str(i) + '.txt'
-                self._dump_txt_result(single_result, input_data['output_dir'], dump_txt_name)
+                self.dump_writer.dump_xml(output_dir, self.proc_name, 'xml/' + dump_name + '.xml', single_result['xml'])
+            main_txt = single_result['txt'] if 'txt' in single_result.keys() else None
+            if main_txt is None and self.dump_page_text and 'xml' in single_result.keys() and single_result['xml'] is not None:
+                # text is created in the same way as the text files of the inference result
+                main_txt = serialize_page_text([single_result]).main_txt
+            if main_txt is not None:
+                self.dump_writer.dump_text(output_dir, self.proc_name, 'txt/' + dump_name + '_main.txt', main_txt)
             if 'ruby_txt' in single_result.keys() and single_result['ruby_txt'] is not None:
-                self._dump_ruby_txt_result(single_result, input_data['output_dir'], os.path.basename(input_data['img_path']))
-        return
-
-    def _dump_img_result(self, single_result, output_dir, img_name):
-        """
-        本クラスの推論処理結果(画像)をファイルに保存します。
-        dumpフラグが有効の場合にのみ実行されます。
-
-        Parameters
-        ----------
-        single_result : dict
-            推論処理の結果を保持する辞書型データ。
-        output_dir : str
-            推論結果が保存されるディレクトリのパス。
-        img_name : str
-            入力データの画像ファイル名。
-            dumpされる画像ファイルのファイル名は入力のファイル名と同名(複数ある場合は連番を付与)となります。
-        """
-        pred_img_dir = os.path.join(self.process_dump_dir, 'pred_img')
-        os.makedirs(pred_img_dir, exist_ok=True)
-        image_file_path = os.path.join(pred_img_dir, img_name)
-        dump_image = self._create_result_image(single_result)
-        try:
-            cv2.imwrite(image_file_path, dump_image)
-        except OSError as err:
-            print("Dump image save error: {0}".format(err))
-            raise OSError
-
-        return
-
-    def _dump_xml_result(self, single_result, output_dir, img_name):
-        """
-        本クラスの推論処理結果(XML)をファイルに保存します。
-        dumpフラグが有効の場合にのみ実行されます。
-
-        Parameters
-        ----------
-        single_result : dict
-            推論処理の結果を保持する辞書型データ。
-        output_dir : str
-            推論結果が保存されるディレクトリのパス。
-        img_name : str
-            入力データの画像ファイル名。
-            dumpされるXMLファイルのファイル名は入力のファイル名とほぼ同名（拡張子の変更、サフィックスや連番の追加のみ）となります。
-        """
-        xml_dir = os.path.join(self.process_dump_dir, 'xml')
-        os.makedirs(xml_dir, exist_ok=True)
-        trum, _ = os.path.splitext(img_name)
-        xml_path = os.path.join(xml_dir, trum + '.xml')
-        try:
-            single_result['xml'].write(xml_path, encoding='utf-8', xml_declaration=True)
-        except OSError as err:
-            print("Dump xml save error: {0}".format(err))
-            raise OSError
-
-        return
-
-    def _dump_txt_result(self, single_result, output_dir, img_name):
-        """
-        本クラスの推論処理結果(テキスト)をファイルに保存します。
-        dumpフラグが有効の場合にのみ実行されます。
-
-        Parameters
-        ----------
-        single_result : dict
-            推論処理の結果を保持する辞書型データ。
-        output_dir : str
-            推論結果が保存されるディレクトリのパス。
-        img_name : str
-            入力データの画像ファイル名。
-            dumpされるテキストファイルのファイル名は入力のファイル名とほぼ同名（拡張子の変更、サフィックスや連番の追加のみ）となります。
-        """
-        txt_dir = os.path.join(self.process_dump_dir, 'txt')
-        os.makedirs(txt_dir, exist_ok=True)
-
-        trum, _ = os.path.splitext(img_name)
-        txt_path = os.path.join(txt_dir, trum + '_main.txt')
-        try:
-            with open(txt_path, 'w') as f:
-                f.write(single_result['txt'])
-        except OSError as err:
-            print("Dump text save error: {0}".format(err))
-            raise OSError
-
-        return
-
-    def _dump_ruby_txt_result(self, single_result, output_dir, img_name):
-        """
-        本クラスの推論処理結果(ルビテキスト)をファイルに保存します。
-        dumpフラグが有効の場合にのみ実行されます。
-
-        Parameters
-        ----------
-        single_result : dict
-            推論処理の結果を保持する辞書型データ。
-        output_dir : str
-            推論結果が保存されるディレクトリのパス。
-        img_name : str
-            入力データの画像ファイル名。
-            dumpされるテキストファイルのファイル名は入力のファイル名とほぼ同名（拡張子の変更、サフィックスや連番の追加のみ）となります。
-        """
-        txt_dir = os.path.join(self.process_dump_dir, 'txt')
-        os.makedirs(txt_dir, exist_ok=True)
-
-        trum, _ = os.path.splitext(img_name)
-        txt_path = os.path.join(txt_dir, trum + '_ruby.txt')
-        try:
-            with open(txt_path, 'w') as f:
-                f.write(single_result['ruby_txt'])
-        except OSError as err:
-            print("Dump text save error: {0}".format(err))
-            raise OSError
-
-        return
+                self.dump_writer.dump_text(output_dir, self.proc_name, 'txt/' + dump_name + '_ruby.txt', single_result['ruby_txt'])
 
     def _create_result_image(self, single_result):
         """
@@ -289,6 +305,8 @@ class BaseInferenceProcess:
         single_result : dict
             推論処理の結果を保持する辞書型データ。
         """
+        # cv2 is imported here, so that loading a proc class does not load it before the proc is used
+        import cv2
         dump_img = None
         if 'dump_img' in single_result.keys():
             dump_img = copy.deepcopy(single_result['dump_img'])
@@ -304,3 +322,29 @@ class BaseInferenceProcess:
             cv2.putText(dump_img, 'dump' + self.proc_name, (0, 50),
                         cv2.FONT_HERSHEY_PLAIN, 4, (255, 255, 0), 5, cv2.LINE_AA)
         return dump_img
+
+
+def compose_hydra_cfg(config_name, overrides):
+    """
+    サブモジュールの設定ディレクトリからhydraの設定情報を作成します。
+    hydraが未初期化の場合は初期化します。複数のスレッドから同時に呼び出すことができます。
+
+    Parameters
+    ----------
+    config_name : str
+        設定ファイル名です。
+    overrides : list
+        上書きする設定項目のリストです。
+
+    Returns
+    -------
+    hydra_cfg : omegaconf.DictConfig
+        hydraの設定情報です。
+    """
+    import hydra
+    from hydra.core.global_hydra import GlobalHydra
+    with _hydra_lock:
+        if not GlobalHydra.instance().is_initialized():
+            # config_path is relative to this file
+            hydra.initialize(version_base="1.2", config_path="../../submodules/text_recognition_lightning/configs")
+        return hydra.compose(config_name=config_name, overrides=overrides)
@@ -4,12 +4,10 @@
 # https://creativecommons.org/licenses/by/4.0/
 
 
-import copy
-import xml.etree.ElementTree as ET
-import lxml
-import numpy
+import threading
 
 from .base_proc import BaseInferenceProcess
+from .xml_tree import to_element_tree
 
 
 class LayoutExtractionProcess(BaseInferenceProcess):
@@ -17,6 +15,9 @@ class LayoutExtractionProcess(BaseInferenceProcess):
     レイアウト抽出推論を実行するプロセスのクラス。
     BaseInferenceProcessを継承しています。
     """
+    input_fields = ('img', 'img_file_name')
+    output_fields = ('xml', 'dump_img')
+
     def __init__(self, cfg, pid):
         """
         Parameters
@@ -30,10 +31,24 @@ class LayoutExtractionProcess(BaseInferenceProcess):
         from submodules.ndl_layout.tools.process_textblock import InferencerWithCLI
         self._inferencer = InferencerWithCLI(self.cfg['layout_extraction'])
         self._run_submodule_inference = self._inferencer.inference_with_cli
+        # detector of the inferencer is temporarily replaced while converting results of batch inference
+        self._inferencer_lock = threading.Lock()
+        self._batch_warned = False
+
+        # detect layout of several pages in one inference call
+        batch_size = self.cfg['layout_extraction']['batch_size']
+        self._run_submodule_batch_inference = self._inference_with_cli_batch
+        if batch_size > 1:
+            detector = getattr(self._inferencer, 'detector', None)
+            if getattr(detector, 'model', None) is None or not hasattr(detector, 'predict'):
+                print('[WARNING] LayoutExtractionProcess: mmdet model of ndl_layout submodule is not found, batch_size is ignored.')
+            else:
+                self.max_batch_pages = batch_size
+                self.max_batch_cost = batch_size
 
-    def is_valid_input(self, input_data):
+    def _run_process(self, input_data):
         """
-        本クラスの推論処理における入力データのバリデーション。
+        推論処理の本体部分。
 
         Parameters
         ----------
@@ -42,44 +57,168 @@ class LayoutExtractionProcess(BaseInferenceProcess):
 
         Returns
         -------
-        [変数なし] : bool
-            　入力データが正しければTrue, そうでなければFalseを返します。
+        result : dict
+            推論処理の結果を保持する辞書型データ。
+            基本的にinput_dataと同じ構造です。
         """
-        if type(input_data['img']) is not numpy.ndarray:
-            print('LayoutExtractionProcess: input img is not numpy.ndarray')
-            return False
-        return True
+        print('### Layout Extraction Process ###')
+        with self._inferencer_lock:
+            inference_output = self._run_submodule_inference(
+                img=input_data['img'],
+                img_path=input_data['img_file_name'],
+                score_thr=self.cfg['layout_extraction']['score_thr'],
+                dump=(self.cfg['dump'] or self.cfg['save_image'])
+            )
+        return self._create_result(input_data, inference_output)
 
-    def _run_process(self, input_data):
+    def _run_batch_process(self, input_data_list):
         """
-        推論処理の本体部分。
+        複数ページ分の入力データに対する推論処理の本体部分。
+        リサイズ後の画像サイズが揃うよう縦横比の近いページごとにグループ化し、
+        グループごとに一度の推論でレイアウトを抽出します。
 
         Parameters
         ----------
-        input_data : dict
-            推論処理を実行する対象の入力データ。
+        input_data_list : list
+            推論処理を実行する対象の入力データのリスト。
 
         Returns
         -------
-        result : dict
-            推論処理の結果を保持する辞書型データ。
-            基本的にinput_dataと同じ構造です。
+        result_list : list
+            入力データごとの推論処理の結果のリスト。
         """
-        print('### Layout Extraction Process ###')
-        output_data = copy.deepcopy(input_data)
-        inference_output = self._run_submodule_inference(
-            img=input_data['img'],
-            img_path=input_data['img_file_name'],
-            score_thr=self.cfg['layout_extraction']['score_thr'],
-            dump=(self.cfg['dump'] or self.cfg['save_image'])
-        )
+        groups = {}
+        for idx, input_data in enumerate(input_data_list):
+            groups.setdefault(self._get_shape_group(input_data['img']), []).append(idx)
+
+        result_list = [None] * len(input_data_list)
+        for idx_list in groups.values():
+            print('### Layout Extraction Process ({0} pages) ###'.format(len(idx_list)))
+            inference_output_list = self._run_submodule_batch_inference(
+                imgs=[input_data_list[idx]['img'] for idx in idx_list],
+                img_paths=[input_data_list[idx]['img_file_name'] for idx in idx_list],
+                score_thr=self.cfg['layout_extraction']['score_thr'],
+                dump=(self.cfg['dump'] or self.cfg['save_image'])
+            )
+            for idx, inference_output in zip(idx_list, inference_output_list):
+                result_list[idx] = self._create_result(input_data_list[idx], inference_output)
+        return result_list
+
+    def _inference_with_cli_batch(self, imgs, img_paths, score_thr, dump):
+        """
+        複数ページの画像のレイアウトを、サブモジュールの検出器が保持するmmdetのモデルで一度に検出します。
+        検出結果からのXMLと推論結果の画像の作成は、サブモジュールの検出器を検出結果を順に返す代理に置き換えて、
+        ページごとにサブモジュールの推論関数(inference_with_cli)で行います。
+
+        Parameters
+        ----------
+        imgs : list
+            入力画像(numpy.ndarray)のリストです。
+        img_paths : list
+            入力画像のファイル名のリストです。
+        score_thr : float
+            検出結果の確信度の閾値です。
+        dump : bool
+            推論結果の画像を作成する場合はTrueです。
+
+        Returns
+        -------
+        inference_output_list : list
+            ページごとのサブモジュールの推論結果(xml, dump_img)のリストです。
+        """
+        # mmdet is imported here as the submodule imports it when the model is loaded
+        from mmdet.apis import inference_detector
+        with self._inferencer_lock:
+            detector = self._inferencer.detector
+            detection_list = inference_detector(detector.model, list(imgs))
+            replayer = _DetectionReplayer(detector, detection_list)
+            self._inferencer.detector = replayer
+            try:
+                inference_output_list = [self._run_submodule_inference(img=img, img_path=img_path, score_thr=score_thr, dump=dump)
+                                         for img, img_path in zip(imgs, img_paths)]
+            finally:
+                self._inferencer.detector = detector
+        if replayer.replayed_num != len(imgs) and not self._batch_warned:
+            # results are still correct, since the submodule detected each page by itself
+            print('[WARNING] LayoutExtractionProcess: batch detection results are not used by ndl_layout submodule.')
+            self._batch_warned = True
+        return inference_output_list
+
+    def _get_shape_group(self, img):
+        """
+        画像の縦横比から、リサイズ後に同じサイズになる画像のグループを表すキーを返します。
+        縦横比を保ってリサイズされるため、縦横比が近い画像はリサイズ後のサイズも近くなります。
 
+        Parameters
+        ----------
+        img : numpy.ndarray
+            入力画像。
+
+        Returns
+        -------
+        [変数なし] : int
+            グループを表すキー。
+        """
+        step = self.cfg['layout_extraction']['aspect_ratio_step']
+        return int(round((img.shape[0] / img.shape[1]) / step))
+
+    def _create_result(self, input_data, inference_output):
+        """
+        サブモジュールの推論結果から本クラスの推論処理の結果を作成します。
+
+        Parameters
+        ----------
+        input_data : dict
+            推論処理を実行した入力データ。
+        inference_output : dict
+            サブモジュールの推論結果。
+
+        Returns
+        -------
+        result : list
+            推論処理の結果を保持する辞書型データのリスト。
+        """
         # Create result to pass xml and img data
         result = []
-        output_data['xml'] = ET.ElementTree(
-            ET.fromstring(lxml.etree.tostring(inference_output['xml']))
-        )
+        output_fields = {
+            # lxml tree of the submodule is converted without serialization
+            'xml': to_element_tree(inference_output['xml'])
+        }
         if inference_output['dump_img'] is not None:
-            output_data['dump_img'] = inference_output['dump_img']
+            output_fields['dump_img'] = inference_output['dump_img']
+        output_data = input_data.replace(**output_fields)
         result.append(output_data)
         return result
+
+
+class _DetectionReplayer:
+    """
+    一度に検出した複数ページの検出結果を、ページごとの推論関数に順に返すサブモジュールの検出器の代理です。
+    検出(predict)以外の属性の参照は元の検出器に委譲します。
+
+    Attributes
+    ----------
+    replayed_num : int
+        これまでに返した検出結果の数です。
+    """
+
+    def __init__(self, detector, detection_list):
+        """
+        Parameters
+        ----------
+        detector : LayoutDetector
+            サブモジュールの検出器です。
+        detection_list : list
+            ページごとの検出結果のリストです(入力画像の順)。
+        """
+        self.replayed_num = 0
+        self._detector = detector
+        self._detection_list = detection_list
+
+    def predict(self, *args, **kwargs):
+        detection = self._detection_list[self.replayed_num]
+        self.replayed_num += 1
+        return detection
+
+    def __getattr__(self, name):
+        return getattr(self._detector, name)
@@ -2,11 +2,8 @@
 #
 # This software is released under the CC BY 4.0.
 # https://creativecommons.org/licenses/by/4.0/
-import hydra
-import numpy
-import xml.etree.ElementTree as ET
 
-from .base_proc import BaseInferenceProcess
+from .base_proc import BaseInferenceProcess, compose_hydra_cfg
 
 
 class LineAttributeProcess(BaseInferenceProcess):
@@ -14,6 +11,10 @@ class LineAttributeProcess(BaseInferenceProcess):
     行属性認識推論を実行するプロセスのクラス。
     BaseInferenceProcessを継承しています。
     """
+    input_fields = ('xml',)
+    output_fields = ('xml',)
+    dump_page_text = True
+
     def __init__(self, cfg, pid):
         """
         Parameters
@@ -32,16 +33,10 @@ class LineAttributeProcess(BaseInferenceProcess):
             raise Exception('Unsupported Line Attribute Classifier')
         self._run_submodule_inference = infer
 
-        config_path = "../../submodules/text_recognition_lightning/configs"
-        from hydra.core.global_hydra import GlobalHydra
-        if not GlobalHydra.instance().is_initialized():
-            hydra.initialize(version_base="1.2", config_path=config_path)
         if cfg['line_attribute']['classifier'] == 'rf':
-            self._hydra_cfg = hydra.compose(config_name="infer_rf",
-                                            overrides=[f"paths.output_dir={cfg['output_root']}"])
+            self._hydra_cfg = compose_hydra_cfg("infer_rf", [f"paths.output_dir={cfg['output_root']}"])
         else:
-            self._hydra_cfg = hydra.compose(config_name="infer_nlp",
-                                            overrides=[f"paths.output_dir={cfg['output_root']}"])
+            self._hydra_cfg = compose_hydra_cfg("infer_nlp", [f"paths.output_dir={cfg['output_root']}"])
             self._hydra_cfg['ckpt_path'] = ''
             self._hydra_cfg['datamodule']['downsampling_rate'] = 20
 
@@ -53,25 +48,6 @@ class LineAttributeProcess(BaseInferenceProcess):
 
         self._object_dict = create_object_dict(self._hydra_cfg, title_model_path, author_model_path)
 
-    def _is_valid_input(self, input_data):
-        """
-        本クラスの推論処理における入力データのバリデーション。
-
-        Parameters
-        ----------
-        input_data : dict
-            推論処理を実行する対象の入力データ。
-
-        Returns
-        -------
-        [変数なし] : bool
-            入力データが正しければTrue, そうでなければFalseを返します。
-        """
-        if type(input_data['xml']) is not ET.ElementTree:
-            print('LineAttributeProcess: input xml is not ElementTree')
-            return False
-        return True
-
     def _run_process(self, input_data):
         """
         推論処理の本体部分。
@@ -2,11 +2,11 @@
 #
 # This software is released under the CC BY 4.0.
 # https://creativecommons.org/licenses/by/4.0/
-import hydra
+import copy
 import numpy
 import xml.etree.ElementTree as ET
 
-from .base_proc import BaseInferenceProcess
+from .base_proc import BaseInferenceProcess, compose_hydra_cfg
 
 
 class LineOcrProcess(BaseInferenceProcess):
@@ -14,6 +14,15 @@ class LineOcrProcess(BaseInferenceProcess):
     行文字認識推論を実行するプロセスのクラス。
     BaseInferenceProcessを継承しています。
     """
+    input_fields = ('img', 'xml')
+    output_fields = ('xml',)
+    dump_page_text = True
+
+    # coordinate attributes which are not written back from merged inference result
+    _COORD_ATTRIBUTES = ['X', 'Y', 'WIDTH', 'HEIGHT', 'POINTS']
+    # elements whose regions are cropped into the merged image
+    _REGION_TAGS = ['LINE', 'BLOCK']
+
     def __init__(self, cfg, pid):
         """
         Parameters
@@ -24,12 +33,11 @@ class LineOcrProcess(BaseInferenceProcess):
             実行される順序を表す数値。
         """
         super().__init__(cfg, pid, '_line_ocr')
+        import hydra
         from submodules.text_recognition_lightning.src.tasks.infer_task import infer, create_object_dict
         self._run_submodule_inference = infer
 
-        config_path = "../../submodules/text_recognition_lightning/configs"
-        hydra.initialize(version_base="1.2", config_path=config_path)
-        self._hydra_cfg = hydra.compose(config_name="infer", overrides=[f"paths.output_dir={cfg['output_root']}"])
+        self._hydra_cfg = compose_hydra_cfg("infer", [f"paths.output_dir={cfg['output_root']}"])
         self._hydra_cfg['model']['character_file'] = cfg['line_ocr']['char_list']
         self._hydra_cfg['ckpt_path'] = cfg['line_ocr']['saved_model']
         self._hydra_cfg = self._remove_noise_elements(self._hydra_cfg)
@@ -42,6 +50,11 @@ class LineOcrProcess(BaseInferenceProcess):
 
         self._object_dict = create_object_dict(self._hydra_cfg)
 
+        # recognize lines of several pages in one inference call
+        if cfg['line_ocr']['batch_lines'] > 0:
+            self.max_batch_pages = cfg['line_ocr']['max_pages_in_flight']
+            self.max_batch_cost = cfg['line_ocr']['batch_lines']
+
     def _remove_noise_elements(self, hydra_cfg):
         NOISE_ELEMENT_TYPE = ['ノンブル', '柱']
 
@@ -52,28 +65,6 @@ class LineOcrProcess(BaseInferenceProcess):
                     break
         return hydra_cfg
 
-    def _is_valid_input(self, input_data):
-        """
-        本クラスの推論処理における入力データのバリデーション。
-
-        Parameters
-        ----------
-        input_data : dict
-            推論処理を実行する対象の入力データ。
-
-        Returns
-        -------
-        [変数なし] : bool
-            入力データが正しければTrue, そうでなければFalseを返します。
-        """
-        if type(input_data['img']) is not numpy.ndarray:
-            print('LineOcrProcess: input img is not numpy.ndarray')
-            return False
-        if type(input_data['xml']) is not ET.ElementTree:
-            print('LineOcrProcess: input xml is not ElementTree')
-            return False
-        return True
-
     def _run_process(self, input_data):
         """
         推論処理の本体部分。
@@ -96,3 +87,187 @@ class LineOcrProcess(BaseInferenceProcess):
         result.append(output_data)
 
         return result
+
+    def get_batch_cost(self, input_data):
+        """
+        入力データ一つをまとめて処理する際のコストとして、文字認識の対象となる行数を返します。
+
+        Parameters
+        ----------
+        input_data : dict
+            推論処理を実行する対象の入力データ。
+
+        Returns
+        -------
+        [変数なし] : int
+            入力データに含まれるLINE要素の数。
+        """
+        return sum(1 for _ in input_data['xml'].iter('LINE'))
+
+    def _run_batch_process(self, input_data_list):
+        """
+        複数ページ分の入力データに対する推論処理の本体部分。
+        各ページの文字認識の対象となる領域の画像を詰めて並べた1枚の画像と、座標をその位置に移して統合したXMLを作成し、
+        全ページの行を一度の推論でまとめて認識した後、認識結果を各ページのXMLに書き戻します。
+        統合した画像の画素数がmax_batch_pixelsを超える場合は、ページを分割してまとめて処理します。
+
+        Parameters
+        ----------
+        input_data_list : list
+            推論処理を実行する対象の入力データのリスト。
+
+        Returns
+        -------
+        result_list : list
+            入力データごとの推論処理の結果のリスト。
+        """
+        if len(input_data_list) == 1 or not self._can_merge_pages(input_data_list):
+            return [self._run_process(input_data) for input_data in input_data_list]
+
+        _, canvas_width, canvas_height = self._layout_regions(input_data_list)
+        if canvas_width * canvas_height > self.cfg['line_ocr']['max_batch_pixels']:
+            half = len(input_data_list) // 2
+            return self._run_batch_process(input_data_list[:half]) + self._run_batch_process(input_data_list[half:])
+
+        print('### Line OCR Process ({0} pages) ###'.format(len(input_data_list)))
+        # recognized strings are written back to xml elements, so xml shared with the input records is copied
+        input_data_list = [input_data.replace(xml=copy.deepcopy(input_data['xml'])) for input_data in input_data_list]
+        merged_data, orig_element_list = self._merge_pages(input_data_list)
+        output_data = self._run_submodule_inference(self._object_dict, merged_data)
+
+        output_element_list = []
+        for page in output_data['xml'].getroot().iter('PAGE'):
+            for child in page:
+                output_element_list.extend(child.iter())
+        if (len(output_element_list) != len(orig_element_list)) or \
+                any(out.tag != orig.tag for out, orig in zip(output_element_list, orig_element_list)):
+            print('[WARNING] LineOcrProcess: merged inference result does not match input, '
+                  '{0} pages are recognized again one by one.'.format(len(input_data_list)))
+            return [self._run_process(input_data) for input_data in input_data_list]
+
+        # scatter recognized strings to xml of each page
+        for output_element, orig_element in zip(output_element_list, orig_element_list):
+            for key, value in output_element.attrib.items():
+                if key not in self._COORD_ATTRIBUTES:
+                    orig_element.attrib[key] = value
+
+        return [[output_data] for output_data in input_data_list]
+
+    def _can_merge_pages(self, input_data_list):
+        """
+        入力データの画像が縦に連結できる形式かどうかを判定します。
+        """
+        first_img = input_data_list[0]['img']
+        for input_data in input_data_list:
+            img = input_data['img']
+            if (img.ndim != first_img.ndim) or (img.dtype != first_img.dtype) or (img.shape[2:] != first_img.shape[2:]):
+                return False
+        return True
+
+    def _layout_regions(self, input_data_list):
+        """
+        複数ページ分の入力データの文字認識の対象となる領域(LINE要素とBLOCK要素の矩形)を、
+        高さの高い順に左から右へ、入りきらない場合は次の段へと詰めて並べた配置を求めます。
+        画像の幅は最も広いページ(または領域)の幅です。
+
+        Parameters
+        ----------
+        input_data_list : list
+            推論処理を実行する対象の入力データのリスト。
+
+        Returns
+        -------
+        regions : list
+            領域ごとの(ページのインデックス, 要素, ページ画像内の矩形(x, y, width, height), 統合した画像内の位置(x, y))のリスト。
+        canvas_width : int
+            統合した画像の幅です。
+        canvas_height : int
+            統合した画像の高さです。
+        """
+        regions = []
+        for page_idx, input_data in enumerate(input_data_list):
+            img_height, img_width = input_data['img'].shape[:2]
+            for element in input_data['xml'].getroot().iter():
+                if element.tag not in self._REGION_TAGS or any(key not in element.attrib for key in self._COORD_ATTRIBUTES[:4]):
+                    continue
+                # region is clipped to the page image as the submodule crops it from the page image
+                x = min(max(int(element.attrib['X']), 0), img_width)
+                y = min(max(int(element.attrib['Y']), 0), img_height)
+                width = max(min(int(element.attrib['X']) + int(element.attrib['WIDTH']), img_width) - x, 0)
+                height = max(min(int(element.attrib['Y']) + int(element.attrib['HEIGHT']), img_height) - y, 0)
+                regions.append((page_idx, element, (x, y, width, height)))
+
+        canvas_width = max([input_data['img'].shape[1] for input_data in input_data_list] +
+                           [rect[2] for _, _, rect in regions])
+        placed_regions = []
+        shelf_x, shelf_y, shelf_height = 0, 0, 0
+        # regions of similar heights are placed in the same shelf to reduce unused area
+        for page_idx, element, rect in sorted(regions, key=lambda region: -region[2][3]):
+            if shelf_x > 0 and shelf_x + rect[2] > canvas_width:
+                shelf_x, shelf_y, shelf_height = 0, shelf_y + shelf_height, 0
+            placed_regions.append((page_idx, element, rect, (shelf_x, shelf_y)))
+            shelf_x += rect[2]
+            shelf_height = max(shelf_height, rect[3])
+        return placed_regions, canvas_width, max(shelf_y + shelf_height, 1)
+
+    def _merge_pages(self, input_data_list):
+        """
+        複数ページ分の入力データを、文字認識の対象となる領域の画像のみを詰めて並べた1ページ分の入力データに統合します。
+        ページ全体の画像を連結しないため、統合した画像の画素数は対象の領域の面積の合計程度になります。
+
+        Parameters
+        ----------
+        input_data_list : list
+            推論処理を実行する対象の入力データのリスト。
+
+        Returns
+        -------
+        merged_data : dict
+            統合された入力データ。
+        orig_element_list : list
+            統合されたXMLの要素に文書順で対応する、元のXMLの要素のリスト。
+        """
+        placed_regions, canvas_width, canvas_height = self._layout_regions(input_data_list)
+        first_img = input_data_list[0]['img']
+        canvas = numpy.full((canvas_height, canvas_width) + first_img.shape[2:], 255, dtype=first_img.dtype)
+        positions = {id(element): (page_idx, rect, position) for page_idx, element, rect, position in placed_regions}
+
+        root = ET.Element('OCRDATASET')
+        merged_page = ET.SubElement(root, 'PAGE', {
+            'IMAGENAME': input_data_list[0]['img_file_name'],
+            'WIDTH': str(canvas_width),
+            'HEIGHT': str(canvas_height)
+        })
+        orig_element_list = []
+        for input_data in input_data_list:
+            for page in input_data['xml'].getroot().iter('PAGE'):
+                for child in page:
+                    merged_child = copy.deepcopy(child)
+                    # deepcopy keeps the document order, so merged elements correspond to the original ones
+                    for orig_element, merged_element in zip(child.iter(), merged_child.iter()):
+                        orig_element_list.append(orig_element)
+                        if id(orig_element) in positions.keys():
+                            page_idx, rect, position = positions[id(orig_element)]
+                            self._place_region(canvas, input_data_list[page_idx]['img'], merged_element, rect, position)
+                    merged_page.append(merged_child)
+
+        merged_data = input_data_list[0].replace(img=canvas, xml=ET.ElementTree(root))
+        return merged_data, orig_element_list
+
+    def _place_region(self, canvas, img, element, rect, position):
+        """
+        ページ画像の領域を統合した画像の位置に複写し、要素の座標をその位置に移します。
+        """
+        x, y, width, height = rect
+        canvas_x, canvas_y = position
+        canvas[canvas_y:canvas_y + height, canvas_x:canvas_x + width] = img[y:y + height, x:x + width]
+        element.attrib['X'] = str(canvas_x)
+        element.attrib['Y'] = str(canvas_y)
+        element.attrib['WIDTH'] = str(width)
+        element.attrib['HEIGHT'] = str(height)
+        if 'POINTS' in element.attrib:
+            points = [int(v) for v in element.attrib['POINTS'].split(',')]
+            for idx in range(0, len(points), 2):
+                points[idx] += canvas_x - x
+                points[idx + 1] += canvas_y - y
+            element.attrib['POINTS'] = ','.join(str(v) for v in points)
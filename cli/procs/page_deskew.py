@@ -4,9 +4,6 @@
 # https://creativecommons.org/licenses/by/4.0/
 
 
-import copy
-import numpy
-
 from .base_proc import BaseInferenceProcess
 
 
@@ -15,6 +12,9 @@ class PageDeskewProcess(BaseInferenceProcess):
     傾き補正を実行するプロセスのクラス。
     BaseInferenceProcessを継承しています。
     """
+    input_fields = ('img',)
+    output_fields = ('img',)
+
     def __init__(self, cfg, pid):
         """
         Parameters
@@ -39,25 +39,6 @@ class PageDeskewProcess(BaseInferenceProcess):
         self._run_submodule_inference = self.deskewer.deskew_on_memory
 
 
-    def _is_valid_input(self, input_data):
-        """
-        本クラスの推論処理における入力データのバリデーション。
-
-        Parameters
-        ----------
-        input_data : dict
-            推論処理を実行する対象の入力データ。
-
-        Returns
-        -------
-        [変数なし] : bool
-            　入力データが正しければTrue, そうでなければFalseを返します。
-        """
-        if type(input_data['img']) is not numpy.ndarray:
-            print('PageDeskewProcess: input img is not numpy.ndarray')
-            return False
-        return True
-
     def _run_process(self, input_data):
         """
         推論処理の本体部分。
@@ -78,8 +59,7 @@ class PageDeskewProcess(BaseInferenceProcess):
 
         # Create result to pass img_path and img data
         result = []
-        output_data = copy.deepcopy(input_data)
-        output_data['img'] = inference_output
+        output_data = input_data.replace(img=inference_output)
         result.append(output_data)
 
         return result
@@ -0,0 +1,172 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import collections.abc
+import xml.etree.ElementTree as ET
+
+import numpy
+
+
+class PageRecord(collections.abc.MutableMapping):
+    """
+    推論処理の間で受け渡される1ページ分の入力データ・推論結果を保持するデータ。
+    項目ごとの属性(__slots__)に値を保持し、辞書型データと同じ操作(record['img']など)で参照・設定できます。
+    fieldsに含まれない項目が設定された場合は、辞書型データとして別に保持します。
+
+    推論処理は受け取ったPageRecordを変更せず、replaceで変更する項目のみを置き換えた新しいPageRecordを作成します。
+    置き換えられなかった項目(画像データ、XMLなど)は入力のPageRecordと共有され、複製されません。
+    そのため、共有される項目の値(numpy配列、ElementTree)を直接書き換えてはならず、
+    変更する場合は新しい値を作成して置き換えます。
+    推論処理が返したPageRecordはOcrInferrerが所有し、後続の推論処理や結果の保存で不要になった項目は削除されます。
+
+    Attributes
+    ----------
+    img_path : str
+        入力画像ファイルのパスです。
+    img_file_name : str
+        推論結果の出力に利用する画像ファイル名です。
+    orig_img_path : str
+        ノド元分割前の入力画像ファイルのパスです。
+    output_dir : str
+        推論結果を出力するディレクトリのパスです。
+    img : numpy.ndarray
+        推論処理に入力される画像データです。
+    dump_img : numpy.ndarray
+        推論結果を重畳した画像データです。
+    xml : xml.etree.ElementTree.ElementTree
+        レイアウト抽出・文字認識などの推論結果のXMLデータです。
+    txt : str
+        推論結果のテキストです。
+    ruby_txt : str
+        ルビ推定の推論結果のテキストです。
+    """
+
+    fields = ('img_path', 'img_file_name', 'orig_img_path', 'output_dir', 'img', 'dump_img', 'xml', 'txt', 'ruby_txt')
+    # values of these fields are validated when they are set
+    field_types = {
+        'img': numpy.ndarray,
+        'dump_img': numpy.ndarray,
+        'xml': ET.ElementTree
+    }
+    __slots__ = fields + ('_extra',)
+
+    def __init__(self, data=None, **fields):
+        """
+        Parameters
+        ----------
+        data : dict
+            PageRecordに設定する項目名と値を保持する辞書型データです。
+        **fields
+            PageRecordに設定する項目名と値です。
+        """
+        self._extra = None
+        if data is not None:
+            self.update(data)
+        if len(fields) > 0:
+            self.update(fields)
+
+    def __getitem__(self, key):
+        if key in _field_set:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is None:
+            raise KeyError(key)
+        return self._extra[key]
+
+    def __setitem__(self, key, value):
+        if key in _field_set:
+            field_type = self.field_types.get(key)
+            if (field_type is not None) and (value is not None) and (not isinstance(value, field_type)):
+                raise TypeError('PageRecord: {0} must be {1}, not {2}'.format(key, field_type.__name__, type(value).__name__))
+            setattr(self, key, value)
+            return
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __delitem__(self, key):
+        if key in _field_set:
+            try:
+                delattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+            return
+        if self._extra is None:
+            raise KeyError(key)
+        del self._extra[key]
+
+    def __contains__(self, key):
+        if key in _field_set:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for field in self.fields:
+            if hasattr(self, field):
+                yield field
+        if self._extra is not None:
+            yield from list(self._extra.keys())
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __copy__(self):
+        return self.replace()
+
+    def __repr__(self):
+        return 'PageRecord({0})'.format(dict(self))
+
+    def replace(self, **fields):
+        """
+        指定された項目を置き換えた新しいPageRecordを作成します。
+
+        Parameters
+        ----------
+        **fields
+            置き換える項目名と値です。
+
+        Returns
+        -------
+        record : PageRecord
+            指定された項目以外は元のPageRecordと値を共有するPageRecordです。
+        """
+        record = PageRecord()
+        for field in self.fields:
+            try:
+                setattr(record, field, getattr(self, field))
+            except AttributeError:
+                pass
+        if self._extra is not None:
+            record._extra = dict(self._extra)
+        record.update(fields)
+        return record
+
+    def drop(self, field_names):
+        """
+        指定された項目を削除します。設定されていない項目は無視されます。
+
+        Parameters
+        ----------
+        field_names : list
+            削除する項目名のリストです。
+        """
+        for field in field_names:
+            if field in self:
+                del self[field]
+
+
+_field_set = frozenset(PageRecord.fields)
+
+
+def to_page_record(input_data):
+    """
+    辞書型データをPageRecordに変換します。PageRecordの場合はそのまま返します。
+    """
+    if isinstance(input_data, PageRecord):
+        return input_data
+    return PageRecord(input_data)
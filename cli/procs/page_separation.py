@@ -4,8 +4,6 @@
 # https://creativecommons.org/licenses/by/4.0/
 
 
-import copy
-import numpy
 import os
 
 from .base_proc import BaseInferenceProcess
@@ -16,6 +14,9 @@ class PageSeparation(BaseInferenceProcess):
     ノド元分割処理を実行するプロセスのクラス。
     BaseInferenceProcessを継承しています。
     """
+    input_fields = ('img', 'img_path')
+    output_fields = ('img', 'orig_img_path', 'img_file_name')
+
     def __init__(self, cfg, pid):
         """
         Parameters
@@ -35,25 +36,6 @@ class PageSeparation(BaseInferenceProcess):
         self._detector = GutterDetector(config_path, checkpoint, device)
         self._run_submodule_inference = divide_facing_page_with_cli
 
-    def _is_valid_input(self, input_data):
-        """
-        本クラスの推論処理における入力データのバリデーション。
-
-        Parameters
-        ----------
-        input_data : dict
-            推論処理を実行する対象の入力データ。
-
-        Returns
-        -------
-        [変数なし] : bool
-            　入力データが正しければTrue, そうでなければFalseを返します。
-        """
-        if type(input_data['img']) is not numpy.ndarray:
-            print('PageSeparation: input img is not numpy.ndarray')
-            return False
-        return True
-
     def _run_process(self, input_data):
         """
         推論処理の本体部分。
@@ -72,6 +54,7 @@ class PageSeparation(BaseInferenceProcess):
         print('### Page Separation ###')
         log_file_path = None
         if self.process_dump_dir is not None:
+            os.makedirs(self.process_dump_dir, exist_ok=True)
             log_file_path = os.path.join(
                 self.process_dump_dir,
                 self.cfg['page_separation']['log']
@@ -88,10 +71,6 @@ class PageSeparation(BaseInferenceProcess):
         # Create result to pass img_path and img data
         result = []
         for id, single_output_img in enumerate(inference_output):
-            output_data = copy.deepcopy(input_data)
-            output_data['img'] = single_output_img
-            output_data['orig_img_path'] = input_data['img_path']
-
             # make and save separated img file name
             if id == 0:
                 id = 'L'
@@ -99,8 +78,10 @@ class PageSeparation(BaseInferenceProcess):
                 id = 'R'
             orig_img_name = os.path.basename(input_data['img_path'])
             stem, ext = os.path.splitext(orig_img_name)
-            output_data['img_file_name'] = stem + '_' + id + '.jpg'
 
+            output_data = input_data.replace(img=single_output_img,
+                                             orig_img_path=input_data['img_path'],
+                                             img_file_name=stem + '_' + id + '.jpg')
             result.append(output_data)
 
         return result
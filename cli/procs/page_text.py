@@ -0,0 +1,180 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+# text of LINE elements with this TYPE is also written to the caption text
+CAPTION_LINE_TYPE = 'キャプション'
+
+
+class XmlText:
+    """
+    推論結果のXMLデータ1つ分から取り出したテキストと、縦書き判定のための行数の集計です。
+
+    Attributes
+    ----------
+    main_lines : list
+        全てのLINE要素の文字列(STRING)のリストです。
+    cap_lines : list
+        キャプションのLINE要素の文字列のリストです。
+    line_num : int
+        LINE要素の数です。
+    vertical_line_num : int
+        縦長(幅が高さより小さい)のLINE要素の数です。
+    lines : list
+        LINE要素ごとの位置・確信度などを保持する辞書型データのリストです。作成しない場合はNoneです。
+    """
+    __slots__ = ('main_lines', 'cap_lines', 'line_num', 'vertical_line_num', 'lines')
+
+    def __init__(self, with_lines=False):
+        self.main_lines = []
+        self.cap_lines = []
+        self.line_num = 0
+        self.vertical_line_num = 0
+        self.lines = [] if with_lines else None
+
+    @property
+    def is_vertical(self):
+        """
+        縦長のLINE要素が半数を超える場合に縦書きと判定します。
+        """
+        return (self.line_num / 2) < self.vertical_line_num
+
+
+class PageText:
+    """
+    1ページ分(入力画像1枚分)の推論結果から作成したページ単位のテキストです。
+
+    Attributes
+    ----------
+    main_txt : str
+        本文＋キャプションの推論結果のテキストデータです。
+    cap_txt : str
+        キャプションのみの推論結果のテキストデータです。
+    ruby_txt : str
+        ルビのみの推論結果のテキストデータです。ルビのテキストを作成しない場合はNoneです。
+    line_num : int
+        ページに含まれるLINE要素の数です。
+    vertical : bool
+        ページの全ての推論結果が縦書きと判定された場合にTrueです。
+    lines : list
+        LINE要素ごとの画像名(image)、文字列(string)、種別(type)、位置(x, y, width, height)、確信度(conf)を
+        保持する辞書型データのリストです。main_txtの行と同じ順序です。作成しない場合はNoneです。
+    """
+    __slots__ = ('main_txt', 'cap_txt', 'ruby_txt', 'line_num', 'vertical', 'lines')
+
+    def __init__(self, main_txt, cap_txt, ruby_txt, line_num, vertical, lines=None):
+        self.main_txt = main_txt
+        self.cap_txt = cap_txt
+        self.ruby_txt = ruby_txt
+        self.line_num = line_num
+        self.vertical = vertical
+        self.lines = lines
+
+    def to_dict(self):
+        """
+        テキストデータ(main_txt, cap_txt, ruby_txt)を保持する辞書型データを返します。
+        行ごとのデータを作成した場合はlinesも含みます。
+        """
+        page_dict = {'main_txt': self.main_txt, 'cap_txt': self.cap_txt, 'ruby_txt': self.ruby_txt}
+        if self.lines is not None:
+            page_dict['lines'] = self.lines
+        return page_dict
+
+
+def collect_xml_text(xml_data, with_lines=False):
+    """
+    推論結果のXMLデータのLINE要素を一度だけたどり、テキストと縦書き判定のための行数を集計します。
+
+    Parameters
+    ----------
+    xml_data : xml.etree.ElementTree.ElementTree
+        推論結果のXMLデータです。
+    with_lines : bool
+        Trueの場合はLINE要素ごとの位置・確信度などのデータも作成します。
+
+    Returns
+    -------
+    xml_text : XmlText
+        LINE要素の文字列と行数の集計です。
+    """
+    xml_text = XmlText(with_lines)
+    for page_xml in xml_data.iter('PAGE'):
+        image_name = page_xml.attrib.get('IMAGENAME')
+        for line_xml in page_xml.iter('LINE'):
+            attrib = line_xml.attrib
+            line_str = attrib['STRING']
+            width = int(attrib['WIDTH'])
+            height = int(attrib['HEIGHT'])
+            xml_text.main_lines.append(line_str)
+            if attrib['TYPE'] == CAPTION_LINE_TYPE:
+                xml_text.cap_lines.append(line_str)
+            if width < height:
+                xml_text.vertical_line_num += 1
+            xml_text.line_num += 1
+            if with_lines:
+                conf = attrib.get('CONF')
+                xml_text.lines.append({
+                    'image': image_name,
+                    'string': line_str,
+                    'type': attrib['TYPE'],
+                    'x': int(attrib['X']),
+                    'y': int(attrib['Y']),
+                    'width': width,
+                    'height': height,
+                    'conf': float(conf) if conf is not None else None
+                })
+    return xml_text
+
+
+def serialize_page_text(page_data, ruby_read=False, with_lines=False):
+    """
+    1ページ分の推論結果のリストから、ページ単位のテキストデータを作成します。
+    各推論結果のXMLは一度だけたどり、全ての推論結果が縦書きの場合は推論結果の順序を逆にして連結します。
+
+    Parameters
+    ----------
+    page_data : list
+        1ページ分の推論結果(xml, ruby_txt)を持つ辞書型データのリストです。
+    ruby_read : bool
+        Trueの場合は推論結果のruby_txtからルビのテキストを作成します。
+    with_lines : bool
+        Trueの場合はLINE要素ごとの位置・確信度などのデータ(lines)も作成します。
+
+    Returns
+    -------
+    page_text : PageText
+        ページ単位のテキストデータです。
+    """
+    xml_text_list = [collect_xml_text(single_data['xml'], with_lines) for single_data in page_data]
+    ruby_txt_list = [single_data['ruby_txt'] for single_data in page_data] if ruby_read else None
+
+    # reverse order of page if all of the results are vertical text
+    vertical = sum(1 for xml_text in xml_text_list if xml_text.is_vertical) >= len(xml_text_list)
+    order = range(len(xml_text_list))
+    if vertical:
+        order = reversed(order)
+
+    main_buf = []
+    cap_buf = []
+    ruby_buf = [] if ruby_read else None
+    lines = [] if with_lines else None
+    for data_idx in order:
+        xml_text = xml_text_list[data_idx]
+        for line_str in xml_text.main_lines:
+            main_buf.append(line_str)
+            main_buf.append('\n')
+        main_buf.append('\n')
+        for line_str in xml_text.cap_lines:
+            cap_buf.append(line_str)
+            cap_buf.append('\n')
+        cap_buf.append('\n')
+        if ruby_read:
+            ruby_buf.append(ruby_txt_list[data_idx])
+            ruby_buf.append('\n')
+        if with_lines:
+            lines.extend(xml_text.lines)
+
+    return PageText(''.join(main_buf), ''.join(cap_buf), ''.join(ruby_buf) if ruby_read else None,
+                    sum(xml_text.line_num for xml_text in xml_text_list), vertical, lines)
@@ -2,7 +2,6 @@
 #
 # This software is released under the CC BY 4.0.
 # https://creativecommons.org/licenses/by/4.0/
-import xml.etree.ElementTree as ET
 
 from .base_proc import BaseInferenceProcess
 
@@ -12,6 +11,9 @@ class RubyReadingProcess(BaseInferenceProcess):
     ルビ認識推論を実行するプロセスのクラス。
     BaseInferenceProcessを継承しています。
     """
+    input_fields = ('xml',)
+    output_fields = ('ruby_txt',)
+
     def __init__(self, cfg, pid):
         """
         Parameters
@@ -25,25 +27,6 @@ class RubyReadingProcess(BaseInferenceProcess):
         from submodules.ruby_prediction.output_ruby import output_hira_with_cli
         self._run_submodule_inference = output_hira_with_cli
 
-    def _is_valid_input(self, input_data):
-        """
-        本クラスの推論処理における入力データのバリデーション。
-
-        Parameters
-        ----------
-        input_data : dict
-            推論処理を実行する対象の入力データ。
-
-        Returns
-        -------
-        [変数なし] : bool
-            入力データが正しければTrue, そうでなければFalseを返します。
-        """
-        if type(input_data['xml']) is not ET.ElementTree:
-            print('LineOcrProcess: input xml is not ElementTree')
-            return False
-        return True
-
     def _run_process(self, input_data):
         """
         推論処理の本体部分。
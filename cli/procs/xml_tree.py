@@ -0,0 +1,51 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import xml.etree.ElementTree as ET
+
+# xml data passed between procs is always xml.etree.ElementTree.ElementTree,
+# and results of submodules which return lxml elements are converted with to_element_tree
+
+
+def to_element_tree(tree):
+    """
+    XMLデータをxml.etree.ElementTreeのElementTreeに変換します。
+    lxmlの要素は、文字列への変換と再解析を行わずに要素を順にたどって直接変換します。
+    xml.etree.ElementTreeのデータは変換せずにそのまま利用します。
+
+    Parameters
+    ----------
+    tree : xml.etree.ElementTree.ElementTree, xml.etree.ElementTree.Element, lxml.etree._ElementTree, lxml.etree._Element
+        変換するXMLデータです。
+
+    Returns
+    -------
+    [変数なし] : xml.etree.ElementTree.ElementTree
+        変換したXMLデータです。
+    """
+    if isinstance(tree, ET.ElementTree):
+        return tree
+    if isinstance(tree, ET.Element):
+        return ET.ElementTree(tree)
+
+    # lxml element tree has getroot, and lxml element is converted as it is
+    root = tree.getroot() if hasattr(tree, 'getroot') else tree
+    builder = ET.TreeBuilder()
+    _build_element(root, builder)
+    return ET.ElementTree(builder.close())
+
+
+def _build_element(element, builder):
+    builder.start(element.tag, dict(element.attrib))
+    if element.text:
+        builder.data(element.text)
+    for child in element:
+        # comments and processing instructions are dropped as xml.etree.ElementTree.fromstring does
+        if isinstance(child.tag, str):
+            _build_element(child, builder)
+        if child.tail:
+            builder.data(child.tail)
+    builder.end(element.tag)
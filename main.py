@@ -3,19 +3,29 @@
 # This software is released under the CC BY 4.0.
 # https://creativecommons.org/licenses/by/4.0/
 
+import time
+startup_time = time.perf_counter()
+
+import atexit
 import click
 import json
 import os
 import sys
 
-from cli.core import OcrInferrer, OcrResultEvaluator
+# classes of each subcommand are imported in the subcommand,
+# so that a subcommand does not load modules (cv2, torch, ...) used only by the others
 from cli.core import utils
 
 
 @click.group()
 @click.pass_context
-def cmd(ctx):
-    pass
+@click.option('--startup-profile', 'startup_profile', type=bool, default=False, is_flag=True, help='Print import time breakdown of the subcommand on exit.')
+def cmd(ctx, startup_profile):
+    if startup_profile:
+        from cli.core.startup_profile import ImportProfiler
+        profiler = ImportProfiler(startup_time)
+        profiler.start()
+        atexit.register(profiler.print_report)
 
 
 @cmd.command()
@@ -28,8 +38,13 @@ def cmd(ctx):
 @click.option('-i', '--save_image', type=bool, default=False, is_flag=True, help='Output result image file with text file.')
 @click.option('-x', '--save_xml', type=bool, default=False, is_flag=True, help='Output result XML file with text file.')
 @click.option('-d', '--dump', type=bool, default=False, is_flag=True, help='Dump all intermediate process output.')
+@click.option('--dump-every', 'dump_every', type=click.IntRange(min=1), default=None, help='Dump only every N-th page of each book with -d option.')
+@click.option('--dump-pages', 'dump_pages', type=str, default=None, help='Dump only pages whose image file name matches this glob pattern with -d option.')
 @click.option('-r', '--ruby_only', type=bool, default=False, is_flag=True, help='Do ruby_read inference only.')
-def infer(ctx, input_root, output_root, config_file, proc_range, save_image, save_xml, input_structure, dump, ruby_only):
+@click.option('--resume', type=bool, default=False, is_flag=True, help='Resume previous inference in OUTPUT_ROOT, skipping pages already completed.')
+@click.option('--shard', type=str, default=None, help='Process only K-th of N shards of input pages, specified as "K/N" (1 <= K <= N).')
+@click.option('--profile', type=bool, default=False, is_flag=True, help='Profile each inference process and save the result in OUTPUT_ROOT/profile.')
+def infer(ctx, input_root, output_root, config_file, proc_range, save_image, save_xml, input_structure, dump, dump_every, dump_pages, ruby_only, resume, shard, profile):
     """
     \b
     INPUT_ROOT   \t: Input data directory for inference.
@@ -48,8 +63,13 @@ def infer(ctx, input_root, output_root, config_file, proc_range, save_image, sav
         'save_image': save_image,
         'save_xml': save_xml,
         'dump': dump,
+        'dump_every': dump_every,
+        'dump_pages': dump_pages,
         'input_structure': input_structure,
-        'ruby_only': ruby_only
+        'ruby_only': ruby_only,
+        'resume': resume,
+        'shard': shard,
+        'profile': profile
     }
 
     # check if input_root exists
@@ -64,7 +84,13 @@ def infer(ctx, input_root, output_root, config_file, proc_range, save_image, sav
         exit(1)
 
     # prepare output root derectory
-    infer_cfg['output_root'] = utils.mkdir_with_duplication_check(infer_cfg['output_root'])
+    # (existing output root is reused to continue previous inference while resuming)
+    if infer_cfg['resume']:
+        if infer_cfg['ruby_only']:
+            print('[WARNING] resume option is ignored in ruby_only mode, all pages will be processed again.')
+        os.makedirs(infer_cfg['output_root'], exist_ok=True)
+    else:
+        infer_cfg['output_root'] = utils.mkdir_with_duplication_check(infer_cfg['output_root'])
 
     # save inference option
     with open(os.path.join(infer_cfg['output_root'], 'opt.json'), 'w') as fp:
@@ -72,10 +98,105 @@ def infer(ctx, input_root, output_root, config_file, proc_range, save_image, sav
                   sort_keys=True, separators=(',', ': '))
 
     # do inference
+    from cli.core.inference import OcrInferrer
     inferrer = OcrInferrer(infer_cfg)
     inferrer.run()
 
 
+@cmd.command()
+@click.pass_context
+@click.option('-p', '--proc_range', type=str, default='0..3', help='Inference process range to run. Default is "0..3".')
+@click.option('-c', '--config_file', type=str, default='config.yml', help='Configuration yml file for inference. Default is "config.yml".')
+@click.option('--host', type=str, default='127.0.0.1', help='Host name of HTTP server. Default is "127.0.0.1".')
+@click.option('--port', type=int, default=8080, help='Port number of HTTP server. Default is 8080.')
+@click.option('--unix_socket', type=str, default=None, help='Unix domain socket path to listen on instead of host and port.')
+def serve(ctx, proc_range, config_file, host, port, unix_socket):
+    """
+    \b
+    Start inference server which keeps models loaded.
+    """
+    click.echo('start server !')
+    click.echo('config_file : {0}'.format(config_file))
+
+    cfg = {
+        'input_root': None,
+        'output_root': None,
+        'config_file': config_file,
+        'proc_range': proc_range,
+        'save_image': False,
+        'save_xml': False,
+        'dump': False,
+        'input_structure': 's',
+        'ruby_only': False
+    }
+
+    # parse command line option
+    serve_cfg = utils.parse_cfg(cfg)
+    if serve_cfg is None:
+        print('[ERROR] Config parse error.', file=sys.stderr)
+        exit(1)
+    if serve_cfg['proc_range']['start'] > 2:
+        print('[ERROR] serve mode does not support partial inference which needs xml file input.', file=sys.stderr)
+        exit(1)
+
+    # load models and start server
+    from cli.core.server import OcrServer
+    server = OcrServer(serve_cfg, host, port, unix_socket)
+    server.serve_forever()
+
+
+@cmd.command()
+@click.pass_context
+@click.argument('inbox')
+@click.argument('outbox')
+@click.option('-s', '--input_structure', type=click.Choice(['s', 'i'], case_sensitive=True), default='s', help='Input directory structure type of each book dropped into INBOX. s(single) and i(intermediate_output).')
+@click.option('-p', '--proc_range', type=str, default='0..3', help='Inference process range to run. Default is "0..3".')
+@click.option('-c', '--config_file', type=str, default='config.yml', help='Configuration yml file for inference. Default is "config.yml".')
+@click.option('-i', '--save_image', type=bool, default=False, is_flag=True, help='Output result image file with text file.')
+@click.option('-x', '--save_xml', type=bool, default=False, is_flag=True, help='Output result XML file with text file.')
+@click.option('--interval', type=float, default=5.0, help='Polling interval of INBOX in seconds. Default is 5.0.')
+@click.option('--once', type=bool, default=False, is_flag=True, help='Exit after all books in INBOX are processed.')
+def watch(ctx, inbox, outbox, input_structure, proc_range, config_file, save_image, save_xml, interval, once):
+    """
+    \b
+    INBOX   \t: Directory watched for book directories to be processed.
+    OUTBOX   \t: Directory where inference results of each book are moved.
+    """
+    click.echo('start watch !')
+    click.echo('inbox : {0}'.format(inbox))
+    click.echo('outbox : {0}'.format(outbox))
+    click.echo('config_file : {0}'.format(config_file))
+
+    # check if inbox exists
+    if not os.path.isdir(inbox):
+        print('INBOX not found :{0}'.format(inbox), file=sys.stderr)
+        exit(0)
+
+    cfg = {
+        'input_root': None,
+        'output_root': None,
+        'config_file': config_file,
+        'proc_range': proc_range,
+        'save_image': save_image,
+        'save_xml': save_xml,
+        'dump': False,
+        'input_structure': input_structure,
+        'ruby_only': False
+    }
+
+    # parse command line option
+    watch_cfg = utils.parse_cfg(cfg)
+    if watch_cfg is None:
+        print('[ERROR] Config parse error.', file=sys.stderr)
+        exit(1)
+
+    # load models and start watching
+    from cli.core.watcher import HotFolderWatcher
+    os.makedirs(outbox, exist_ok=True)
+    watcher = HotFolderWatcher(watch_cfg, inbox, outbox, interval)
+    watcher.run(once)
+
+
 @cmd.command()
 @click.pass_context
 @click.argument('input_pred_data')
@@ -130,10 +251,79 @@ def evaluate(ctx, input_pred_data, input_gt_data, output_root, input_structure,
                   sort_keys=True, separators=(',', ': '))
 
     # do evaluation
+    from cli.core.evaluate import OcrResultEvaluator
     evaluator = OcrResultEvaluator(eval_cfg)
     evaluator.run()
 
 
+@cmd.command()
+@click.pass_context
+@click.argument('shard_roots', nargs=-1, required=True)
+@click.argument('output_root')
+def merge(ctx, shard_roots, output_root):
+    """
+    \b
+    SHARD_ROOTS   \t: Output directories of inference executed with --shard option.
+    OUTPUT_ROOT   \t: Output directory for merged inference result.
+    """
+    click.echo('start merge !')
+    click.echo('shard_roots : {0}'.format(shard_roots))
+    click.echo('output_root : {0}'.format(output_root))
+
+    # check if shard_roots exist
+    for shard_root in shard_roots:
+        if not os.path.isdir(shard_root):
+            print('SHARD_ROOT not found :{0}'.format(shard_root), file=sys.stderr)
+            exit(0)
+
+    merge_cfg = {
+        'shard_roots': [os.path.abspath(shard_root) for shard_root in shard_roots],
+        'output_root': os.path.abspath(output_root)
+    }
+
+    # prepare output root derectory
+    merge_cfg['output_root'] = utils.mkdir_with_duplication_check(merge_cfg['output_root'])
+
+    # do merge
+    from cli.core.merge import ShardResultMerger
+    merger = ShardResultMerger(merge_cfg)
+    merger.run()
+
+
+@cmd.command()
+@click.pass_context
+@click.argument('input_root')
+@click.argument('output_root', required=False, default=None)
+def export(ctx, input_root, output_root):
+    """
+    \b
+    INPUT_ROOT   \t: Output directory of inference executed with page_bundle enabled.
+    OUTPUT_ROOT   \t: Output directory for exported text files. Text files are exported into INPUT_ROOT if omitted.
+    """
+    click.echo('start export !')
+    click.echo('input_root : {0}'.format(input_root))
+    click.echo('output_root : {0}'.format(output_root))
+
+    # check if input_root exists
+    if not os.path.isdir(input_root):
+        print('INPUT_ROOT not found :{0}'.format(input_root), file=sys.stderr)
+        exit(0)
+
+    export_cfg = {
+        'input_root': os.path.abspath(input_root),
+        'output_root': None
+    }
+
+    # prepare output root derectory
+    if output_root is not None:
+        export_cfg['output_root'] = utils.mkdir_with_duplication_check(os.path.abspath(output_root))
+
+    # do export
+    from cli.core.export import PageBundleExporter
+    exporter = PageBundleExporter(export_cfg)
+    exporter.run()
+
+
 def main():
     cmd(obj={})
 
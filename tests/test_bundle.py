@@ -0,0 +1,72 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import os
+
+from cli.core.bundle import PageBundleReader, PageBundleWriter
+
+
+def _page_txt(main_txt):
+    return {'main_txt': main_txt, 'cap_txt': '', 'ruby_txt': None,
+            'lines': [{'string': main_txt, 'x': 1, 'y': 2, 'width': 3, 'height': 4, 'conf': 0.5}],
+            'xml': ['<PAGE />']}
+
+
+def test_round_trip(tmp_path):
+    writer = PageBundleWriter(str(tmp_path))
+    for idx in range(3):
+        writer.write_page('R{0:07d}.jpg'.format(idx), _page_txt('本文{0}\n'.format(idx)))
+    writer.close()
+
+    reader = PageBundleReader(writer.path)
+    assert len(reader) == 3
+    assert reader.page_names() == ['R0000000.jpg', 'R0000001.jpg', 'R0000002.jpg']
+    assert 'R0000001.jpg' in reader
+    page = reader.get_page('R0000001.jpg')
+    expected = _page_txt('本文1\n')
+    del expected['xml']
+    expected['page'] = 'R0000001.jpg'
+    assert page == expected
+    assert [page['main_txt'] for page in reader] == ['本文0\n', '本文1\n', '本文2\n']
+    assert reader.get_page('missing.jpg') is None
+
+
+def test_written_bytes_is_size_of_page(tmp_path):
+    writer = PageBundleWriter(str(tmp_path))
+    for idx in range(3):
+        size_before = os.path.getsize(writer.path) if os.path.exists(writer.path) else 0
+        written_bytes = writer.write_page('R{0:07d}.jpg'.format(idx), _page_txt('本文'))
+        assert written_bytes == os.path.getsize(writer.path) - size_before
+    writer.close()
+
+
+def test_last_record_of_page_is_used(tmp_path):
+    writer = PageBundleWriter(str(tmp_path))
+    writer.write_page('R0000000.jpg', _page_txt('old'))
+    writer.write_page('R0000001.jpg', _page_txt('other'))
+    writer.write_page('R0000000.jpg', _page_txt('new'))
+    writer.close()
+
+    reader = PageBundleReader(writer.path)
+    assert reader.page_names() == ['R0000000.jpg', 'R0000001.jpg']
+    assert reader.get_page('R0000000.jpg')['main_txt'] == 'new'
+
+
+def test_resume_after_broken_line(tmp_path):
+    writer = PageBundleWriter(str(tmp_path))
+    writer.write_page('R0000000.jpg', _page_txt('first'))
+    writer.close()
+    with open(writer.path, 'a', encoding='utf-8') as f:
+        f.write('{"page": "R0000001.jpg", "main_')
+
+    # the bundle is continued by the resumed run
+    writer = PageBundleWriter(str(tmp_path))
+    writer.write_page('R0000001.jpg', _page_txt('second'))
+    writer.close()
+
+    reader = PageBundleReader(writer.path)
+    assert reader.page_names() == ['R0000000.jpg', 'R0000001.jpg']
+    assert reader.get_page('R0000001.jpg')['main_txt'] == 'second'
@@ -0,0 +1,113 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import copy
+import json
+import os
+
+from cli.core import utils
+from cli.core.cache import InferenceCache, create_config_hash
+
+
+def _result(main_txt):
+    return {'xml': [], 'main_txt': main_txt, 'cap_txt': '', 'ruby_txt': None}
+
+
+def _entry_size(result):
+    return len(json.dumps(result, ensure_ascii=False).encode('utf-8'))
+
+
+def _set_access_time(cache, key, access_time):
+    os.utime(cache._get_path(key), (access_time, access_time))
+    cache._entries[key][1] = access_time
+
+
+def test_key_depends_on_image_and_config(tmp_path):
+    cache = InferenceCache(str(tmp_path / 'cache'), 1, 'config_a')
+    other_cache = InferenceCache(str(tmp_path / 'cache'), 1, 'config_b')
+
+    assert cache.get_key(b'image') == cache.get_key(b'image')
+    assert cache.get_key(b'image') != cache.get_key(b'other image')
+    assert cache.get_key(b'image') != other_cache.get_key(b'image')
+
+
+def test_put_and_get(tmp_path):
+    cache = InferenceCache(str(tmp_path / 'cache'), 1, 'config')
+    key = cache.get_key(b'image')
+
+    assert cache.get(key) is None
+    cache.put(key, _result('text'))
+    assert cache.get(key) == _result('text')
+    assert (cache.hit_num, cache.miss_num) == (1, 1)
+
+    # entries are found again by a new instance
+    assert InferenceCache(str(tmp_path / 'cache'), 1, 'config').get(key) == _result('text')
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    result_size = _entry_size(_result('x' * 1000))
+    # room for two entries
+    cache = InferenceCache(str(tmp_path / 'cache'), result_size * 2.5 / 1024 / 1024, 'config')
+    keys = [cache.get_key(str(idx).encode('ascii')) for idx in range(3)]
+
+    cache.put(keys[0], _result('x' * 1000))
+    cache.put(keys[1], _result('x' * 1000))
+    _set_access_time(cache, keys[0], 2000000000)
+    _set_access_time(cache, keys[1], 1000000000)
+    cache.put(keys[2], _result('x' * 1000))
+
+    assert cache.get(keys[1]) is None
+    assert not os.path.exists(cache._get_path(keys[1]))
+    assert cache.get(keys[0]) is not None
+    assert cache.get(keys[2]) is not None
+
+
+def test_get_updates_access_time(tmp_path):
+    result_size = _entry_size(_result('x' * 1000))
+    cache = InferenceCache(str(tmp_path / 'cache'), result_size * 2.5 / 1024 / 1024, 'config')
+    keys = [cache.get_key(str(idx).encode('ascii')) for idx in range(3)]
+
+    cache.put(keys[0], _result('x' * 1000))
+    cache.put(keys[1], _result('x' * 1000))
+    _set_access_time(cache, keys[0], 1000000000)
+    _set_access_time(cache, keys[1], 1500000000)
+    # the older entry becomes the most recently used one
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[2], _result('x' * 1000))
+
+    assert os.path.exists(cache._get_path(keys[0]))
+    assert not os.path.exists(cache._get_path(keys[1]))
+
+
+def test_broken_entry_is_ignored(tmp_path):
+    cache = InferenceCache(str(tmp_path / 'cache'), 1, 'config')
+    key = cache.get_key(b'image')
+    cache.put(key, _result('text'))
+    with open(cache._get_path(key), 'w', encoding='utf-8') as f:
+        f.write('{"main_txt": ')
+
+    assert cache.get(key) is None
+    assert not os.path.exists(cache._get_path(key))
+
+
+def _load_cfg():
+    return utils.parse_cfg({'input_root': None, 'output_root': None, 'config_file': 'config.yml', 'proc_range': '0..3',
+                            'save_image': False, 'save_xml': False, 'dump': False, 'input_structure': 's', 'ruby_only': False})
+
+
+def test_config_hash_ignores_performance_settings():
+    cfg = _load_cfg()
+    config_hash = create_config_hash(cfg)
+
+    for section, key, value in [('line_ocr', 'batch_lines', 100), ('line_ocr', 'max_pages_in_flight', 16),
+                                ('line_ocr', 'max_batch_pixels', 1000), ('layout_extraction', 'batch_size', 8)]:
+        changed_cfg = copy.deepcopy(cfg)
+        changed_cfg[section][key] = value
+        assert create_config_hash(changed_cfg) == config_hash
+
+    changed_cfg = copy.deepcopy(cfg)
+    changed_cfg['proc_range']['end'] = 2
+    assert create_config_hash(changed_cfg) != config_hash
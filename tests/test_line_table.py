@@ -0,0 +1,78 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import math
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import pytest
+
+from cli.core.line_table import LineTableReader, LineTableWriter, is_parquet_available
+
+
+_PAGE_XML = ('<OCRDATASET>'
+             '<PAGE IMAGENAME="{0}">'
+             '<BLOCK TYPE="図版" X="0" Y="0" WIDTH="100" HEIGHT="200" CONF="0.900" STRING="" />'
+             '<TEXTBLOCK><LINE TYPE="本文" X="10" Y="20" WIDTH="30" HEIGHT="400" CONF="0.500" ORDER="2" '
+             'TITLE="TRUE" STRING="一行目" /></TEXTBLOCK>'
+             '<LINE TYPE="キャプション" X="1" Y="2" WIDTH="3" HEIGHT="4" STRING="caption" />'
+             '</PAGE>'
+             '</OCRDATASET>')
+
+
+def _write_table(output_dir, page_names, table_format='npy'):
+    writer = LineTableWriter(output_dir, table_format)
+    for page_name in page_names:
+        writer.write_page(ET.ElementTree(ET.fromstring(_PAGE_XML.format(page_name))))
+    writer.close()
+    return writer
+
+
+def test_round_trip(tmp_path):
+    writer = _write_table(str(tmp_path), ['R0000000.jpg', 'R0000001.jpg'])
+    assert writer.row_num == 6
+
+    with LineTableReader(writer.path) as reader:
+        assert len(reader) == 6
+        assert [str(reader.page_names[code]) for code in reader.column('page')] == ['R0000000.jpg'] * 3 + ['R0000001.jpg'] * 3
+        assert [str(reader.tag_names[code]) for code in reader.column('tag')[:3]] == ['BLOCK', 'LINE', 'LINE']
+        assert [str(reader.type_names[code]) for code in reader.column('type')[:3]] == ['図版', '本文', 'キャプション']
+        assert reader.column('x')[:3].tolist() == [0, 10, 1]
+        assert reader.column('height')[:3].tolist() == [200, 400, 4]
+        assert reader.column('order')[:3].tolist() == [-1, 2, -1]
+        assert reader.column('title')[:3].tolist() == [False, True, False]
+        conf = reader.column('conf')
+        assert conf[1] == pytest.approx(0.5)
+        assert math.isnan(conf[2])
+        assert [reader.get_string(row_idx) for row_idx in range(3)] == ['', '一行目', 'caption']
+        assert reader.get_string(4) == '一行目'
+
+
+def test_columns_are_memory_mapped(tmp_path):
+    writer = _write_table(str(tmp_path), ['R0000000.jpg'])
+
+    with LineTableReader(writer.path) as reader:
+        assert isinstance(reader.column('x'), np.memmap)
+    with LineTableReader(writer.path, mmap_mode=None) as reader:
+        assert not isinstance(reader.column('x'), np.memmap)
+        assert reader.column('x').tolist() == [0, 10, 1]
+
+
+def test_empty_table(tmp_path):
+    writer = _write_table(str(tmp_path), [])
+
+    with LineTableReader(writer.path) as reader:
+        assert len(reader) == 0
+
+
+@pytest.mark.skipif(not is_parquet_available(), reason='pandas with pyarrow or fastparquet is not available')
+def test_parquet(tmp_path):
+    import pandas as pd
+    writer = _write_table(str(tmp_path), ['R0000000.jpg'], table_format='parquet')
+
+    table = pd.read_parquet(writer.path)
+    assert table['page'].astype(str).tolist() == ['R0000000.jpg'] * 3
+    assert table['string'].tolist() == ['', '一行目', 'caption']
@@ -0,0 +1,117 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import concurrent.futures
+import os
+import threading
+
+from cli.core.manifest import PageManifest
+
+
+def _make_file(path, content=b'data'):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    return path
+
+
+def _done_future(result=True):
+    future = concurrent.futures.Future()
+    future.set_result(result)
+    return future
+
+
+def test_record_and_resume(tmp_path):
+    img_path = _make_file(str(tmp_path / 'img' / 'R0000001.jpg'))
+    output_dir = str(tmp_path / 'out')
+    txt_path = _make_file(os.path.join(output_dir, 'txt', 'R0000001_main.txt'))
+
+    manifest = PageManifest(output_dir)
+    manifest.record(img_path, [(txt_path, _done_future())], ['<PAGE IMAGENAME="R0000001.jpg" />'])
+    manifest.close()
+
+    completed_pages = PageManifest(output_dir).load_completed_pages([img_path], need_xml=True)
+    entry = completed_pages[os.path.abspath(img_path)]
+    assert entry['outputs'] == [os.path.join('txt', 'R0000001_main.txt')]
+    assert entry['xml'] == ['<PAGE IMAGENAME="R0000001.jpg" />']
+
+
+def test_resume_skips_invalid_entries(tmp_path):
+    output_dir = str(tmp_path / 'out')
+    img_changed = _make_file(str(tmp_path / 'img' / 'changed.jpg'))
+    img_no_output = _make_file(str(tmp_path / 'img' / 'no_output.jpg'))
+    img_no_xml = _make_file(str(tmp_path / 'img' / 'no_xml.jpg'))
+    txt_path = _make_file(os.path.join(output_dir, 'changed.txt'))
+
+    manifest = PageManifest(output_dir)
+    manifest.record(img_changed, [(txt_path, _done_future())], [])
+    manifest.record(img_no_output, [(os.path.join(output_dir, 'missing.txt'), _done_future())], [])
+    manifest.record(img_no_xml, [(txt_path, _done_future())])
+    manifest.close()
+    _make_file(img_changed, b'modified data')
+
+    completed_pages = PageManifest(output_dir).load_completed_pages([img_changed, img_no_output, img_no_xml],
+                                                                    need_xml=True)
+    assert completed_pages == {}
+    completed_pages = PageManifest(output_dir).load_completed_pages([img_no_xml], need_xml=False)
+    assert list(completed_pages.keys()) == [os.path.abspath(img_no_xml)]
+
+
+def test_failed_output_is_not_recorded(tmp_path):
+    img_path = _make_file(str(tmp_path / 'R0000001.jpg'))
+    output_dir = str(tmp_path / 'out')
+
+    manifest = PageManifest(output_dir)
+    manifest.record(img_path, [(os.path.join(output_dir, 'a.txt'), _done_future(False))])
+    manifest.close()
+
+    assert PageManifest(output_dir).load_entries() == {}
+
+
+def test_broken_line_is_ignored(tmp_path):
+    img_path = _make_file(str(tmp_path / 'R0000001.jpg'))
+    output_dir = str(tmp_path / 'out')
+    os.makedirs(output_dir)
+
+    manifest = PageManifest(output_dir)
+    manifest.record(img_path, [])
+    manifest.close()
+    with open(manifest.path, 'a', encoding='utf-8') as f:
+        f.write('{"img_path": "broken')
+
+    assert list(PageManifest(output_dir).load_entries().keys()) == [os.path.abspath(img_path)]
+
+
+def test_close_waits_for_pending_outputs(tmp_path):
+    img_path = _make_file(str(tmp_path / 'R0000001.jpg'))
+    output_dir = str(tmp_path / 'out')
+    os.makedirs(output_dir)
+    release = threading.Event()
+
+    manifest = PageManifest(output_dir)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(release.wait)
+        manifest.record(img_path, [(os.path.join(output_dir, 'a.txt'), future)])
+        closer = threading.Thread(target=manifest.close)
+        closer.start()
+        closer.join(0.1)
+        assert closer.is_alive()
+        release.set()
+        closer.join()
+
+    assert list(PageManifest(output_dir).load_entries().keys()) == [os.path.abspath(img_path)]
+
+
+def test_append_after_close_does_not_reopen(tmp_path):
+    img_path = _make_file(str(tmp_path / 'R0000001.jpg'))
+    output_dir = str(tmp_path / 'out')
+    os.makedirs(output_dir)
+
+    manifest = PageManifest(output_dir)
+    manifest.close()
+    manifest.record(img_path, [])
+
+    assert not os.path.exists(manifest.path)
@@ -0,0 +1,108 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from benchmarks import stub_procs
+from benchmarks.synthetic import create_input_root
+from cli.core import utils
+from cli.core.memory import MemoryMonitor, is_out_of_memory_error
+
+
+# page whose inference is made to exceed the memory limit
+_LARGE_PAGE = 'R0000002.jpg'
+
+
+class _LargeResultPageDeskew(stub_procs.StubPageDeskew):
+    def _run_process(self, input_data):
+        result = super()._run_process(input_data)
+        if os.path.basename(input_data['img_path']) == _LARGE_PAGE:
+            # 48 MB result
+            result = [result[0].replace(img=np.zeros((4000, 4000, 3), dtype=np.uint8))]
+        return result
+
+
+class _OutOfMemoryPageDeskew(stub_procs.StubPageDeskew):
+    def _run_process(self, input_data):
+        if os.path.basename(input_data['img_path']) == _LARGE_PAGE:
+            raise RuntimeError('CUDA out of memory. Tried to allocate 2.00 GiB')
+        return super()._run_process(input_data)
+
+
+def _run_inferrer(tmp_path, max_page_memory_mb, pipeline=False):
+    input_root = str(tmp_path / 'input')
+    create_input_root(input_root, 1, 3, 200, 300, spread_ratio=0)
+    cfg = utils.parse_cfg({
+        'input_root': input_root,
+        'output_root': str(tmp_path / 'output'),
+        'config_file': 'config.yml',
+        'proc_range': '0..1',
+        'save_image': True,
+        'save_xml': False,
+        'dump': False,
+        'input_structure': 'i',
+        'ruby_only': False
+    })
+    cfg['pipeline']['enable'] = pipeline
+    cfg['memory_monitor']['max_page_memory_mb'] = max_page_memory_mb
+    cfg['benchmark'] = {'latency_ms': {stage: 0.0 for stage in stub_procs.default_latency_ms.keys()}}
+    cfg['output_root'] = utils.mkdir_with_duplication_check(cfg['output_root'])
+    inferrer = stub_procs.StubOcrInferrer(cfg)
+    inferrer.run()
+    img_dir = os.path.join(cfg['output_root'], 'BOOK0000', 'img')
+    return sorted(os.listdir(img_dir)) if os.path.isdir(img_dir) else []
+
+
+@pytest.mark.parametrize('pipeline', [False, True])
+def test_page_over_limit_is_aborted(tmp_path, monkeypatch, capsys, pipeline):
+    monkeypatch.setattr(stub_procs, 'StubPageDeskew', _LargeResultPageDeskew)
+
+    saved_images = _run_inferrer(tmp_path, 10, pipeline)
+
+    assert 'Page inference is aborted by memory limit in 1_page_deskew' in capsys.readouterr().err
+    assert len(saved_images) == 2
+    assert not any(img_name.startswith(_LARGE_PAGE.split('.')[0]) for img_name in saved_images)
+
+
+def test_page_under_limit_is_not_aborted(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(stub_procs, 'StubPageDeskew', _LargeResultPageDeskew)
+
+    assert len(_run_inferrer(tmp_path, 100)) == 3
+    assert 'aborted by memory limit' not in capsys.readouterr().err
+
+
+def test_out_of_memory_error_aborts_page(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(stub_procs, 'StubPageDeskew', _OutOfMemoryPageDeskew)
+
+    saved_images = _run_inferrer(tmp_path, 10)
+
+    assert 'Page inference is aborted by memory limit in 1_page_deskew' in capsys.readouterr().err
+    assert len(saved_images) == 2
+
+
+def test_is_out_of_memory_error():
+    assert is_out_of_memory_error(MemoryError())
+    assert is_out_of_memory_error(RuntimeError('CUDA out of memory. Tried to allocate 20.00 MiB'))
+    assert is_out_of_memory_error(RuntimeError('[enforce fail at alloc_cpu.cpp:75] DefaultCPUAllocator: not enough memory: '
+                                               'you tried to allocate 1024 bytes. Buy new RAM! out of memory'))
+    assert is_out_of_memory_error(cv2.error('OpenCV(4.8.0) alloc.cpp:73: error: (-4:Insufficient memory) '
+                                            'Failed to allocate 1000000000000 bytes in function \'OutOfMemoryError\''))
+    assert not is_out_of_memory_error(RuntimeError('shape mismatch'))
+    assert not is_out_of_memory_error(cv2.error('OpenCV(4.8.0) error: (-215:Assertion failed) !_src.empty()'))
+    assert not is_out_of_memory_error(ValueError('out of memory'))
+
+
+def test_over_limit_is_judged_by_page_arrays():
+    monitor = MemoryMonitor(max_page_memory_mb=1)
+
+    assert monitor.add_result('proc', [{'img': np.zeros(2 * 1024 * 1024, dtype=np.uint8)}]) == 2 * 1024 * 1024
+    assert monitor.is_over_limit(2 * 1024 * 1024)
+    assert not monitor.is_over_limit(1024 * 1024)
+    assert not MemoryMonitor().is_over_limit(2 * 1024 * 1024)
@@ -0,0 +1,57 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import concurrent.futures
+import json
+import threading
+
+from cli.core.metrics import PageMetricsRecorder
+
+
+def _page_metrics(page_idx):
+    return {'page': 'R{0:07d}.jpg'.format(page_idx), 'stage_times': {'decode': 0.1, '3_line_ocr': 0.2 * page_idx},
+            'queue_wait': 0.0, 'written_bytes': 10}
+
+
+def _read_prometheus(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return dict(line.rsplit(' ', 1) for line in f.read().splitlines() if not line.startswith('#'))
+
+
+def test_flush_waits_for_pending_pages(tmp_path):
+    recorder = PageMetricsRecorder(str(tmp_path / 'metrics.jsonl'), str(tmp_path / 'metrics.prom'))
+    release = threading.Event()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+        for page_idx in range(3):
+            future = executor.submit(lambda: release.wait() and 5)
+            recorder.record(_page_metrics(page_idx), [(str(tmp_path / 'out.txt'), future)])
+        flusher = threading.Thread(target=recorder.flush)
+        flusher.start()
+        flusher.join(0.1)
+        assert flusher.is_alive()
+        release.set()
+        flusher.join()
+    recorder.write_prometheus()
+
+    prometheus = _read_prometheus(recorder.prometheus_path)
+    assert prometheus['ndlocr_pages_total'] == '3'
+    assert prometheus['ndlocr_written_bytes_total'] == '45'
+    assert prometheus['ndlocr_stage_duration_seconds_count{stage="3_line_ocr"}'] == '3'
+    recorder.close()
+
+
+def test_failed_output_is_counted(tmp_path):
+    recorder = PageMetricsRecorder(str(tmp_path / 'metrics.jsonl'), str(tmp_path / 'metrics.prom'))
+    future = concurrent.futures.Future()
+    future.set_result(False)
+
+    recorder.record(_page_metrics(0), [(str(tmp_path / 'out.txt'), future)])
+    recorder.close()
+
+    with open(recorder.path, 'r', encoding='utf-8') as f:
+        assert json.loads(f.readline())['output_ok'] is False
+    assert _read_prometheus(recorder.prometheus_path)['ndlocr_output_failed_pages_total'] == '1'
@@ -0,0 +1,71 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from cli.core import page_index
+from cli.core.page_index import PageXmlIndex
+
+
+_BOOK_XML = ("<?xml version='1.0' encoding='utf-8'?>\n"
+             '<OCRDATASET>'
+             '<PAGE IMAGENAME="R0000001.jpg"><LINE STRING="一行目" /><LINE STRING="二行目" /></PAGE>\n'
+             '<PAGE IMAGENAME="R0000002.jpg" />'
+             '<PAGE IMAGENAME="R0000003.jpg"><PAGE IMAGENAME="inner.jpg" /><LINE STRING="三" /></PAGE   >'
+             '</OCRDATASET>')
+
+
+def _write_xml(path, xml_str, encoding='utf-8'):
+    with open(path, 'wb') as f:
+        f.write(xml_str.encode(encoding))
+    return str(path)
+
+
+def test_pages_are_indexed_in_document_order(tmp_path):
+    index = PageXmlIndex(_write_xml(tmp_path / 'book.xml', _BOOK_XML))
+
+    assert len(index) == 3
+    assert [index.get_image_name(page_idx) for page_idx in range(len(index))] == \
+        ['R0000001.jpg', 'R0000002.jpg', 'R0000003.jpg']
+    expected_pages = list(ET.fromstring(_BOOK_XML.encode('utf-8')))
+    for page_idx, expected_page in enumerate(expected_pages):
+        # text after the end tag is not a part of the page
+        expected_page.tail = None
+        assert ET.tostring(index.get_page(page_idx)) == ET.tostring(expected_page)
+
+
+def test_find_page(tmp_path):
+    index = PageXmlIndex(_write_xml(tmp_path / 'book.xml', _BOOK_XML))
+
+    page = index.find_page('R0000001.jpg')
+    assert [line.attrib['STRING'] for line in page.iter('LINE')] == ['一行目', '二行目']
+    # nested PAGE elements are not indexed
+    assert index.find_page('inner.jpg') is None
+    assert index.find_page('missing.jpg') is None
+
+
+def test_pages_spanning_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(page_index, '_CHUNK_SIZE', 7)
+    index = PageXmlIndex(_write_xml(tmp_path / 'book.xml', _BOOK_XML))
+
+    assert len(index) == 3
+    assert index.find_page('R0000003.jpg').find('LINE').attrib['STRING'] == '三'
+
+
+def test_non_utf8_encoding(tmp_path):
+    xml_str = _BOOK_XML.replace("encoding='utf-8'", "encoding='ISO-8859-1'")
+    xml_str = xml_str.replace('一行目', 'première').replace('二行目', 'deuxième').replace('三', 'é')
+    index = PageXmlIndex(_write_xml(tmp_path / 'book.xml', xml_str, encoding='iso-8859-1'))
+
+    assert index.find_page('R0000001.jpg').find('LINE').attrib['STRING'] == 'première'
+    assert index.find_page('R0000003.jpg').find('LINE').attrib['STRING'] == 'é'
+
+
+def test_broken_xml(tmp_path):
+    with pytest.raises(ET.ParseError):
+        PageXmlIndex(_write_xml(tmp_path / 'book.xml', '<OCRDATASET><PAGE IMAGENAME="a.jpg">'))
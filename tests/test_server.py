@@ -0,0 +1,80 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import http.client
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+from benchmarks import stub_procs
+from benchmarks.synthetic import create_input_root
+from cli.core import server, utils
+
+
+@pytest.fixture
+def ocr_server(tmp_path, monkeypatch):
+    monkeypatch.setattr(server, 'OcrInferrer', stub_procs.StubOcrInferrer)
+    cfg = utils.parse_cfg({'input_root': None, 'output_root': None, 'config_file': 'config.yml', 'proc_range': '0..3',
+                           'save_image': False, 'save_xml': False, 'dump': False, 'input_structure': 's', 'ruby_only': False})
+    cfg['serve']['max_request_bytes'] = 1024 * 1024
+    cfg['serve']['book_root'] = str(tmp_path / 'books')
+    cfg['benchmark'] = {'latency_ms': {stage: 0.0 for stage in stub_procs.default_latency_ms.keys()},
+                        'line_num': 3, 'vertical': True}
+    create_input_root(str(tmp_path / 'books'), 1, 2, 200, 300, spread_ratio=0)
+    create_input_root(str(tmp_path / 'outside'), 1, 1, 200, 300, spread_ratio=0)
+    ocr_server = server.OcrServer(cfg, '127.0.0.1', 0)
+    thread = threading.Thread(target=ocr_server.serve_forever, daemon=True)
+    thread.start()
+    yield ocr_server
+    ocr_server._httpd.shutdown()
+    thread.join()
+
+
+def _request(ocr_server, path, body, headers=None):
+    connection = http.client.HTTPConnection('127.0.0.1', ocr_server._httpd.server_address[1])
+    connection.request('POST', path, body=body, headers=headers or {})
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def _request_raw(ocr_server, request_bytes):
+    with socket.create_connection(('127.0.0.1', ocr_server._httpd.server_address[1])) as sock:
+        sock.sendall(request_bytes)
+        response = sock.makefile('rb')
+        status = int(response.readline().split()[1])
+        return status
+
+
+def test_infer_book_in_book_root(ocr_server, tmp_path):
+    status, result = _request(ocr_server, '/infer/book', json.dumps({'input_dir': 'BOOK0000'}))
+    assert status == 200
+    assert [page['img_name'] for page in result['pages']] == ['R0000001.jpg', 'R0000002.jpg']
+    status, _ = _request(ocr_server, '/infer/book', json.dumps({'input_dir': str(tmp_path / 'books' / 'BOOK0000')}))
+    assert status == 200
+
+
+def test_infer_book_outside_book_root(ocr_server, tmp_path):
+    os.symlink(str(tmp_path / 'outside' / 'BOOK0000'), str(tmp_path / 'books' / 'link'))
+    for input_dir in [str(tmp_path / 'outside' / 'BOOK0000'), '../outside/BOOK0000', 'link']:
+        status, _ = _request(ocr_server, '/infer/book', json.dumps({'input_dir': input_dir}))
+        assert status == 403
+    status, _ = _request(ocr_server, '/infer/book', json.dumps({'input_dir': 1}))
+    assert status == 400
+
+
+def test_request_body_is_limited(ocr_server):
+    status = _request_raw(ocr_server, b'POST /infer/page?name=a.jpg HTTP/1.1\r\nHost: localhost\r\n'
+                                      b'Content-Length: 2000000\r\n\r\n')
+    assert status == 413
+    status = _request_raw(ocr_server, b'POST /infer/page?name=a.jpg HTTP/1.1\r\nHost: localhost\r\n'
+                                      b'Content-Length: abc\r\n\r\n')
+    assert status == 400
+    status = _request_raw(ocr_server, b'POST /infer/page?name=a.jpg HTTP/1.1\r\nHost: localhost\r\n'
+                                      b'Content-Length: -1\r\n\r\n')
+    assert status == 400
@@ -0,0 +1,83 @@
+# Copyright (c) 2023, National Diet Library, Japan
+#
+# This software is released under the CC BY 4.0.
+# https://creativecommons.org/licenses/by/4.0/
+
+
+import concurrent.futures
+import json
+import os
+import xml.etree.ElementTree as ET
+
+from cli.core import utils
+from cli.core.manifest import PageManifest
+from cli.core.merge import ShardResultMerger
+
+
+def test_parse_shard():
+    assert utils.parse_shard('2/3') == {'index': 2, 'count': 3}
+    assert utils.parse_shard('1/1') == {'index': 1, 'count': 1}
+    for shard_str in ['0/3', '4/3', '1/0', '1', 'a/b']:
+        assert utils.parse_shard(shard_str) is None
+
+
+def test_every_page_is_in_one_shard():
+    keys = ['R{0:07d}.jpg'.format(idx) for idx in range(200)]
+    shards = [utils.parse_shard('{0}/4'.format(index)) for index in range(1, 5)]
+
+    for key in keys:
+        assert sum(1 for shard in shards if utils.is_in_shard(key, shard)) == 1
+    # pages are spread over all shards
+    for shard in shards:
+        assert any(utils.is_in_shard(key, shard) for key in keys)
+    assert all(utils.is_in_shard(key, None) for key in keys)
+
+
+def test_shard_does_not_depend_on_process():
+    # md5('R0000000.jpg') % 3 == 0
+    assert utils.is_in_shard('R0000000.jpg', {'index': 1, 'count': 3})
+
+
+def _write_shard_output(shard_root, shard_str, book_name, img_dir, img_names, all_img_names):
+    output_dir = os.path.join(shard_root, book_name)
+    os.makedirs(os.path.join(output_dir, 'txt'))
+    with open(os.path.join(output_dir, 'shard.json'), 'w') as fp:
+        json.dump({'shard': shard_str, 'img_list': all_img_names, 'xml_name': book_name + '.sorted.xml',
+                   'line_table_format': None}, fp)
+    manifest = PageManifest(output_dir)
+    for img_name in img_names:
+        stem = img_name.split('.')[0]
+        txt_path = os.path.join(output_dir, 'txt', stem + '_main.txt')
+        with open(txt_path, 'w', encoding='utf-8') as f:
+            f.write(stem)
+        future = concurrent.futures.Future()
+        future.set_result(True)
+        manifest.record(os.path.join(img_dir, img_name), [(txt_path, future)],
+                        ['<PAGE IMAGENAME="{0}" />'.format(img_name)])
+    manifest.close()
+
+
+def test_merge_shard_outputs(tmp_path):
+    img_dir = str(tmp_path / 'img')
+    os.makedirs(img_dir)
+    img_names = ['R{0:07d}.jpg'.format(idx) for idx in range(6)]
+    for img_name in img_names:
+        with open(os.path.join(img_dir, img_name), 'wb') as f:
+            f.write(img_name.encode('ascii'))
+    shard_roots = [str(tmp_path / 'shard1'), str(tmp_path / 'shard2')]
+    for shard_str, shard_root in zip(['1/2', '2/2'], shard_roots):
+        # the last page is not processed in any shard
+        shard = utils.parse_shard(shard_str)
+        shard_img_names = [img_name for img_name in img_names[:-1] if utils.is_in_shard(img_name, shard)]
+        assert 0 < len(shard_img_names) < len(img_names) - 1
+        _write_shard_output(shard_root, shard_str, 'BOOK', img_dir, shard_img_names, img_names)
+
+    output_root = str(tmp_path / 'merged')
+    ShardResultMerger({'shard_roots': shard_roots, 'output_root': output_root}).run()
+
+    merged_xml = ET.parse(os.path.join(output_root, 'BOOK', 'xml', 'BOOK.sorted.xml'))
+    assert [page.attrib['IMAGENAME'] for page in merged_xml.getroot()] == img_names[:-1]
+    for img_name in img_names[:-1]:
+        stem = img_name.split('.')[0]
+        with open(os.path.join(output_root, 'BOOK', 'txt', stem + '_main.txt'), 'r', encoding='utf-8') as f:
+            assert f.read() == stem